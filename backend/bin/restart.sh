@@ -45,9 +45,15 @@ echo ""
 echo [$(date "+%Y-%m-%d %H:%M:%S")] "Start new celery worker"
 nohup celery -A modules.cel worker -l INFO -f $BASEDIR/$APIDIR/logs/celery-worker.log > /dev/null 2>&1 &
 echo ""
+echo [$(date "+%Y-%m-%d %H:%M:%S")] "Start new celery sms worker"
+nohup celery -A modules.cel worker -Q sms -n sms@%h -l INFO -f $BASEDIR/$APIDIR/logs/celery-sms-worker.log > /dev/null 2>&1 &
+echo ""
 echo [$(date "+%Y-%m-%d %H:%M:%S")] "Start new celery beat"
 nohup celery -A modules.cel beat -l INFO -f $BASEDIR/$APIDIR/logs/celery-beat.log > /dev/null 2>&1 &
 echo ""
+echo [$(date "+%Y-%m-%d %H:%M:%S")] "Start new pin dispatcher"
+nohup python $BASEDIR/$APIDIR/manage.py dispatch_pin_expiry > /dev/null 2>&1 &
+echo ""
 sleep 10
 
 # 检测进程开启结果
@@ -57,3 +63,6 @@ echo ""
 echo [$(date "+%Y-%m-%d %H:%M:%S")] "Check Celery"
 ps -ef |grep $APIDIR | grep celery
 echo ""
+echo [$(date "+%Y-%m-%d %H:%M:%S")] "Check Pin Dispatcher"
+ps -ef |grep $APIDIR | grep dispatch_pin_expiry
+echo ""
@@ -5,3 +5,15 @@ from django.utils.translation import gettext_lazy as _
 class DocAvailableChoices(models.TextChoices):
     PUBLIC = "public", _("公开")
     PRIVATE = "private", _("私有")
+
+
+class DocVersionFormatChoices(models.IntegerChoices):
+    FULL = 1, _("全量")
+    DELTA = 2, _("增量")
+
+
+class DocImportStatusChoices(models.TextChoices):
+    WAITING = "waiting", _("等待中")
+    RUNNING = "running", _("导入中")
+    SUCCESS = "success", _("已完成")
+    FAILED = "failed", _("失败")
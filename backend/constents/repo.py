@@ -12,3 +12,11 @@ class UserTypeChoices(models.TextChoices):
     ADMIN = "admin", _("管理员")
     MEMBER = "member", _("成员")
     VISITOR = "visitor", _("访客")
+
+
+class ExportJobStatusChoices(models.TextChoices):
+    QUEUED = "queued", _("排队中")
+    RUNNING = "running", _("导出中")
+    SUCCESS = "success", _("已完成")
+    FAILED = "failed", _("失败")
+    STALE = "stale", _("已中断")
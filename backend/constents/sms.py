@@ -0,0 +1,8 @@
+from django.db import models
+from django.utils.translation import gettext_lazy as _
+
+
+class SMSDeliveryStatusChoices(models.TextChoices):
+    PENDING = "pending", _("发送中")
+    SUCCESS = "success", _("已发送")
+    FAILED = "failed", _("发送失败")
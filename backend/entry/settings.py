@@ -124,6 +124,11 @@ CACHES = {
     }
 }
 
+# 配置快照
+CONF_SNAPSHOT_CHANNEL = "conf_snapshot_refresh"
+CONF_SNAPSHOT_TIMEOUT = 60 * 10
+CONF_SNAPSHOT_RETRY_INTERVAL = 5
+
 # Celery
 CELERY_TIMEZONE = "Asia/Shanghai"
 CELERY_ENABLE_UTC = False
@@ -133,6 +138,8 @@ CELERY_ACCEPT_CONTENT = [
     "pickle",
     "json",
 ]
+# 验证码发送使用独立队列，由单独的 worker 处理，不被耗时任务阻塞
+CELERY_TASK_ROUTES = {"modules.cel.tasks.send_verify_code": {"queue": "sms"}}
 BROKER_URL = f"redis://:{REDIS_PASSWORD}@{REDIS_HOST}:{REDIS_PORT}/{REDIS_DB}"
 
 # 用户认证
@@ -182,6 +189,10 @@ SESSION_CACHE_ALIAS = "default"
 SESSION_COOKIE_AGE = 60 * 60 * 24 * 7
 SESSION_COOKIE_DOMAIN = os.getenv("SESSION_COOKIE_DOMAIN")
 AUTH_TOKEN_NAME = os.getenv("AUTH_TOKEN_NAME", f"{APP_CODE}-auth-token")
+USER_SNAPSHOT_TIMEOUT = 60 * 60
+# AUTH TOKEN 模式 cache: Redis 随机TOKEN, signed: 本地校验的签名TOKEN
+AUTH_TOKEN_MODE = os.getenv("AUTH_TOKEN_MODE", "cache")
+AUTH_TOKEN_GENERATION_CACHE_TIMEOUT = 30
 
 # 日志
 LOG_LEVEL = "INFO"
@@ -202,6 +213,22 @@ REST_FRAMEWORK = {
     ],
 }
 
+# 文档版本
+DOC_VERSION_KEYFRAME_INTERVAL = 20
+# 编辑会话空闲时间(秒)与编辑距离(字符)，会话内的保存合并为一个版本
+DOC_VERSION_IDLE_WINDOW = 60 * 5
+DOC_VERSION_EDIT_DISTANCE = 2000
+# 版本对比缓存时间(秒)
+DOC_VERSION_DIFF_CACHE_TIMEOUT = 60 * 60 * 24 * 7
+# 版本保留策略：(版本距今天数上限, 保留粒度)，按顺序匹配，粒度为 None 时全部保留
+DOC_VERSION_RETENTION = [(7, None), (90, "day"), (None, "month")]
+DOC_VERSION_RETENTION_BATCH_SIZE = 500
+
+# 压缩文本字段，zstd 需要安装 zstandard
+TEXT_COMPRESSION_ALGORITHM = os.getenv("TEXT_COMPRESSION_ALGORITHM", "zlib")
+TEXT_COMPRESSION_LEVEL = 6
+TEXT_COMPRESSION_MIN_LENGTH = 128
+
 # tencent cloud
 TCLOUD_SECRET_ID = getenv_or_raise("TCLOUD_SECRET_ID")
 TCLOUD_SECRET_KEY = getenv_or_raise("TCLOUD_SECRET_KEY")
@@ -214,20 +241,104 @@ SMS_SECRET_KEY = TCLOUD_SECRET_KEY
 SMS_PHONE_CODE_TID = getenv_or_raise("SMS_PHONE_CODE_TID")
 SMS_PHONE_CODE_EX = 120
 SMS_PHONE_CODE_PERIOD = 60
+# 验证码异步发送：失败重试次数与间隔、发送状态保留时间
+SMS_PHONE_CODE_MAX_RETRIES = 3
+SMS_PHONE_CODE_RETRY_DELAY = 5
+SMS_DELIVERY_STATUS_TIMEOUT = 10 * 60
 SMS_REPO_EXPORT_FAIL_TID = getenv_or_raise("SMS_REPO_EXPORT_FAIL_TID")
 SMS_REPO_EXPORT_SUCCESS_TID = getenv_or_raise("SMS_REPO_EXPORT_SUCCESS_TID")
 SMS_REPO_APPLY_TID = getenv_or_raise("SMS_REPO_APPLY_TID")
 SMS_REPO_APPLY_RESULT_TID = getenv_or_raise("SMS_REPO_APPLY_RESULT_TID")
+# 短信网关，fake 不实际发送；每次请求的号码数上限
+SMS_GATEWAYS = {
+    "tencent": "modules.sms.client.TencentSMSGateway",
+    "fake": "modules.sms.client.FakeSMSGateway",
+}
+SMS_GATEWAY = os.getenv("SMS_GATEWAY", "tencent")
+SMS_BATCH_SIZE = 200
+
+# 存储后端
+STORAGE_BACKENDS = {
+    "cos": "modules.cos.client.COSClient",
+    "local": "modules.cos.local.LocalStorageClient",
+}
+STORAGE_BACKEND = os.getenv("STORAGE_BACKEND", "cos")
+# 本地存储：存储目录、访问地址、Nginx internal location 前缀(为空时由 uWSGI sendfile 发送)
+LOCAL_STORAGE_ROOT = os.getenv("LOCAL_STORAGE_ROOT", os.path.join(BASE_DIR, "storage"))
+LOCAL_STORAGE_URL = os.getenv("LOCAL_STORAGE_URL", f"//{ALLOWED_HOSTS[0]}/cos/files")
+LOCAL_STORAGE_ACCEL_PREFIX = os.getenv("LOCAL_STORAGE_ACCEL_PREFIX", "")
 
 # cos
 COS_SECRET_ID = TCLOUD_SECRET_ID
 COS_SECRET_KEY = TCLOUD_SECRET_KEY
-COS_REGION = getenv_or_raise("COS_REGION")
-COS_BUCKET = getenv_or_raise("COS_BUCKET")
+if STORAGE_BACKEND == "cos":
+    COS_REGION = getenv_or_raise("COS_REGION")
+    COS_BUCKET = getenv_or_raise("COS_BUCKET")
+    COS_DOMAIN = getenv_or_raise("COS_DOMAIN")
+else:
+    COS_REGION = os.getenv("COS_REGION")
+    COS_BUCKET = os.getenv("COS_BUCKET")
+    COS_DOMAIN = os.getenv("COS_DOMAIN")
 COS_RANDOM_PATH_LENGTH = 10
-COS_DOMAIN = getenv_or_raise("COS_DOMAIN")
 COS_MAX_FILE_SIZE = os.getenv("COS_MAX_FILE_SIZE", 120) * 1024 * 1024  # Bytes
 COS_MAX_AVATAR_SIZE = os.getenv("COS_MAX_AVATAR_SIZE", 1) * 1024 * 1024  # Bytes
+COS_MULTIPART_PART_SIZE = 8 * 1024 * 1024  # Bytes，分片上传的分片大小
+COS_MULTIPART_SPOOL_SIZE = 1024 * 1024  # Bytes，分片缓存超过该大小时写入临时文件
+# 超过该大小的文件以 COS_UPLOAD_THREADS 个线程并行分片上传，分片失败时重试 COS_MULTIPART_RETRIES 次
+COS_MULTIPART_THRESHOLD = 16 * 1024 * 1024  # Bytes
+COS_MULTIPART_RETRIES = 3
+COS_MULTIPART_RESUME_TIMEOUT = 60 * 60 * 24
+COS_MULTIPART_LOCK_TIMEOUT = 60 * 30  # 续传锁的有效期，进程异常退出时锁过期后才能续传
+COS_UPLOAD_THREADS = int(os.getenv("COS_UPLOAD_THREADS", 4))
+# 请求体超过该大小时边接收边上传，不写入本地临时文件，分片顺序上传且不支持续传；
+# 小于该大小的文件先由 Django 写入临时文件，再按 COS_MULTIPART_THRESHOLD 并行分片上传
+COS_STREAM_UPLOAD_THRESHOLD = int(
+    os.getenv("COS_STREAM_UPLOAD_THRESHOLD", 64 * 1024 * 1024)
+)  # Bytes
+COS_HASH_CHUNK_SIZE = 1024 * 1024  # Bytes，计算内容摘要时每次读取的大小
+# 直传：上传地址有效期、签发后完成上传的期限
+COS_PRESIGN_EXPIRE = 10 * 60
+COS_PRESIGN_COMPLETE_TIMEOUT = 60 * 60
+# 连接池：缓存的主机数、每个主机保持的连接数，应不小于并发上传的线程数
+COS_POOL_CONNECTIONS = 10
+COS_POOL_MAXSIZE = int(os.getenv("COS_POOL_MAXSIZE", 10))
+
+# 头像缩略图：边长(像素)、格式、编码质量、补生成任务的去重时间、失败重试次数
+AVATAR_THUMB_SIZES = (48, 96)
+AVATAR_THUMB_FORMATS = ("webp", "jpeg")
+AVATAR_THUMB_QUALITY = 85
+AVATAR_THUMB_PENDING_TIMEOUT = 10 * 60
+AVATAR_THUMB_MAX_RETRIES = 3
+
+# 导出
+EXPORT_CHUNK_SIZE = 200
+# 增量导出：增量包数量超过上限或变更文章占比超过比例时重新全量导出
+EXPORT_MAX_DELTA_ARCHIVES = 10
+EXPORT_FULL_RATIO = 0.5
+# 导出清单保留时间，过期后重新全量导出
+EXPORT_MANIFEST_TIMEOUT = 60 * 60 * 24 * 30
+# 导出任务：排队与执行时锁的有效期、心跳间隔、进度写入间隔、任务信息保留时间
+EXPORT_JOB_QUEUE_TIMEOUT = 10 * 60
+EXPORT_JOB_LOCK_TIMEOUT = 60
+EXPORT_JOB_HEARTBEAT_INTERVAL = 15
+EXPORT_JOB_PROGRESS_INTERVAL = 1
+EXPORT_JOB_TIMEOUT = 60 * 60 * 24
+# 全站导出：压缩进程数、上传线程数、检查点保留时间、重试次数、失败重试间隔(秒)、
+# 执行中标记的有效期(每次执行时刷新，任务结束时删除)
+EXPORT_SITE_PROCESSES = int(os.getenv("EXPORT_SITE_PROCESSES", os.cpu_count() or 1))
+EXPORT_SITE_UPLOAD_THREADS = int(os.getenv("EXPORT_SITE_UPLOAD_THREADS", 4))
+EXPORT_SITE_CHECKPOINT_TIMEOUT = 60 * 60 * 24 * 7
+EXPORT_SITE_MAX_RETRIES = 10
+EXPORT_SITE_RETRY_DELAY = 60
+EXPORT_SITE_LOCK_TIMEOUT = 60 * 60
+
+# 置顶到期调度：检查间隔(秒)、每次取出的数量
+PIN_DISPATCH_INTERVAL = 1
+PIN_DISPATCH_BATCH_SIZE = 100
+
+# 导入
+IMPORT_BATCH_SIZE = 200
+IMPORT_MAX_DOC_SIZE = 10 * 1024 * 1024  # Bytes，超过该大小的文件不导入
 
 # Admin Site
 SIMPLEUI_INDEX = getenv_or_raise("FRONTEND_URL")
@@ -256,6 +367,8 @@ SIMPLEUI_ICON = {
     "Collaborator": "far fa-user",
     "文档": "far fa-file-alt",
     "Doc": "far fa-file-alt",
+    "文章内容": "far fa-file-alt",
+    "文章导入": "fas fa-file-import",
     "文档版本": "far fa-file",
     "Doc Version": "far fa-file",
     "置顶文章": "fas fa-book-open",
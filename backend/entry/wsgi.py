@@ -14,3 +14,25 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "entry.settings")
 
 application = get_wsgi_application()
+
+
+def warm_up():
+    """uWSGI worker 启动时预加载配置快照"""
+    import logging
+
+    from modules.conf.models import conf_snapshot
+
+    try:
+        conf_snapshot.get_data()
+    except Exception as err:
+        logging.getLogger("error").error("[warm up] load conf failed %s", err)
+
+
+try:
+    from uwsgidecorators import postfork
+except ImportError:
+    # 非 uWSGI 进程(runserver、管理命令、Celery 等)导入本模块时不预加载，
+    # 首次读取配置时再加载快照并启动订阅线程
+    pass
+else:
+    postfork(warm_up)
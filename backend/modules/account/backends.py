@@ -29,8 +29,4 @@ class ModelBackend(object):
     def get_user(self, uid: str):
         """获取用户对象"""
 
-        try:
-            user = USER_MODEL.objects.get(pk=uid, is_deleted=False)
-            return user
-        except USER_MODEL.DoesNotExist:
-            return None
+        return USER_MODEL.get_snapshot(uid)
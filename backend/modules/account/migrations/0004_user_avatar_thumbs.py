@@ -0,0 +1,18 @@
+# Generated by Django 4.0.1 on 2026-10-19 13:18
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("account", "0003_alter_user_phone"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="user",
+            name="avatar_thumbs",
+            field=models.JSONField(blank=True, default=dict, verbose_name="头像缩略图"),
+        ),
+    ]
@@ -1,14 +1,22 @@
+import logging
+
 from django.conf import settings
 from django.contrib.auth.base_user import AbstractBaseUser
 from django.contrib.auth.models import PermissionsMixin, AnonymousUser
 from django.core.cache import cache
-from django.db import models
+from django.db import models, transaction
 from django.utils.translation import gettext_lazy as _
 
-from constents import SHORT_CHAR_LENGTH, PHONE_NUMBER_CHAR_LENGTH, VERIFY_CODE_LENGTH
-from utils.client import get_client_by_user
-from utils.exceptions import PhoneNumberExist, OperationError
-from utils.tools import simple_uniq_id, num_code
+from constents import (
+    SHORT_CHAR_LENGTH,
+    PHONE_NUMBER_CHAR_LENGTH,
+    VERIFY_CODE_LENGTH,
+    SMSDeliveryStatusChoices,
+)
+from utils.exceptions import PhoneNumberExist, OperationError, SMSSendFailed
+from utils.tools import simple_uniq_id, num_code, uniq_id
+
+logger = logging.getLogger("sms")
 
 DB_PREFIX = "auth_"
 
@@ -44,6 +52,7 @@ class User(AbstractBaseUser, PermissionsMixin):
     is_active = models.BooleanField(_("激活状态"), default=True)
     date_joined = models.DateTimeField(_("注册时间"), auto_now_add=True)
     avatar = models.URLField(_("头像"), null=True, blank=True)
+    avatar_thumbs = models.JSONField(_("头像缩略图"), default=dict, blank=True)
     phone = models.CharField(
         _("联系电话"), max_length=PHONE_NUMBER_CHAR_LENGTH, db_index=True
     )
@@ -61,6 +70,79 @@ class User(AbstractBaseUser, PermissionsMixin):
     def __str__(self):
         return self.username
 
+    def save(self, *args, **kwargs):
+        super().save(*args, **kwargs)
+        transaction.on_commit(lambda: self.clear_snapshot(self.uid))
+
+    @staticmethod
+    def snapshot_key(uid: str):
+        """用户快照缓存键"""
+        return f"UserSnapshot:{uid}"
+
+    @staticmethod
+    def snapshot_version_key(uid: str):
+        """用户快照版本缓存键，用户变更时更换版本"""
+        return f"UserSnapshot:version:{uid}"
+
+    @staticmethod
+    def snapshot_keys(uid: str):
+        """读取用户快照需要的缓存键"""
+        return [User.snapshot_key(uid), User.snapshot_version_key(uid)]
+
+    @staticmethod
+    def load_snapshot(uid: str, cache_data: dict):
+        """
+        由缓存数据取出用户快照，快照以 (版本, 用户) 存储，与当前版本不一致时视为未命中
+        避免变更前读取的用户在清除快照后才写入缓存
+        """
+        snapshot = cache_data.get(User.snapshot_key(uid))
+        version = cache_data.get(User.snapshot_version_key(uid))
+        if not isinstance(snapshot, tuple) or version is None or snapshot[0] != version:
+            return None
+        return snapshot[1]
+
+    @staticmethod
+    def get_snapshot(uid: str):
+        """获取用户快照，未命中时先读取版本再查库，快照与读取的版本一起写入缓存"""
+        cache_data = cache.get_many(User.snapshot_keys(uid))
+        user = User.load_snapshot(uid, cache_data)
+        if user is not None:
+            return user
+        version_key = User.snapshot_version_key(uid)
+        version = cache_data.get(version_key)
+        if version is None:
+            cache.add(version_key, uniq_id(), settings.USER_SNAPSHOT_TIMEOUT)
+            version = cache.get(version_key)
+        try:
+            user = User.objects.get(pk=uid, is_deleted=False)
+        except User.DoesNotExist:
+            return None
+        cache.set(
+            User.snapshot_key(uid), (version, user), settings.USER_SNAPSHOT_TIMEOUT
+        )
+        return user
+
+    @staticmethod
+    def clear_snapshot(*uids: str):
+        """清除用户快照，更换版本使已读取的旧快照写入后也不会命中"""
+        cache.set_many(
+            {User.snapshot_version_key(uid): uniq_id() for uid in uids},
+            settings.USER_SNAPSHOT_TIMEOUT,
+        )
+
+    @staticmethod
+    def thumbs_pending_key(uid: str):
+        """头像缩略图生成任务去重键"""
+        return f"AvatarThumbs:pending:{uid}"
+
+    def get_avatar_thumbs(self):
+        """当前头像的缩略图，未生成或已过期时返回 None"""
+        if not self.avatar:
+            return {}
+        if (self.avatar_thumbs or {}).get("source") != self.avatar:
+            return None
+        return self.avatar_thumbs.get("sizes", {})
+
     @staticmethod
     def init_uid():
         """初始化用户UID"""
@@ -73,22 +155,59 @@ class User(AbstractBaseUser, PermissionsMixin):
 
     @staticmethod
     def do_send_code(phone: str):
-        """发送验证码"""
+        """
+        发送验证码
+        验证码在请求内生成并写入缓存，短信由异步任务发送，返回发送记录 ID
+        任务投递失败时作废验证码，避免在发送间隔内无法重新发送
+        """
+        from modules.cel.tasks import send_verify_code
+
         # 初始化键值
         code_key = f"phone_verify_code:{phone}"
         send_key = f"phone_verify_code_send:{phone}"
-        # 判断是否刚发送
-        is_send = cache.get(send_key)
-        if is_send is not None:
-            return False
-        # 生成新的验证码
+        # 生成新的验证码，刚发送过时不再发送
         code = num_code(VERIFY_CODE_LENGTH)
-        client = get_client_by_user(settings.ADMIN_USERNAME)
-        result = client.sms.send_sms(phone, settings.SMS_PHONE_CODE_TID, [code])
-        if result:
-            cache.set(send_key, code, timeout=settings.SMS_PHONE_CODE_PERIOD)
-            cache.set(code_key, code, timeout=settings.SMS_PHONE_CODE_EX)
-        return result
+        if not cache.add(send_key, code, timeout=settings.SMS_PHONE_CODE_PERIOD):
+            return None
+        cache.set(code_key, code, timeout=settings.SMS_PHONE_CODE_EX)
+        delivery_id = uniq_id()
+        User.set_delivery_status(delivery_id, SMSDeliveryStatusChoices.PENDING)
+        try:
+            send_verify_code.delay(delivery_id, phone, code)
+        except Exception as err:
+            logger.error("[do_send_code] %s enqueue failed %s", delivery_id, err)
+            User.set_delivery_status(delivery_id, SMSDeliveryStatusChoices.FAILED)
+            User.revoke_code(phone, code)
+            raise SMSSendFailed()
+        return delivery_id
+
+    @staticmethod
+    def revoke_code(phone: str, code: str):
+        """验证码发送失败时作废，允许立即重新发送"""
+        code_key = f"phone_verify_code:{phone}"
+        send_key = f"phone_verify_code_send:{phone}"
+        if cache.get(send_key) == code:
+            cache.delete(send_key)
+        if cache.get(code_key) == code:
+            cache.delete(code_key)
+
+    @staticmethod
+    def delivery_key(delivery_id: str):
+        """验证码发送状态缓存键"""
+        return f"SMSDelivery:{delivery_id}"
+
+    @staticmethod
+    def set_delivery_status(delivery_id: str, status: str):
+        cache.set(
+            User.delivery_key(delivery_id),
+            status,
+            timeout=settings.SMS_DELIVERY_STATUS_TIMEOUT,
+        )
+
+    @staticmethod
+    def get_delivery_status(delivery_id: str):
+        """验证码发送状态，不存在或已过期时返回 None"""
+        return cache.get(User.delivery_key(delivery_id))
 
     @staticmethod
     def send_code(phone: str):
@@ -129,4 +248,8 @@ class CustomAnonymousUser(AnonymousUser):
     uid = ""
     username = ""
     avatar = None
+    avatar_thumbs = {}
     active_index = 0
+
+    def get_avatar_thumbs(self):
+        return {}
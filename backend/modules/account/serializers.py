@@ -1,4 +1,6 @@
+from django.conf import settings
 from django.contrib.auth import get_user_model
+from django.core.cache import cache
 from django.utils.translation import gettext_lazy as _
 from rest_framework import serializers
 
@@ -8,6 +10,7 @@ from constents import (
     MEDIUM_CHAR_LENGTH,
     VERIFY_CODE_LENGTH,
 )
+from modules.cel.tasks import generate_avatar_thumbs
 
 USER_MODEL = get_user_model()
 
@@ -40,9 +43,31 @@ class LoginFormSerializer(serializers.Serializer):
 class UserInfoSerializer(serializers.ModelSerializer):
     """用户信息"""
 
+    avatar_thumbs = serializers.SerializerMethodField()
+
     class Meta:
         model = USER_MODEL
-        fields = ["username", "uid", "date_joined", "avatar", "active_index"]
+        fields = [
+            "username",
+            "uid",
+            "date_joined",
+            "avatar",
+            "avatar_thumbs",
+            "active_index",
+        ]
+
+    def get_avatar_thumbs(self, instance):
+        """头像缩略图，未生成时提交生成任务并返回空字典，客户端使用原图"""
+        thumbs = instance.get_avatar_thumbs()
+        if thumbs is None:
+            if cache.add(
+                USER_MODEL.thumbs_pending_key(instance.uid),
+                True,
+                settings.AVATAR_THUMB_PENDING_TIMEOUT,
+            ):
+                generate_avatar_thumbs.delay(instance.uid)
+            return {}
+        return thumbs
 
 
 class RegisterSerializer(serializers.ModelSerializer):
@@ -32,7 +32,7 @@ from utils.exceptions import (
     OperationError,
 )
 from utils.throttlers import LoginThrottle
-from utils.tools import get_auth_token
+from utils.tokens import get_auth_token, get_auth_token_handler
 from utils.viewsets import ThrottleAPIView
 
 USER_MODEL = get_user_model()
@@ -113,10 +113,13 @@ class LogoutView(APIView):
     def get(self, request, *args, **kwargs):
         """用户登出"""
         db_logger.view_log(request, self, USER_MODEL, True, None)
+        is_authenticated = request.user.is_authenticated
+        uid = request.user.uid
         auth.logout(request)
         auth_token = request.COOKIES.get(settings.AUTH_TOKEN_NAME, None)
-        if auth_token is not None:
-            cache.delete(auth_token)
+        # 未登录时 TOKEN 无效或已注销，uid 为空，不能按 uid 注销
+        if is_authenticated and auth_token is not None:
+            get_auth_token_handler().revoke(auth_token, uid)
         response = Response()
         response.delete_cookie(
             settings.AUTH_TOKEN_NAME, domain=settings.SESSION_COOKIE_DOMAIN
@@ -266,6 +269,7 @@ class UserInfoView(GenericViewSet):
             user.save()
         except USER_MODEL.DoesNotExist:
             raise UserNotExist()
+        get_auth_token_handler().revoke_user(user.uid)
         db_logger.view_log(request, self, USER_MODEL, True, user)
         return Response()
 
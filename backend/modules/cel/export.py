@@ -0,0 +1,339 @@
+"""
+仓库导出
+1. 文章按 EXPORT_CHUNK_SIZE 分批读取，逐篇写入 zip，
+   zip 直接写入分片上传流，内存与磁盘占用不随仓库大小增长
+2. 每次导出在 Redis 保存清单，记录每篇文章的文件名、内容摘要与更新时间，
+   清单包含文章标题与导出包地址，不写入公开访问的存储桶；再次导出时仅读取变更的文章，生成只包含变更的增量包；没有变更时直接复用上次的导出
+3. 清单记录全量包与其后的增量包，依次解压即可得到完整仓库
+4. 全站导出由进程池压缩、线程池上传，进度记录于 Redis，中断后可继续；
+   Celery prefork worker 的子进程为守护进程，不能使用标准库的进程池，进程池使用 billiard
+"""
+
+import datetime
+import json
+import logging
+import os
+import shutil
+import tempfile
+import zipfile
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+
+from billiard.pool import Pool
+from django.conf import settings
+from django.db import connections
+
+from constents import DocAvailableChoices
+from modules.doc.models import Doc, DocContent, DocVersion
+from modules.repo.models import Repo
+from utils.client import UnionClient, get_client_by_user
+from utils.tools import get_redis_client
+
+logger = logging.getLogger("celery")
+
+MANIFEST_FILENAME = "manifest.json"
+SITE_RESULT_KEY = "ExportSite:result"
+SITE_RUNNING_KEY = "ExportAllRepos:running"
+
+
+def get_export_docs(repo_id: int):
+    """仓库中可导出的文章"""
+    return Doc.objects.filter(
+        repo_id=repo_id,
+        is_deleted=False,
+        is_publish=True,
+        available=DocAvailableChoices.PUBLIC,
+    ).order_by("id")
+
+
+def iter_docs(queryset, chunk_size: int = None):
+    """分批遍历文章并批量加载内容"""
+    chunk_size = chunk_size or settings.EXPORT_CHUNK_SIZE
+    chunk = []
+    for doc in queryset.iterator(chunk_size=chunk_size):
+        chunk.append(doc)
+        if len(chunk) >= chunk_size:
+            yield from DocContent.objects.attach(chunk)
+            chunk = []
+    if chunk:
+        yield from DocContent.objects.attach(chunk)
+
+
+def iter_docs_by_ids(queryset, doc_ids: list, chunk_size: int = None):
+    """按 id 分批读取文章与内容"""
+    chunk_size = chunk_size or settings.EXPORT_CHUNK_SIZE
+    for i in range(0, len(doc_ids), chunk_size):
+        yield from DocContent.objects.attach(
+            queryset.filter(id__in=doc_ids[i : i + chunk_size])
+        )
+
+
+def doc_filename(doc_id: int, title: str):
+    return "[{}]{}.md".format(doc_id, title.replace(" ", "").replace("/", ""))
+
+
+class ExportManifest(object):
+    """
+    仓库导出清单，以 Redis 字符串存储 JSON
+    清单过期或丢失时，下次导出为全量导出
+    """
+
+    def __init__(self, repo_id: int):
+        self.key = f"ExportRepo:manifest:{repo_id}"
+        self.redis = get_redis_client()
+
+    def load(self):
+        data = self.redis.get(self.key)
+        return json.loads(data) if data else None
+
+    def save(self, manifest: dict):
+        self.redis.set(
+            self.key,
+            json.dumps(manifest, ensure_ascii=False),
+            ex=settings.EXPORT_MANIFEST_TIMEOUT,
+        )
+
+
+def export_repo(client: UnionClient, repo, progress=None):
+    """
+    导出仓库文章并上传，返回 上传结果 与 导出包列表
+    导出包列表为全量包与其后的增量包，依次解压即可得到完整仓库
+    progress 接收 阶段、已写入文章数、已写入字节数，用于汇报进度
+    """
+    progress = progress or (lambda phase, docs, size: None)
+    progress("scan", 0, 0)
+    store = ExportManifest(repo.id)
+    previous = store.load()
+    previous_docs = previous["docs"] if previous else {}
+    # 仅读取元数据判断变更
+    docs = {}
+    changed_ids = []
+    for doc_id, title, update_at in (
+        get_export_docs(repo.id)
+        .values_list("id", "title", "update_at")
+        .iterator(chunk_size=settings.EXPORT_CHUNK_SIZE)
+    ):
+        entry = previous_docs.get(str(doc_id))
+        filename = doc_filename(doc_id, title)
+        if (
+            entry is not None
+            and entry["update_at"] == str(update_at)
+            and entry["filename"] == filename
+        ):
+            docs[str(doc_id)] = entry
+        else:
+            changed_ids.append(doc_id)
+    changed = {str(doc_id) for doc_id in changed_ids}
+    deleted = [
+        entry["filename"]
+        for doc_id, entry in previous_docs.items()
+        if doc_id not in docs and doc_id not in changed
+    ]
+    # 没有变更，复用上次导出
+    if previous and not changed_ids and not deleted:
+        return True, previous["archives"]
+    full = (
+        previous is None
+        or len(previous["archives"]) > settings.EXPORT_MAX_DELTA_ARCHIVES
+        or len(changed_ids)
+        > (len(docs) + len(changed_ids)) * settings.EXPORT_FULL_RATIO
+    )
+    if full:
+        filename = f"{repo.name}.zip"
+        archives = []
+        entries = iter_docs(get_export_docs(repo.id))
+        deleted = []
+        docs = {}
+    else:
+        filename = f"{repo.name}-delta.zip"
+        archives = previous["archives"]
+        entries = iter_docs_by_ids(get_export_docs(repo.id), changed_ids)
+    # 写入变更的文章
+    with client.cos.open_writer(filename) as writer:
+        with zipfile.ZipFile(writer, "w", zipfile.ZIP_DEFLATED) as zip_file:
+            for count, doc in enumerate(entries, 1):
+                content = doc.content or ""
+                entry = {
+                    "filename": doc_filename(doc.id, doc.title),
+                    "hash": DocVersion.objects.make_hash(doc.title, content),
+                    "update_at": str(doc.update_at),
+                }
+                previous_entry = previous_docs.get(str(doc.id))
+                if full or previous_entry is None:
+                    zip_file.writestr(entry["filename"], content)
+                elif previous_entry["filename"] != entry["filename"]:
+                    # 标题变更，删除旧文件
+                    deleted.append(previous_entry["filename"])
+                    zip_file.writestr(entry["filename"], content)
+                elif previous_entry["hash"] != entry["hash"]:
+                    zip_file.writestr(entry["filename"], content)
+                docs[str(doc.id)] = entry
+                progress("write", count, writer.size)
+            manifest = {
+                "repo_id": repo.id,
+                "full": full,
+                "deleted": deleted,
+                "docs": docs,
+            }
+            zip_file.writestr(
+                MANIFEST_FILENAME, json.dumps(manifest, ensure_ascii=False, indent=2)
+            )
+        progress("upload", len(docs), writer.size)
+    if not writer.result:
+        return False, None
+    archives.append(
+        {
+            "url": writer.url,
+            "full": full,
+            "create_at": str(datetime.datetime.now()),
+        }
+    )
+    manifest["archives"] = archives
+    store.save(manifest)
+    return True, archives
+
+
+class ExportCheckpoint(object):
+    """
+    全站导出进度，以 Redis 哈希存储，字段为库 id，值为该库的导出结果
+    导出失败的库记录 failed，重新执行时再次导出
+    """
+
+    def __init__(self, job_id: str):
+        self.key = f"ExportSite:checkpoint:{job_id}"
+        self.redis = get_redis_client()
+
+    def load(self):
+        return {
+            int(repo_id): json.loads(data)
+            for repo_id, data in self.redis.hgetall(self.key).items()
+        }
+
+    def save(self, repo_id: int, data: dict):
+        pipeline = self.redis.pipeline()
+        pipeline.hset(self.key, repo_id, json.dumps(data, ensure_ascii=False))
+        pipeline.expire(self.key, settings.EXPORT_SITE_CHECKPOINT_TIMEOUT)
+        pipeline.execute()
+
+    def clear(self):
+        self.redis.delete(self.key)
+
+
+def build_archive(repo_id: int, path: str):
+    """在子进程中压缩仓库文章至本地文件"""
+    count = 0
+    try:
+        with zipfile.ZipFile(path, "w", zipfile.ZIP_DEFLATED) as zip_file:
+            for doc in iter_docs(get_export_docs(repo_id)):
+                zip_file.writestr(doc_filename(doc.id, doc.title), doc.content or "")
+                count += 1
+    finally:
+        connections.close_all()
+    return count
+
+
+def submit_process(pool: Pool, func, *args):
+    """提交至进程池，以 Future 返回结果，便于与线程池的任务一起等待"""
+    future = Future()
+    pool.apply_async(
+        func, args, callback=future.set_result, error_callback=future.set_exception
+    )
+    return future
+
+
+def upload_archive(uid: str, filename: str, path: str):
+    """在线程中上传压缩文件"""
+    try:
+        with get_client_by_user(uid).cos.open_writer(filename) as writer:
+            with open(path, "rb") as file:
+                shutil.copyfileobj(file, writer, settings.COS_MULTIPART_PART_SIZE)
+        if not writer.result:
+            raise Exception("Upload Error")
+        return writer.url
+    finally:
+        connections.close_all()
+
+
+def export_site(uid: str, job_id: str):
+    """
+    导出全部仓库
+    1. 仓库分配至进程池压缩，压缩完成的文件交由线程池上传
+    2. 同时处理的仓库数不超过 进程数 + 线程数，限制临时文件的磁盘占用
+    3. 每个仓库完成或失败后写入检查点，任务重新执行时跳过已完成的仓库，重试失败的仓库
+    4. 全部成功后清除检查点
+    5. 导出结果包含各库导出包地址，保存于 Redis，不写入公开访问的存储桶
+    返回 导出结果 与 失败的仓库
+    """
+    checkpoint = ExportCheckpoint(job_id)
+    results = {
+        repo_id: data
+        for repo_id, data in checkpoint.load().items()
+        if not data.get("failed")
+    }
+    repos = list(
+        Repo.objects.filter(is_deleted=False)
+        .exclude(id__in=results.keys())
+        .order_by("id")
+        .values_list("id", "name")
+    )
+    failed = []
+    limit = settings.EXPORT_SITE_PROCESSES + settings.EXPORT_SITE_UPLOAD_THREADS
+    work_dir = tempfile.mkdtemp(prefix="export-")
+    # 子进程以 fork 方式创建，不能复用父进程的数据库连接
+    connections.close_all()
+    process_pool = Pool(processes=settings.EXPORT_SITE_PROCESSES)
+    upload_pool = ThreadPoolExecutor(max_workers=settings.EXPORT_SITE_UPLOAD_THREADS)
+    futures = {}
+    try:
+        while repos or futures:
+            while repos and len(futures) < limit:
+                repo_id, name = repos.pop(0)
+                path = os.path.join(work_dir, f"{repo_id}.zip")
+                future = submit_process(process_pool, build_archive, repo_id, path)
+                futures[future] = ("compress", repo_id, name, path)
+            done, _ = wait(futures, return_when=FIRST_COMPLETED)
+            for future in done:
+                stage, repo_id, name, path = futures.pop(future)
+                try:
+                    result = future.result()
+                except Exception as err:
+                    logger.error("库 %s 导出失败 %s", name, err)
+                    failed.append(name)
+                    checkpoint.save(repo_id, {"name": name, "failed": True})
+                    if os.path.exists(path):
+                        os.remove(path)
+                    continue
+                if stage == "compress":
+                    upload = upload_pool.submit(
+                        upload_archive, uid, f"{name}.zip", path
+                    )
+                    futures[upload] = ("upload", repo_id, name, path)
+                    continue
+                os.remove(path)
+                results[repo_id] = {"name": name, "url": result}
+                checkpoint.save(repo_id, results[repo_id])
+                logger.info("库 %s 导出上传成功 (%s)", name, result)
+    finally:
+        # 超时中断时不等待执行中的任务，未完成的仓库在重新执行时处理
+        if futures:
+            process_pool.terminate()
+        else:
+            process_pool.close()
+        process_pool.join()
+        upload_pool.shutdown(wait=not futures, cancel_futures=True)
+        shutil.rmtree(work_dir, ignore_errors=True)
+    get_redis_client().set(
+        SITE_RESULT_KEY,
+        json.dumps(
+            {
+                "job_id": job_id,
+                "repos": results,
+                "failed": failed,
+                "create_at": str(datetime.datetime.now()),
+            },
+            ensure_ascii=False,
+        ),
+        ex=settings.EXPORT_SITE_CHECKPOINT_TIMEOUT,
+    )
+    if not failed:
+        checkpoint.clear()
+    return results, failed
@@ -0,0 +1,200 @@
+"""
+导出任务登记
+
+任务信息以 Redis 哈希存储，记录阶段、已写入文章数、已写入字节数，
+完成后记录最新导出包的地址 url 与需要依次解压的导出包列表 archives
+同一用户同一仓库同时只允许一个导出，锁的值为任务 id
+1. 排队时锁的有效期为 EXPORT_JOB_QUEUE_TIMEOUT
+2. 执行时由心跳线程每 EXPORT_JOB_HEARTBEAT_INTERVAL 秒续期至 EXPORT_JOB_LOCK_TIMEOUT
+3. worker 异常退出后锁自然过期，查询任务时发现锁已不属于该任务即标记为中断
+"""
+
+import datetime
+import json
+import threading
+import time
+from contextlib import contextmanager
+
+from django.conf import settings
+from redis import WatchError
+
+from constents import ExportJobStatusChoices
+from utils.tools import get_redis_client, uniq_id
+
+ACTIVE_STATUS = [ExportJobStatusChoices.QUEUED, ExportJobStatusChoices.RUNNING]
+INT_FIELDS = ["repo_id", "docs", "bytes"]
+JSON_FIELDS = ["archives"]
+
+
+class ExportJob(object):
+    """导出任务"""
+
+    def __init__(self, job_id: str, data: dict):
+        self.id = job_id
+        self.data = data
+        self.redis = get_redis_client()
+        self.reported_at = 0
+
+    @staticmethod
+    def job_key(job_id: str):
+        return f"ExportJob:job:{job_id}"
+
+    @staticmethod
+    def lock_key(repo_id: int, uid: str):
+        return f"ExportJob:lock:{repo_id}:{uid}"
+
+    @staticmethod
+    def latest_key(repo_id: int, uid: str):
+        return f"ExportJob:latest:{repo_id}:{uid}"
+
+    @staticmethod
+    def encode(fields: dict):
+        return {
+            key: json.dumps(val, ensure_ascii=False) if key in JSON_FIELDS else val
+            for key, val in fields.items()
+        }
+
+    @property
+    def lock(self):
+        return self.lock_key(self.data["repo_id"], self.data["uid"])
+
+    @classmethod
+    def create(cls, repo_id: int, uid: str):
+        """登记任务，已有执行中的任务时返回 None"""
+        redis = get_redis_client()
+        job_id = uniq_id()
+        lock_key = cls.lock_key(repo_id, uid)
+        if not redis.set(
+            lock_key, job_id, nx=True, ex=settings.EXPORT_JOB_QUEUE_TIMEOUT
+        ):
+            return None
+        now = str(datetime.datetime.now())
+        job = cls(
+            job_id,
+            {
+                "repo_id": repo_id,
+                "uid": uid,
+                "status": ExportJobStatusChoices.QUEUED,
+                "phase": ExportJobStatusChoices.QUEUED,
+                "docs": 0,
+                "bytes": 0,
+                "url": "",
+                "archives": [],
+                "create_at": now,
+                "heartbeat_at": now,
+            },
+        )
+        pipeline = redis.pipeline()
+        pipeline.hset(cls.job_key(job_id), mapping=cls.encode(job.data))
+        pipeline.expire(cls.job_key(job_id), settings.EXPORT_JOB_TIMEOUT)
+        pipeline.set(
+            cls.latest_key(repo_id, uid), job_id, ex=settings.EXPORT_JOB_TIMEOUT
+        )
+        pipeline.execute()
+        return job
+
+    @classmethod
+    def get(cls, job_id: str):
+        """读取任务，并检查执行中的任务是否已中断"""
+        raw = get_redis_client().hgetall(cls.job_key(job_id))
+        if not raw:
+            return None
+        data = {key.decode(): val.decode() for key, val in raw.items()}
+        for key in INT_FIELDS:
+            data[key] = int(data[key])
+        for key in JSON_FIELDS:
+            data[key] = json.loads(data.get(key, "[]"))
+        job = cls(job_id, data)
+        if job.data["status"] in ACTIVE_STATUS and not job.holds_lock():
+            job.save(status=ExportJobStatusChoices.STALE)
+        return job
+
+    @classmethod
+    def latest(cls, repo_id: int, uid: str):
+        """用户在仓库的最近一次导出"""
+        job_id = get_redis_client().get(cls.latest_key(repo_id, uid))
+        if job_id is None:
+            return None
+        return cls.get(job_id.decode())
+
+    def holds_lock(self):
+        owner = self.redis.get(self.lock)
+        return owner is not None and owner.decode() == self.id
+
+    def save(self, **fields):
+        self.data.update(fields)
+        pipeline = self.redis.pipeline()
+        pipeline.hset(self.job_key(self.id), mapping=self.encode(fields))
+        pipeline.expire(self.job_key(self.id), settings.EXPORT_JOB_TIMEOUT)
+        pipeline.execute()
+
+    def report(self, phase: str, docs: int, size: int):
+        """更新进度，阶段不变时至多每 EXPORT_JOB_PROGRESS_INTERVAL 秒写入一次"""
+        now = time.time()
+        if (
+            phase == self.data["phase"]
+            and now - self.reported_at < settings.EXPORT_JOB_PROGRESS_INTERVAL
+        ):
+            return
+        self.reported_at = now
+        self.save(phase=phase, docs=docs, bytes=size)
+
+    def acquire(self):
+        """开始执行时获取锁，排队超时后锁已释放则重新获取"""
+        if self.redis.set(
+            self.lock, self.id, nx=True, ex=settings.EXPORT_JOB_LOCK_TIMEOUT
+        ):
+            return True
+        return self.renew()
+
+    def renew(self):
+        """锁仍属于该任务时续期"""
+        return self.compare_and_set(
+            lambda pipeline: pipeline.expire(
+                self.lock, settings.EXPORT_JOB_LOCK_TIMEOUT
+            )
+        )
+
+    def release(self):
+        """锁仍属于该任务时释放"""
+        return self.compare_and_set(lambda pipeline: pipeline.delete(self.lock))
+
+    def compare_and_set(self, command):
+        with self.redis.pipeline() as pipeline:
+            try:
+                pipeline.watch(self.lock)
+                owner = pipeline.get(self.lock)
+                if owner is None or owner.decode() != self.id:
+                    return False
+                pipeline.multi()
+                command(pipeline)
+                pipeline.execute()
+                return True
+            except WatchError:
+                return False
+
+    def heartbeat(self, stop: threading.Event):
+        while not stop.wait(settings.EXPORT_JOB_HEARTBEAT_INTERVAL):
+            if not self.renew():
+                return
+            self.save(heartbeat_at=str(datetime.datetime.now()))
+
+    @contextmanager
+    def running(self):
+        """执行期间由心跳线程续期，结束后释放锁"""
+        self.save(
+            status=ExportJobStatusChoices.RUNNING,
+            heartbeat_at=str(datetime.datetime.now()),
+        )
+        stop = threading.Event()
+        thread = threading.Thread(target=self.heartbeat, args=(stop,), daemon=True)
+        thread.start()
+        try:
+            yield self
+        finally:
+            stop.set()
+            thread.join()
+            self.release()
+
+    def to_dict(self):
+        return {"id": self.id, **self.data}
@@ -1,11 +1,8 @@
-import datetime
 import json
 import logging
 import os
-import shutil
 import time
 import traceback
-import zipfile
 
 import django
 from django.contrib.auth import get_user_model
@@ -15,16 +12,28 @@ os.environ.setdefault("C_FORCE_ROOT", "True")
 django.setup()
 
 from celery import Celery  # noqa
+from celery.exceptions import Retry, SoftTimeLimitExceeded  # noqa
 from celery.schedules import crontab  # noqa
 from django.core.cache import cache  # noqa
 from django.conf import settings  # noqa
 from django.db import connection  # noqa
+from PIL import Image, UnidentifiedImageError  # noqa
 
-from constents import DocAvailableChoices, UserTypeChoices  # noqa
+from constents import (  # noqa
+    DocImportStatusChoices,
+    ExportJobStatusChoices,
+    SMSDeliveryStatusChoices,
+    UserTypeChoices,
+)
 from modules.account.models import User  # noqa
-from modules.doc.models import PinDoc  # noqa
+from modules.cos.images import build_thumbnails  # noqa
+from modules.doc.importer import run_import  # noqa
+from modules.doc.models import DocImport  # noqa
+from modules.doc.pins import reconcile_pins  # noqa
+from modules.cel.export import SITE_RUNNING_KEY, export_repo, export_site  # noqa
+from modules.cel.jobs import ExportJob  # noqa
 from modules.cel.serializers import StatisticSerializer  # noqa
-from modules.doc.models import Doc  # noqa
+from modules.doc.retention import apply_retention  # noqa
 from modules.repo.models import Repo, RepoUser  # noqa
 from utils.client import get_client_by_user  # noqa
 
@@ -43,7 +52,12 @@ app.conf.beat_schedule = {
     },
     "auto_check_pin_doc": {
         "task": "modules.cel.tasks.auto_check_pin_doc",
-        "schedule": crontab(minute="*"),
+        "schedule": crontab(minute=0),
+        "args": (),
+    },
+    "auto_clean_versions": {
+        "task": "modules.cel.tasks.auto_clean_versions",
+        "schedule": crontab(minute=0, hour=3),
         "args": (),
     },
     "remind_apply_info": {
@@ -65,6 +79,7 @@ def auto_update_active_index():
             cursor.execute(sql_file.read())
 
     cache.delete("UserInfoView:active_user")
+    User.clear_snapshot(*User.objects.values_list("uid", flat=True))
 
     statistics = User.objects.values("uid", "username", "active_index")
     serializer = StatisticSerializer(statistics, many=True)
@@ -75,65 +90,168 @@ def auto_update_active_index():
 
 @app.task
 def auto_check_pin_doc():
-    """自动取消置顶到期的文章"""
-    now = datetime.datetime.now()
-    PinDoc.objects.filter(in_use=True, pin_to__lt=now).update(
-        in_use=False, operator=settings.ADMIN_USERNAME
+    """取消调度进程未处理的到期置顶，并修正到期登记"""
+    expired, fixed = reconcile_pins()
+    if expired or fixed:
+        logger.warning(
+            "[auto_check_pin_doc] expired: %d, schedule fixed: %d", expired, fixed
+        )
+
+
+@app.task
+def auto_clean_versions():
+    """按保留策略清理文章与评论版本"""
+    start = time.time()
+    stat = apply_retention()
+    logger.info(
+        "[auto_clean_versions] %s, cost %.2fs", json.dumps(stat), time.time() - start
     )
 
 
 @app.task
-def export_all_docs(repo_id: int, uid: str):
+def export_all_docs(repo_id: int, uid: str, job_id: str = None):
     """导出仓库所有文章"""
+    job = ExportJob.get(job_id) if job_id else ExportJob.create(repo_id, uid)
+    if job is None or not job.acquire():
+        logger.warning("[export_all_docs] repo %s of %s is exporting", repo_id, uid)
+        return
     client = get_client_by_user(uid)
     # 获取用户和库对象
     user = User.objects.get(uid=uid)
     repo = Repo.objects.get(id=repo_id)
-    # 导出文章
-    docs = Doc.objects.filter(
-        repo_id=repo.id,
-        is_deleted=False,
-        is_publish=True,
-        available=DocAvailableChoices.PUBLIC,
-    )
+    with job.running():
+        try:
+            result, archives = export_repo(client, repo, progress=job.report)
+            if result:
+                logger.info(
+                    "库 %s 导出上传成功 (%s)",
+                    repo.name,
+                    ", ".join(archive["url"] for archive in archives),
+                )
+            else:
+                raise Exception("Upload Error")
+            job.save(
+                status=ExportJobStatusChoices.SUCCESS,
+                phase=ExportJobStatusChoices.SUCCESS,
+                url=archives[-1]["url"],
+                archives=archives,
+            )
+            client.sms.send_sms(
+                user.phone,
+                settings.SMS_REPO_EXPORT_SUCCESS_TID,
+                [user.username, repo.name],
+            )
+        except Exception as err:
+            logger.error(err, traceback.print_exc())
+            job.save(
+                status=ExportJobStatusChoices.FAILED,
+                phase=ExportJobStatusChoices.FAILED,
+            )
+            client.sms.send_sms(
+                user.phone,
+                settings.SMS_REPO_EXPORT_FAIL_TID,
+                [user.username, repo.name],
+            )
+
+
+@app.task(
+    bind=True,
+    acks_late=True,
+    reject_on_worker_lost=True,
+    soft_time_limit=settings.CELERY_TASK_TIME_LIMIT - 60,
+    max_retries=settings.EXPORT_SITE_MAX_RETRIES,
+)
+def export_all_repos(self, uid: str):
+    """
+    导出全部仓库
+    任务执行完成后才确认，worker 进程异常退出时重新投递，软超时时主动重试，
+    均以任务 id 读取检查点继续导出；硬超时被终止的任务不会重新投递
+    存在失败的库时延迟重试，仅重新导出失败的库
+    执行中标记在每次执行时刷新，任务结束时删除，重试期间保留
+    """
+    cache.set(SITE_RUNNING_KEY, uid, settings.EXPORT_SITE_LOCK_TIMEOUT)
+    release = True
     try:
-        file_dir = os.path.join(settings.BASE_DIR, "tmp", "repo", uid, str(repo.id))
-        if os.path.exists(file_dir):
-            shutil.rmtree(file_dir)
-        os.makedirs(file_dir)
-        for doc in docs:
-            filename = "[{}]{}.md".format(
-                doc.id, doc.title.replace(" ", "").replace("/", "")
+        client = get_client_by_user(uid)
+        user = User.objects.get(uid=uid)
+        try:
+            results, failed = export_site(uid, self.request.id)
+        except SoftTimeLimitExceeded:
+            logger.info("[export_all_repos] %s soft time limit, retry", self.request.id)
+            raise self.retry(countdown=0)
+        if failed and self.request.retries < self.max_retries:
+            logger.info(
+                "[export_all_repos] %s failed %s, retry",
+                self.request.id,
+                json.dumps(failed, ensure_ascii=False),
             )
-            file_path = os.path.join(file_dir, filename)
-            with open(file_path, "w", encoding="utf-8") as file:
-                file.write(doc.content)
-        zip_file_path = "{}.zip".format(
-            os.path.join(os.path.dirname(file_dir), repo.name)
+            raise self.retry(countdown=settings.EXPORT_SITE_RETRY_DELAY)
+        logger.info(
+            "[export_all_repos] %s done, success: %d, failed: %s",
+            self.request.id,
+            len(results),
+            json.dumps(failed, ensure_ascii=False),
         )
-        zip_file = zipfile.ZipFile(zip_file_path, "w", zipfile.ZIP_DEFLATED)
-        for dir_path, dir_names, filenames in os.walk(file_dir):
-            f_path = dir_path.replace(file_dir, "")
-            f_path = f_path and f_path + os.sep or ""
-            for filename in filenames:
-                zip_file.write(os.path.join(dir_path, filename), f_path + filename)
-        zip_file.close()
-        with open(zip_file_path, "rb") as zip_file:
-            result, url = client.cos.upload("{}.zip".format(repo.name), zip_file.raw)
-        shutil.rmtree(file_dir)
-        os.remove(zip_file_path)
-        if result:
-            logger.info("库 %s 导出上传成功 (%s)", repo.name, url)
-        else:
-            raise Exception("Upload Error")
-        client.sms.send_sms(
-            user.phone, settings.SMS_REPO_EXPORT_SUCCESS_TID, [user.username, repo.name]
+        template = (
+            settings.SMS_REPO_EXPORT_FAIL_TID
+            if failed
+            else settings.SMS_REPO_EXPORT_SUCCESS_TID
         )
+        client.sms.send_sms(user.phone, template, [user.username, "全部库"])
+        return {"repos": results, "failed": failed}
+    except Retry:
+        release = False
+        raise
+    finally:
+        if release:
+            cache.delete(SITE_RUNNING_KEY)
+
+
+@app.task(acks_late=True, reject_on_worker_lost=True)
+def import_docs(import_id: int):
+    """导入压缩包中的文章，重新执行时从已处理的文件继续"""
+    doc_import = DocImport.objects.get(id=import_id)
+    if doc_import.status == DocImportStatusChoices.SUCCESS:
+        return
+    start = time.time()
+    try:
+        run_import(doc_import)
     except Exception as err:
-        logger.error(err, traceback.print_exc())
-        client.sms.send_sms(
-            user.phone, settings.SMS_REPO_EXPORT_FAIL_TID, [user.username, repo.name]
+        logger.error("[import_docs] %s failed %s", import_id, err)
+        DocImport.objects.filter(id=import_id).update(
+            status=DocImportStatusChoices.FAILED, error=str(err)
         )
+        return
+    logger.info(
+        "[import_docs] %s done, %d docs, cost %.2fs",
+        import_id,
+        doc_import.imported,
+        time.time() - start,
+    )
+
+
+@app.task(bind=True, max_retries=settings.AVATAR_THUMB_MAX_RETRIES)
+def generate_avatar_thumbs(self, uid: str):
+    """生成头像缩略图，头像在生成期间变更时不写入"""
+    user = User.objects.filter(uid=uid).first()
+    if user is None or user.get_avatar_thumbs() is not None:
+        cache.delete(User.thumbs_pending_key(uid))
+        return
+    avatar = user.avatar
+    try:
+        sizes = build_thumbnails(get_client_by_user(uid).cos, avatar)
+    except (UnidentifiedImageError, Image.DecompressionBombError) as err:
+        # 无法识别或尺寸超限的图片不再重试，记录空结果，其余异常(如网络错误)重试
+        logger.warning("[generate_avatar_thumbs] %s invalid image %s", uid, err)
+        sizes = {}
+    except Exception as err:
+        logger.error("[generate_avatar_thumbs] %s failed %s", uid, err)
+        raise self.retry(exc=err, countdown=2**self.request.retries * 10)
+    if User.objects.filter(uid=uid, avatar=avatar).update(
+        avatar_thumbs={"source": avatar, "sizes": sizes}
+    ):
+        User.clear_snapshot(uid)
+    cache.delete(User.thumbs_pending_key(uid))
 
 
 @app.task
@@ -161,13 +279,34 @@ def remind_apply_info():
             send_kwargs[c.uid]["count"] += c.count
     logger.info("[remind_apply_info] %s", json.dumps(send_kwargs))
     client = get_client_by_user(settings.ADMIN_USERNAME)
-    for u in send_kwargs.values():
-        client.sms.send_sms(
-            u["phone"],
-            settings.SMS_REPO_APPLY_TID,
-            [" / ".join(u["repos"]), str(u["count"])],
+    results = client.sms.send_many(
+        [
+            (
+                u["phone"],
+                settings.SMS_REPO_APPLY_TID,
+                [" / ".join(u["repos"]), str(u["count"])],
+            )
+            for u in send_kwargs.values()
+        ]
+    )
+    logger.info("[remind_apply_info] sent %d/%d", sum(results.values()), len(results))
+
+
+@app.task(bind=True, max_retries=settings.SMS_PHONE_CODE_MAX_RETRIES)
+def send_verify_code(self, delivery_id: str, phone: str, code: str):
+    """发送验证码，失败时重试，发送状态写入缓存供前端查询"""
+    client = get_client_by_user(settings.ADMIN_USERNAME)
+    if client.sms.send_sms(phone, settings.SMS_PHONE_CODE_TID, [code]):
+        User.set_delivery_status(delivery_id, SMSDeliveryStatusChoices.SUCCESS)
+        return
+    if self.request.retries < self.max_retries:
+        logger.warning(
+            "[send_verify_code] %s failed, retry %d", delivery_id, self.request.retries
         )
-        time.sleep(0.1)
+        raise self.retry(countdown=settings.SMS_PHONE_CODE_RETRY_DELAY)
+    logger.error("[send_verify_code] %s failed", delivery_id)
+    User.set_delivery_status(delivery_id, SMSDeliveryStatusChoices.FAILED)
+    User.revoke_code(phone, code)
 
 
 @app.task
@@ -1,9 +1,14 @@
 from django.contrib import admin
+from django.db import transaction
 
-from modules.conf.models import Conf
+from modules.conf.models import Conf, conf_snapshot
 
 
 @admin.register(Conf)
 class ConfAdmin(admin.ModelAdmin):
     list_display = ["c_key", "c_type", "c_val", "c_bool"]
     search_fields = ["c_key"]
+
+    def delete_queryset(self, request, queryset):
+        super().delete_queryset(request, queryset)
+        transaction.on_commit(conf_snapshot.publish)
@@ -1,24 +1,137 @@
-from django.db import models
+import logging
+import os
+import threading
+import time
+
+from django.conf import settings
+from django.db import models, transaction
 from django.utils.translation import gettext_lazy as _
 
 from constents import MAX_CHAR_LENGTH, ConfTypeChoices
+from utils.tools import get_redis_client
 
 DB_PREFIX = "conf_"
 
+logger = logging.getLogger("app")
+
 
 def get_default_c_val():
     return {}
 
 
+class ConfSnapshot(object):
+    """
+    进程内配置快照
+    1. 首次读取时全量加载，之后的读取均为字典查找
+    2. 配置变更时通过 Redis 发布订阅通知所有进程重新加载
+    3. 订阅断开期间快照按 CONF_SNAPSHOT_TIMEOUT 兜底过期
+    4. 每次失效递增代数，加载期间发生失效时加载结果不写入快照，避免旧数据覆盖
+    """
+
+    def __init__(self):
+        self._data = None
+        self._load_at = 0
+        self._generation = 0
+        self._pid = None
+        self._lock = threading.Lock()
+
+    @property
+    def channel(self):
+        return f"{settings.APP_CODE}:{settings.CONF_SNAPSHOT_CHANNEL}"
+
+    def load(self):
+        """全量加载配置"""
+        generation = self._generation
+        data = {
+            conf.c_key: (conf.sensitive, conf.val)
+            for conf in Conf.objects.all().iterator()
+        }
+        with self._lock:
+            if generation == self._generation:
+                self._data = data
+                self._load_at = time.time()
+        return data
+
+    def invalidate(self):
+        """标记快照失效，下次读取时重新加载"""
+        with self._lock:
+            self._generation += 1
+            self._data = None
+
+    def get_data(self):
+        self.ensure_listener()
+        data = self._data
+        if data is None or time.time() - self._load_at > settings.CONF_SNAPSHOT_TIMEOUT:
+            data = self.load()
+        return data
+
+    def get(self, c_key: str, sensitive: bool = False):
+        item = self.get_data().get(c_key)
+        if item is None or item[0] != sensitive:
+            return None
+        return item[1]
+
+    def get_many(self, c_keys: list, sensitive: bool = False):
+        data = self.get_data()
+        return {
+            c_key: data[c_key][1]
+            for c_key in c_keys
+            if c_key in data and data[c_key][0] == sensitive
+        }
+
+    def publish(self):
+        """通知所有进程刷新快照"""
+        self.invalidate()
+        try:
+            get_redis_client().publish(self.channel, str(time.time()))
+        except Exception as err:
+            logger.error("[conf snapshot] publish failed %s", err)
+
+    def ensure_listener(self):
+        """
+        每个进程启动一个订阅线程
+        uwsgi/celery 预加载后 fork 的子进程不会继承线程，因此按 pid 判断
+        """
+        pid = os.getpid()
+        if self._pid == pid:
+            return
+        with self._lock:
+            if self._pid == pid:
+                return
+            self._pid = pid
+            self._generation += 1
+            self._data = None
+        thread = threading.Thread(
+            target=self.listen, name="ConfSnapshotListener", daemon=True
+        )
+        thread.start()
+
+    def listen(self):
+        while True:
+            try:
+                pubsub = get_redis_client().pubsub(ignore_subscribe_messages=True)
+                pubsub.subscribe(self.channel)
+                # 订阅建立前的变更可能丢失，重新加载一次
+                self.invalidate()
+                for _message in pubsub.listen():
+                    self.invalidate()
+            except Exception as err:
+                logger.error("[conf snapshot] subscribe failed %s", err)
+                self.invalidate()
+                time.sleep(settings.CONF_SNAPSHOT_RETRY_INTERVAL)
+
+
+conf_snapshot = ConfSnapshot()
+
+
 class ConfManager(models.Manager):
     """配置管理器"""
 
     def get(self, c_key: str, sensitive: bool = False):
-        try:
-            conf = super().get(c_key=c_key, sensitive=sensitive)
-            return conf.val
-        except self.model.DoesNotExist:
-            return None
+        return conf_snapshot.get(c_key, sensitive)
+
+    def get_many(self, c_keys: list, sensitive: bool = False):
+        return conf_snapshot.get_many(c_keys, sensitive)
 
 
 class Conf(models.Model):
@@ -50,3 +163,12 @@ class Conf(models.Model):
             return self.c_bool
         else:
             return self.c_val
+
+    def save(self, *args, **kwargs):
+        super().save(*args, **kwargs)
+        transaction.on_commit(conf_snapshot.publish)
+
+    def delete(self, *args, **kwargs):
+        result = super().delete(*args, **kwargs)
+        transaction.on_commit(conf_snapshot.publish)
+        return result
@@ -3,7 +3,7 @@ from rest_framework.views import APIView
 
 from modules.conf.models import Conf
 from utils.authenticators import SessionAuthenticate
-from utils.exceptions import Error404
+from utils.exceptions import Error404, ParamsNotFound
 
 
 class ConfView(APIView):
@@ -12,6 +12,13 @@ class ConfView(APIView):
     authentication_classes = [SessionAuthenticate]
 
     def post(self, request, *args, **kwargs):
+        # 批量获取
+        c_keys = request.data.get("cKeys")
+        if c_keys is not None:
+            if not isinstance(c_keys, list):
+                raise ParamsNotFound()
+            return Response({"data": Conf.objects.get_many(c_keys, sensitive=False)})
+        # 单个获取
         c_key = request.data.get("cKey")
         conf = Conf.objects.get(c_key=c_key, sensitive=False)
         if conf is not None:
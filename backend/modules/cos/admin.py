@@ -1,5 +1,6 @@
-from django.contrib import admin
+from django.contrib import admin, messages
 from django.contrib.auth import get_user_model
+from django.db.models import Count, Sum
 from django.utils.translation import gettext_lazy as _
 
 from modules.cos.models import UploadLog
@@ -25,10 +26,36 @@ class UploadETagListFilter(admin.SimpleListFilter):
 
 @admin.register(UploadLog)
 class UploadLogAdmin(admin.ModelAdmin):
-    list_display = ["name", "path", "etag", "operator_name", "upload_at"]
-    search_fields = ["name"]
+    list_display = [
+        "name",
+        "path",
+        "etag",
+        "size",
+        "dedup_hits",
+        "operator_name",
+        "upload_at",
+    ]
+    search_fields = ["name", "sha256"]
     list_filter = [UploadETagListFilter]
 
+    def changelist_view(self, request, extra_context=None):
+        # 去重命中率 = 命中次数 / (命中次数 + 实际上传次数)
+        stat = UploadLog.objects.filter(sha256__isnull=False).aggregate(
+            uploads=Count("id"), hits=Sum("dedup_hits")
+        )
+        total = stat["uploads"] + (stat["hits"] or 0)
+        if total:
+            self.message_user(
+                request,
+                _("去重命中 %(hits)d 次，命中率 %(rate).2f%%")
+                % {
+                    "hits": stat["hits"] or 0,
+                    "rate": (stat["hits"] or 0) / total * 100,
+                },
+                messages.INFO,
+            )
+        return super().changelist_view(request, extra_context)
+
     @admin.display(description=_("上传结果"), boolean=True)
     def etag(self, obj):
         return True if obj.response.get("ETag", False) else False
@@ -1,67 +1,336 @@
-import datetime
+import hashlib
 import logging
+import os
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 from io import BytesIO
 
 from django.conf import settings
-from django.db import IntegrityError
+from django.core.cache import cache
 from qcloud_cos import CosConfig
 from qcloud_cos import CosS3Client
+from qcloud_cos.cos_exception import CosServiceError
 
 from modules.cos.models import UploadLog
-from utils.tools import simple_uniq_id
+from modules.cos.storage import BaseStorageClient, StorageWriter
 
 logger = logging.getLogger("cos")
 
+# 进程内共享的 SDK 客户端，按 地域 与 密钥 区分
+_client_pool = {}
+_client_pool_lock = threading.Lock()
+# fork 后子进程不能复用父进程的连接
+os.register_at_fork(after_in_child=_client_pool.clear)
 
-class COSClient(object):
+
+def build_cos_client(region: str, secret_id: str, secret_key: str):
+    """创建 SDK 客户端，连接池大小由 COS_POOL_CONNECTIONS 与 COS_POOL_MAXSIZE 控制"""
+    return CosS3Client(
+        CosConfig(
+            Region=region,
+            SecretId=secret_id,
+            SecretKey=secret_key,
+            PoolConnections=settings.COS_POOL_CONNECTIONS,
+            PoolMaxSize=settings.COS_POOL_MAXSIZE,
+        )
+    )
+
+
+def get_cos_client(region: str, secret_id: str, secret_key: str):
+    """获取共享的 SDK 客户端，HTTP 连接保持长连接并在请求间复用"""
+    key = (region, secret_id, secret_key)
+    client = _client_pool.get(key)
+    if client is None:
+        with _client_pool_lock:
+            client = _client_pool.get(key)
+            if client is None:
+                client = build_cos_client(region, secret_id, secret_key)
+                _client_pool[key] = client
+    return client
+
+
+class COSClient(BaseStorageClient):
     """对象存储客户端"""
 
+    backend = "cos"
+
     def __init__(self, operator: str):
-        self.operator = operator
-        self.client = CosS3Client(
-            CosConfig(
-                Region=settings.COS_REGION,
-                SecretId=settings.TCLOUD_SECRET_ID,
-                SecretKey=settings.TCLOUD_SECRET_KEY,
-            )
+        super().__init__(operator)
+        self.domain = settings.COS_DOMAIN
+        self.client = get_cos_client(
+            settings.COS_REGION, settings.TCLOUD_SECRET_ID, settings.TCLOUD_SECRET_KEY
         )
         self.bucket = settings.COS_BUCKET
 
-    def verify_filename(self, filename: str):
-        replace_map = {" ": "", "$": "_", "[": "(", "]": ")", "{": "(", "}": ")"}
-        for item, new_item in replace_map.items():
-            filename = filename.replace(item, new_item)
-        if filename.count("(") != filename.count(")") or filename.find(
-            ")"
-        ) < filename.find("("):
-            filename = filename.replace("(", "_").replace(")", "_")
-        return filename
-
-    def upload(self, filename: str, file: BytesIO):
-        """上传文件"""
-        # 文件存储位置
-        key = "upload/{date_path}/{random_path}".format(
-            date_path=datetime.datetime.now().strftime("%Y%m/%d"),
-            random_path=simple_uniq_id(settings.COS_RANDOM_PATH_LENGTH),
+    def read_object(self, key: str, chunk_size: int):
+        """分块读取文件"""
+        resp = self.client.get_object(Bucket=self.bucket, Key=key)
+        return resp["Body"].get_stream(chunk_size=chunk_size)
+
+    def open_writer(self, filename: str, spool_size: int = None):
+        """以流的方式上传文件"""
+        return MultipartUploadWriter(self, filename, spool_size)
+
+    def upload_part(
+        self, key: str, upload_id: str, part_number: int, data: bytes, etag: str = None
+    ):
+        """上传分片，失败时重试，已上传且内容一致的分片直接跳过"""
+        md5 = hashlib.md5(data).hexdigest()
+        if etag is not None and etag.strip('"') == md5:
+            return {"ETag": etag, "PartNumber": part_number}
+        for attempt in range(settings.COS_MULTIPART_RETRIES + 1):
+            try:
+                resp = self.client.upload_part(
+                    Bucket=self.bucket,
+                    Key=key,
+                    Body=data,
+                    PartNumber=part_number,
+                    UploadId=upload_id,
+                )
+                return {"ETag": resp["ETag"], "PartNumber": part_number}
+            except Exception as err:
+                if attempt >= settings.COS_MULTIPART_RETRIES:
+                    raise
+                logger.warning(
+                    "Upload Part Error %s part %d attempt %d %s",
+                    key,
+                    part_number,
+                    attempt + 1,
+                    err,
+                )
+                time.sleep(2**attempt)
+
+    def list_parts(self, key: str, upload_id: str):
+        """已上传的分片，返回 分片号 与 ETag"""
+        parts = {}
+        marker = 0
+        while True:
+            resp = self.client.list_parts(
+                Bucket=self.bucket, Key=key, UploadId=upload_id, PartNumberMarker=marker
+            )
+            for part in resp.get("Part", []):
+                parts[int(part["PartNumber"])] = part["ETag"]
+            if resp.get("IsTruncated") != "true":
+                return parts
+            marker = resp["NextPartNumberMarker"]
+
+    def delete_object(self, key: str):
+        self.client.delete_object(Bucket=self.bucket, Key=key)
+
+    def copy_object(self, source_key: str, key: str):
+        self.client.copy_object(
+            Bucket=self.bucket,
+            Key=key,
+            CopySource={
+                "Bucket": self.bucket,
+                "Key": source_key,
+                "Region": settings.COS_REGION,
+            },
+        )
+
+    def stat_object(self, key: str):
+        try:
+            resp = self.client.head_object(Bucket=self.bucket, Key=key)
+        except CosServiceError as err:
+            if err.get_status_code() == 404:
+                return None
+            raise
+        return {"ETag": resp.get("ETag"), "Content-Length": int(resp["Content-Length"])}
+
+    def presign_put(self, key: str, size: int):
+        """签名包含 Content-Length，上传的文件大小必须与申请时一致"""
+        headers = {"Content-Length": str(size)}
+        url = self.client.get_presigned_url(
+            Bucket=self.bucket,
+            Key=key,
+            Method="PUT",
+            Expired=settings.COS_PRESIGN_EXPIRE,
+            Headers=headers,
+        )
+        return {"method": "PUT", "url": url, "headers": headers}
+
+    def upload_multipart(self, filename: str, file: BytesIO, size: int):
+        """
+        并行分片上传
+        1. 上传任务记录于缓存，同一用户再次上传同名、同大小且首个分片相同的文件时，
+           通过 list_parts 获取已上传的分片，内容一致的分片不再上传
+        2. 同一文件同时上传时，只有获得锁的上传可以续传，其余上传重新创建上传任务，不共用 upload_id
+        3. 分片由 COS_UPLOAD_THREADS 个线程并行上传，失败的分片单独重试
+        """
+        part_size = settings.COS_MULTIPART_PART_SIZE
+        file.seek(0)
+        fingerprint = hashlib.md5(file.read(part_size)).hexdigest()
+        resume_key = "COSClient:multipart:{}:{}:{}:{}".format(
+            self.operator, hashlib.md5(filename.encode()).hexdigest(), size, fingerprint
         )
-        full_path = f"{key}/{filename}"
-        # 初始化返回参数
-        url = None
-        result = False
+        lock_key = f"{resume_key}:lock"
+        resumable = cache.add(lock_key, 1, settings.COS_MULTIPART_LOCK_TIMEOUT)
         try:
-            # 创建日志
-            log = UploadLog.objects.create(
-                name=filename, path=key, operator=self.operator
+            state = cache.get(resume_key) if resumable else None
+            log = None
+            uploaded = {}
+            if state is not None:
+                log = UploadLog.objects.filter(path=state["path"]).first()
+                try:
+                    uploaded = self.list_parts(
+                        f"{state['path']}/{filename}", state["upload_id"]
+                    )
+                    upload_id = state["upload_id"]
+                except CosServiceError:
+                    log = None
+            if log is None:
+                uploaded = {}
+                log = self.create_log(filename)
+                resp = self.client.create_multipart_upload(
+                    Bucket=self.bucket, Key=f"{log.path}/{filename}"
+                )
+                upload_id = resp["UploadId"]
+                if resumable:
+                    cache.set(
+                        resume_key,
+                        {"path": log.path, "upload_id": upload_id},
+                        settings.COS_MULTIPART_RESUME_TIMEOUT,
+                    )
+            full_path = f"{log.path}/{filename}"
+            read_lock = threading.Lock()
+
+            def upload_part(part_number: int):
+                with read_lock:
+                    file.seek((part_number - 1) * part_size)
+                    data = file.read(part_size)
+                return self.upload_part(
+                    full_path, upload_id, part_number, data, uploaded.get(part_number)
+                )
+
+            part_count = (size + part_size - 1) // part_size
+            with ThreadPoolExecutor(max_workers=settings.COS_UPLOAD_THREADS) as pool:
+                parts = list(pool.map(upload_part, range(1, part_count + 1)))
+            resp = self.client.complete_multipart_upload(
+                Bucket=self.bucket,
+                Key=full_path,
+                UploadId=upload_id,
+                MultipartUpload={"Part": parts},
             )
-            # 上传文件
-            resp = self.client.put_object(Bucket=self.bucket, Key=full_path, Body=file)
-            log.response = resp
-            log.save()
-            url = "{}/{}".format(settings.COS_DOMAIN, full_path)
-            logger.info("Upload File Success %s", url)
-            result = True
-        except IntegrityError:
-            return self.upload(filename, file)
+            if resumable:
+                cache.delete(resume_key)
+        finally:
+            if resumable:
+                cache.delete(lock_key)
+        return log, resp
+
+    def save(self, filename: str, file: BytesIO, size: int):
+        """保存文件，超过 COS_MULTIPART_THRESHOLD 时分片上传"""
+        if size >= settings.COS_MULTIPART_THRESHOLD:
+            return self.upload_multipart(filename, file, size)
+        log = self.create_log(filename)
+        resp = self.client.put_object(
+            Bucket=self.bucket, Key=f"{log.path}/{filename}", Body=file
+        )
+        return log, resp
+
+
+class MultipartUploadWriter(StorageWriter):
+    """
+    分片上传写入器
+    1. 只支持追加写入，不支持 seek，可直接作为 zipfile 的输出
+    2. 写入的数据缓存于 SpooledTemporaryFile，超过 spool_size(默认 COS_MULTIPART_SPOOL_SIZE) 时落盘
+    3. 缓存达到 COS_MULTIPART_PART_SIZE 时上传一个分片，总大小不足一个分片时使用简单上传
+    """
+
+    def __init__(self, cos_client: COSClient, filename: str, spool_size: int = None):
+        self.cos = cos_client
+        self.filename = filename
+        self.spool_size = spool_size or settings.COS_MULTIPART_SPOOL_SIZE
+        self.log = None
+        self.full_path = None
+        self.upload_id = None
+        self.parts = []
+        self.buffer = self.new_buffer()
+        self.size = 0
+        self.closed = False
+        self.result = False
+        self.url = None
+        self.start_at = time.perf_counter()
+
+    def new_buffer(self):
+        return tempfile.SpooledTemporaryFile(max_size=self.spool_size)
+
+    def write(self, data: bytes):
+        self.buffer.write(data)
+        self.size += len(data)
+        if self.buffer.tell() >= settings.COS_MULTIPART_PART_SIZE:
+            self.upload_part()
+        return len(data)
+
+    def start(self):
+        """创建日志与分片上传任务"""
+        if self.log is None:
+            self.log = self.cos.create_log(self.filename)
+            self.full_path = f"{self.log.path}/{self.filename}"
+
+    def upload_part(self):
+        """上传缓存中的数据"""
+        self.start()
+        if self.upload_id is None:
+            resp = self.cos.client.create_multipart_upload(
+                Bucket=self.cos.bucket, Key=self.full_path
+            )
+            self.upload_id = resp["UploadId"]
+        self.buffer.seek(0)
+        self.parts.append(
+            self.cos.upload_part(
+                self.full_path, self.upload_id, len(self.parts) + 1, self.buffer.read()
+            )
+        )
+        self.buffer.close()
+        self.buffer = self.new_buffer()
+
+    def close(self):
+        """上传剩余数据并完成上传"""
+        if self.closed:
+            return
+        self.closed = True
+        try:
+            self.start()
+            if self.upload_id is None:
+                self.buffer.seek(0)
+                resp = self.cos.client.put_object(
+                    Bucket=self.cos.bucket, Key=self.full_path, Body=self.buffer
+                )
+            else:
+                if self.buffer.tell():
+                    self.upload_part()
+                resp = self.cos.client.complete_multipart_upload(
+                    Bucket=self.cos.bucket,
+                    Key=self.full_path,
+                    UploadId=self.upload_id,
+                    MultipartUpload={"Part": self.parts},
+                )
+            self.log.response = resp
+            self.log.save()
+            self.url = self.cos.build_url(self.full_path)
+            self.result = True
+            self.cos.metrics.record(
+                "upload", self.size, time.perf_counter() - self.start_at
+            )
+            logger.info("Upload File Success %s (%d bytes)", self.url, self.size)
         except Exception as err:
-            logger.error("Upload File Error", err)
-        return result, url
+            logger.error("Upload File Error %s", err)
+            self.abort()
+        finally:
+            self.buffer.close()
+
+    def abort(self):
+        """放弃上传"""
+        self.closed = True
+        self.buffer.close()
+        if self.upload_id is not None:
+            try:
+                self.cos.client.abort_multipart_upload(
+                    Bucket=self.cos.bucket, Key=self.full_path, UploadId=self.upload_id
+                )
+            except Exception as err:
+                logger.error("Abort Upload Error %s", err)
+            self.upload_id = None
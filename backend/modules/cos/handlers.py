@@ -0,0 +1,131 @@
+"""
+上传处理器
+1. 按到达的字节数校验文件大小，超过限制时立即停止接收，不再缓存剩余数据
+2. 请求体超过 COS_STREAM_UPLOAD_THRESHOLD 时，文件数据边接收边分片上传至对象存储，
+   不写入本地临时文件；较小的请求仍由默认处理器接收，上传前去重
+   取舍：边接收边上传的分片只能按到达顺序逐个上传，请求中断后无法续传；
+   默认处理器接收的文件由 upload 以多线程并行分片上传，失败后可续传，但占用本地磁盘。
+   因此阈值远高于 COS_MULTIPART_THRESHOLD，仅超大文件以流式上传节省磁盘
+3. 同一请求中后续文件超过限制或接收中断时，删除本请求中已上传的文件
+"""
+
+import hashlib
+import logging
+
+from django.conf import settings
+from django.core.files.uploadedfile import UploadedFile
+from django.core.files.uploadhandler import (
+    FileUploadHandler,
+    StopFutureHandlers,
+    StopUpload,
+)
+
+from utils.client import get_client_by_user
+
+logger = logging.getLogger("cos")
+
+
+class StreamedUploadedFile(UploadedFile):
+    """已上传至对象存储的文件"""
+
+    def __init__(self, name, content_type, size, charset, url, content_type_extra=None):
+        super().__init__(None, name, content_type, size, charset, content_type_extra)
+        self.url = url
+
+
+class SizeLimitUploadHandler(FileUploadHandler):
+    """单个文件超过 max_size 时停止接收，并在请求上标记 upload_exceeded"""
+
+    def __init__(self, request=None, max_size: int = None):
+        super().__init__(request)
+        self.max_size = max_size or settings.COS_MAX_FILE_SIZE
+
+    def new_file(self, *args, **kwargs):
+        super().new_file(*args, **kwargs)
+        self.received = 0
+
+    def receive_data_chunk(self, raw_data, start):
+        self.received += len(raw_data)
+        if self.received > self.max_size:
+            self.interrupt()
+            self.request.upload_exceeded = True
+            raise StopUpload(connection_reset=True)
+        return raw_data
+
+    def interrupt(self):
+        """停止接收前的清理"""
+
+    def file_complete(self, file_size):
+        return None
+
+
+class COSStreamUploadHandler(SizeLimitUploadHandler):
+    """边接收边上传至对象存储，同时计算 sha256 用于去重"""
+
+    def __init__(self, request=None, max_size: int = None):
+        super().__init__(request, max_size)
+        self.activated = False
+        # 本请求中已上传完成且未去重的文件
+        self.uploaded = []
+
+    def handle_raw_input(
+        self, input_data, META, content_length, boundary, encoding=None
+    ):
+        self.activated = content_length >= settings.COS_STREAM_UPLOAD_THRESHOLD
+
+    def new_file(self, *args, **kwargs):
+        super().new_file(*args, **kwargs)
+        if not self.activated:
+            return
+        self.cos = get_client_by_user(self.request.user.uid).cos
+        self.file_name = self.cos.verify_filename(self.file_name)
+        self.writer = self.cos.open_writer(
+            self.file_name, spool_size=settings.COS_MULTIPART_PART_SIZE
+        )
+        self.sha256 = hashlib.sha256()
+        raise StopFutureHandlers()
+
+    def receive_data_chunk(self, raw_data, start):
+        raw_data = super().receive_data_chunk(raw_data, start)
+        if not self.activated:
+            return raw_data
+        self.sha256.update(raw_data)
+        self.writer.write(raw_data)
+        return None
+
+    def interrupt(self):
+        if not self.activated:
+            return
+        self.writer.abort()
+        if self.writer.log is not None:
+            self.writer.log.delete()
+        for writer in self.uploaded:
+            try:
+                self.cos.delete_object(writer.full_path)
+                writer.log.delete()
+            except Exception as err:
+                logger.error("Delete Rejected Upload Error %s", err)
+        self.uploaded = []
+
+    def upload_interrupted(self):
+        self.interrupt()
+
+    def file_complete(self, file_size):
+        if not self.activated:
+            return None
+        self.writer.close()
+        url = None
+        if self.writer.result:
+            url = self.cos.deduplicate(
+                self.writer, self.sha256.hexdigest(), self.writer.size
+            )
+            if url == self.writer.url:
+                self.uploaded.append(self.writer)
+        return StreamedUploadedFile(
+            self.file_name,
+            self.content_type,
+            file_size,
+            self.charset,
+            url,
+            self.content_type_extra,
+        )
@@ -0,0 +1,69 @@
+"""
+图片衍生文件
+1. 按 AVATAR_THUMB_SIZES 将图片居中裁剪为正方形缩略图，
+   每个尺寸分别生成 AVATAR_THUMB_FORMATS 中的格式，上传至存储
+2. JPEG 解码时按目标尺寸降采样，减少大图的解码耗时与内存占用
+"""
+
+import os
+from io import BytesIO
+
+from django.conf import settings
+from PIL import Image, ImageOps
+
+# 格式对应的 Pillow 编码器与扩展名
+THUMB_FORMATS = {
+    "webp": ("WEBP", "webp"),
+    "jpeg": ("JPEG", "jpg"),
+}
+
+
+def open_image(data: bytes, size: int):
+    """读取图片，按 EXIF 方向旋转"""
+    image = Image.open(BytesIO(data))
+    image.draft("RGB", (size, size))
+    return ImageOps.exif_transpose(image)
+
+
+def make_thumbnail(image: Image.Image, size: int, fmt: str):
+    """生成单个缩略图，返回图片数据"""
+    encoder, _ = THUMB_FORMATS[fmt]
+    thumb = ImageOps.fit(image, (size, size), Image.LANCZOS)
+    if encoder == "JPEG" and thumb.mode != "RGB":
+        # JPEG 不支持透明通道，以白色背景合成
+        thumb = thumb.convert("RGBA")
+        background = Image.new("RGB", thumb.size, (255, 255, 255))
+        background.paste(thumb, mask=thumb.getchannel("A"))
+        thumb = background
+    elif thumb.mode not in ("RGB", "RGBA"):
+        thumb = thumb.convert("RGBA")
+    file = BytesIO()
+    thumb.save(file, encoder, quality=settings.AVATAR_THUMB_QUALITY, optimize=True)
+    file.seek(0)
+    return file
+
+
+def build_thumbnails(storage, url: str):
+    """
+    生成并上传缩略图，返回 {尺寸: {格式: 地址}}
+    非本存储的图片无法读取，返回空字典
+    """
+    key = storage.get_key(url)
+    if key is None:
+        return {}
+    image = open_image(
+        b"".join(storage.iter_object(key)), max(settings.AVATAR_THUMB_SIZES)
+    )
+    name = os.path.splitext(os.path.basename(key))[0]
+    thumbs = {}
+    for size in settings.AVATAR_THUMB_SIZES:
+        thumbs[str(size)] = {}
+        for fmt in settings.AVATAR_THUMB_FORMATS:
+            _, ext = THUMB_FORMATS[fmt]
+            result, thumb_url = storage.upload(
+                f"{name}_{size}.{ext}", make_thumbnail(image, size, fmt)
+            )
+            if not result:
+                raise Exception("Upload Thumbnail Error")
+            thumbs[str(size)][fmt] = thumb_url
+    return thumbs
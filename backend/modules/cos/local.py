@@ -0,0 +1,205 @@
+"""
+本地存储
+1. 文件存储于 LOCAL_STORAGE_ROOT，先写入同目录的临时文件，完成后原子替换，不会读到写了一半的文件
+2. 访问地址以 LOCAL_STORAGE_URL 开头，由 LocalFileView 提供下载，
+   配置 LOCAL_STORAGE_ACCEL_PREFIX 时交由 Nginx X-Accel-Redirect 发送，否则使用 sendfile
+3. 直传地址指向 LocalFileView，以 PUT 上传，用于替代对象存储进行开发与测试
+"""
+
+import hashlib
+import logging
+import os
+import tempfile
+import time
+from io import BytesIO
+from urllib.parse import quote
+
+from django.conf import settings
+from django.core import signing
+
+from modules.cos.storage import BaseStorageClient, StorageWriter
+
+logger = logging.getLogger("cos")
+
+UPLOAD_SALT = "modules.cos.local.upload"
+
+
+class LocalStorageClient(BaseStorageClient):
+    """本地存储客户端"""
+
+    backend = "local"
+
+    def __init__(self, operator: str):
+        super().__init__(operator)
+        self.domain = settings.LOCAL_STORAGE_URL
+        self.root = os.path.realpath(settings.LOCAL_STORAGE_ROOT)
+
+    def path(self, key: str):
+        """存储位置对应的本地路径，不允许访问存储目录之外的文件"""
+        path = os.path.realpath(os.path.join(self.root, key))
+        if not path.startswith(self.root + os.sep):
+            raise ValueError(f"Invalid Storage Key {key}")
+        return path
+
+    def open_temp(self, key: str):
+        """在目标文件所在目录创建临时文件，保证可以原子替换"""
+        path = self.path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        return path, tempfile.NamedTemporaryFile(
+            dir=os.path.dirname(path), prefix=".upload-", delete=False
+        )
+
+    def commit_temp(self, temp_file, path: str):
+        """落盘并替换目标文件"""
+        temp_file.flush()
+        os.fsync(temp_file.fileno())
+        temp_file.close()
+        os.replace(temp_file.name, path)
+
+    def discard_temp(self, temp_file):
+        temp_file.close()
+        try:
+            os.remove(temp_file.name)
+        except FileNotFoundError:
+            pass
+
+    def write_object(self, key: str, chunks):
+        """原子写入文件，返回 md5"""
+        md5 = hashlib.md5()
+        path, temp_file = self.open_temp(key)
+        try:
+            for chunk in chunks:
+                md5.update(chunk)
+                temp_file.write(chunk)
+            self.commit_temp(temp_file, path)
+        except Exception:
+            self.discard_temp(temp_file)
+            raise
+        return md5.hexdigest()
+
+    def read_object(self, key: str, chunk_size: int):
+        """分块读取文件"""
+        file = open(self.path(key), "rb")
+
+        def read():
+            with file:
+                yield from iter(lambda: file.read(chunk_size), b"")
+
+        return read()
+
+    def delete_object(self, key: str):
+        os.remove(self.path(key))
+
+    def copy_object(self, source_key: str, key: str):
+        """以硬链接复制，不占用额外空间，不支持时复制文件内容"""
+        source = self.path(source_key)
+        path = self.path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        try:
+            os.link(source, path)
+        except OSError:
+            with open(source, "rb") as file:
+                self.write_object(
+                    key, iter(lambda: file.read(settings.COS_HASH_CHUNK_SIZE), b"")
+                )
+
+    def stat_object(self, key: str):
+        try:
+            stat = os.stat(self.path(key))
+        except FileNotFoundError:
+            return None
+        return {
+            "ETag": '"{:x}-{:x}"'.format(stat.st_mtime_ns, stat.st_size),
+            "Content-Length": stat.st_size,
+        }
+
+    def presign_put(self, key: str, size: int):
+        token = signing.dumps({"key": key, "size": size}, salt=UPLOAD_SALT)
+        return {
+            "method": "PUT",
+            "url": "{}?token={}".format(self.build_url(quote(key)), token),
+            "headers": {},
+        }
+
+    def verify_upload(self, key: str, token: str):
+        """校验直传 token，返回允许上传的大小，无效或已过期时返回 None"""
+        try:
+            data = signing.loads(
+                token, salt=UPLOAD_SALT, max_age=settings.COS_PRESIGN_EXPIRE
+            )
+        except signing.BadSignature:
+            return None
+        if data["key"] != key:
+            return None
+        return data["size"]
+
+    def open_writer(self, filename: str, spool_size: int = None):
+        """以流的方式上传文件，spool_size 仅为与对象存储保持一致"""
+        return LocalFileWriter(self, filename)
+
+    def save(self, filename: str, file: BytesIO, size: int):
+        """保存文件"""
+        log = self.create_log(filename)
+        md5 = self.write_object(
+            f"{log.path}/{filename}",
+            iter(lambda: file.read(settings.COS_HASH_CHUNK_SIZE), b""),
+        )
+        return log, {"ETag": f'"{md5}"', "Size": size}
+
+
+class LocalFileWriter(StorageWriter):
+    """本地文件写入器，写入同目录的临时文件，关闭时原子替换"""
+
+    def __init__(self, storage: LocalStorageClient, filename: str):
+        self.storage = storage
+        self.filename = filename
+        self.log = None
+        self.full_path = None
+        self.path = None
+        self.file = None
+        self.md5 = hashlib.md5()
+        self.size = 0
+        self.closed = False
+        self.result = False
+        self.url = None
+        self.start_at = time.perf_counter()
+
+    def start(self):
+        """创建日志与临时文件"""
+        if self.log is None:
+            self.log = self.storage.create_log(self.filename)
+            self.full_path = f"{self.log.path}/{self.filename}"
+            self.path, self.file = self.storage.open_temp(self.full_path)
+
+    def write(self, data: bytes):
+        self.start()
+        self.file.write(data)
+        self.md5.update(data)
+        self.size += len(data)
+        return len(data)
+
+    def close(self):
+        """落盘并替换目标文件"""
+        if self.closed:
+            return
+        self.closed = True
+        try:
+            self.start()
+            self.storage.commit_temp(self.file, self.path)
+            self.log.response = {"ETag": f'"{self.md5.hexdigest()}"', "Size": self.size}
+            self.log.save()
+            self.url = self.storage.build_url(self.full_path)
+            self.result = True
+            self.storage.metrics.record(
+                "upload", self.size, time.perf_counter() - self.start_at
+            )
+            logger.info("Upload File Success %s (%d bytes)", self.url, self.size)
+        except Exception as err:
+            logger.error("Upload File Error %s", err)
+            self.abort()
+
+    def abort(self):
+        """放弃上传"""
+        self.closed = True
+        if self.file is not None:
+            self.storage.discard_temp(self.file)
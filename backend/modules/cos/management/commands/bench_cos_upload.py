@@ -0,0 +1,54 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from modules.cos.client import build_cos_client, get_cos_client
+from utils.tools import simple_uniq_id
+
+
+class Command(BaseCommand):
+    help = "对比每次新建客户端与复用连接池客户端上传小文件的耗时"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--files", type=int, default=50, help="上传文件数")
+        parser.add_argument("--size", type=int, default=4096, help="文件大小，Bytes")
+
+    def handle(self, *args, **options):
+        credentials = (
+            settings.COS_REGION,
+            settings.TCLOUD_SECRET_ID,
+            settings.TCLOUD_SECRET_KEY,
+        )
+        prefix = f"bench/{simple_uniq_id(settings.COS_RANDOM_PATH_LENGTH)}"
+        body = b"0" * options["size"]
+        modes = {
+            "new client": lambda: build_cos_client(*credentials),
+            "pooled client": lambda: get_cos_client(*credentials),
+        }
+        for name, factory in modes.items():
+            keys = [
+                f"{prefix}/{name.replace(' ', '_')}/{i}"
+                for i in range(options["files"])
+            ]
+            costs = []
+            for key in keys:
+                start = time.perf_counter()
+                factory().put_object(Bucket=settings.COS_BUCKET, Key=key, Body=body)
+                costs.append((time.perf_counter() - start) * 1000)
+            costs.sort()
+            self.stdout.write(
+                "{}: {} files, total: {:.2f}ms, avg: {:.2f}ms, p50: {:.2f}ms, "
+                "p95: {:.2f}ms".format(
+                    name,
+                    len(costs),
+                    sum(costs),
+                    sum(costs) / len(costs),
+                    costs[len(costs) // 2],
+                    costs[int(len(costs) * 0.95)],
+                )
+            )
+            # 清理测试文件
+            client = get_cos_client(*credentials)
+            for key in keys:
+                client.delete_object(Bucket=settings.COS_BUCKET, Key=key)
@@ -0,0 +1,28 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from modules.cos.storage import StorageMetrics
+
+
+class Command(BaseCommand):
+    help = "输出各存储后端上传与下载的次数、字节数与吞吐"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--reset", action="store_true", help="输出后清空统计")
+
+    def handle(self, *args, **options):
+        for backend in settings.STORAGE_BACKENDS:
+            metrics = StorageMetrics(backend)
+            for operation, data in metrics.load().items():
+                self.stdout.write(
+                    "{} {}: {} files, {} bytes, {:.2f}s, {:.2f}MB/s".format(
+                        backend,
+                        operation,
+                        data["count"],
+                        data["bytes"],
+                        data["seconds"],
+                        data["throughput"] / 1024 / 1024,
+                    )
+                )
+            if options["reset"]:
+                metrics.reset()
@@ -0,0 +1,34 @@
+# Generated by Django 4.0.1 on 2026-10-19 13:08
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("cos", "0002_alter_uploadlog_options"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="uploadlog",
+            name="dedup_hits",
+            field=models.IntegerField(default=0, verbose_name="去重命中次数"),
+        ),
+        migrations.AddField(
+            model_name="uploadlog",
+            name="sha256",
+            field=models.CharField(
+                blank=True, max_length=64, null=True, verbose_name="内容摘要"
+            ),
+        ),
+        migrations.AddField(
+            model_name="uploadlog",
+            name="size",
+            field=models.BigIntegerField(blank=True, null=True, verbose_name="文件大小"),
+        ),
+        migrations.AlterIndexTogether(
+            name="uploadlog",
+            index_together={("sha256", "size")},
+        ),
+    ]
@@ -14,8 +14,14 @@ class UploadLog(models.Model):
     response = models.JSONField(_("相应参数"), default=dict)
     operator = models.CharField(_("操作人"), max_length=SHORT_CHAR_LENGTH)
     upload_at = models.DateTimeField(_("上传时间"), auto_now_add=True)
+    sha256 = models.CharField(
+        _("内容摘要"), max_length=MEDIUM_CHAR_LENGTH, null=True, blank=True
+    )
+    size = models.BigIntegerField(_("文件大小"), null=True, blank=True)
+    dedup_hits = models.IntegerField(_("去重命中次数"), default=0)
 
     class Meta:
         db_table = f"{DB_PREFIX}log"
         verbose_name = _("上传日志")
         verbose_name_plural = verbose_name
+        index_together = [["sha256", "size"]]
@@ -0,0 +1,25 @@
+from django.utils.translation import gettext_lazy as _
+from rest_framework import serializers
+
+from constents import MAX_CHAR_LENGTH
+
+
+class PresignUploadSerializer(serializers.Serializer):
+    """直传申请"""
+
+    filename = serializers.CharField(
+        max_length=MAX_CHAR_LENGTH,
+        error_messages={
+            "blank": _("文件名不能为空"),
+            "max_length": _("文件名过长"),
+            "required": _("文件名不能为空"),
+        },
+    )
+    size = serializers.IntegerField(
+        min_value=1,
+        error_messages={
+            "invalid": _("文件大小有误"),
+            "min_value": _("文件不能为空"),
+            "required": _("文件大小不能为空"),
+        },
+    )
@@ -0,0 +1,313 @@
+"""
+存储后端
+1. 由 STORAGE_BACKEND 选择存储后端，可选值见 STORAGE_BACKENDS，
+   业务代码通过 UnionClient.cos 使用，不依赖具体实现
+2. 文件名处理、上传日志、去重由基类实现，后端只负责读写文件
+3. 上传与下载的次数、字节数、耗时按后端记录于 Redis，用于统计吞吐
+4. 直传：签发短期有效的上传地址，浏览器直接上传至存储，完成后校验文件并记录上传日志，
+   文件数据不经过 uWSGI
+"""
+
+import abc
+import datetime
+import hashlib
+import logging
+import time
+from io import BytesIO
+from urllib.parse import unquote
+
+from django.conf import settings
+from django.core import signing
+from django.db import IntegrityError
+from django.db.models import F
+from django.utils.module_loading import import_string
+
+from modules.cos.models import UploadLog
+from utils.tools import get_redis_client, simple_uniq_id
+
+logger = logging.getLogger("cos")
+
+METRIC_OPERATIONS = ("upload", "download")
+PRESIGN_SALT = "modules.cos.storage.presign"
+
+
+class StorageMetrics(object):
+    """存储吞吐统计，以 Redis 哈希存储，字段为 操作:次数/字节数/耗时"""
+
+    def __init__(self, backend: str):
+        self.key = f"Storage:metrics:{backend}"
+        self.redis = get_redis_client()
+
+    def record(self, operation: str, size: int, seconds: float):
+        # 统计失败不影响读写
+        try:
+            pipeline = self.redis.pipeline()
+            pipeline.hincrby(self.key, f"{operation}:count", 1)
+            pipeline.hincrby(self.key, f"{operation}:bytes", size)
+            pipeline.hincrbyfloat(self.key, f"{operation}:seconds", seconds)
+            pipeline.execute()
+        except Exception as err:
+            logger.warning("Record Storage Metrics Error %s", err)
+
+    def load(self):
+        data = {
+            (key.decode() if isinstance(key, bytes) else key): float(value)
+            for key, value in self.redis.hgetall(self.key).items()
+        }
+        metrics = {}
+        for operation in METRIC_OPERATIONS:
+            seconds = data.get(f"{operation}:seconds", 0)
+            size = int(data.get(f"{operation}:bytes", 0))
+            metrics[operation] = {
+                "count": int(data.get(f"{operation}:count", 0)),
+                "bytes": size,
+                "seconds": seconds,
+                "throughput": size / seconds if seconds else 0,
+            }
+        return metrics
+
+    def reset(self):
+        self.redis.delete(self.key)
+
+
+class BaseStorageClient(abc.ABC):
+    """存储客户端基类，子类需设置 backend 与 domain，并实现文件读写"""
+
+    backend = None
+
+    def __init__(self, operator: str):
+        self.operator = operator
+        self.domain = None
+        self.metrics = StorageMetrics(self.backend)
+
+    def verify_filename(self, filename: str):
+        replace_map = {" ": "", "$": "_", "[": "(", "]": ")", "{": "(", "}": ")"}
+        for item, new_item in replace_map.items():
+            filename = filename.replace(item, new_item)
+        if filename.count("(") != filename.count(")") or filename.find(
+            ")"
+        ) < filename.find("("):
+            filename = filename.replace("(", "_").replace(")", "_")
+        return filename
+
+    def build_key(self):
+        """文件存储位置"""
+        return "upload/{date_path}/{random_path}".format(
+            date_path=datetime.datetime.now().strftime("%Y%m/%d"),
+            random_path=simple_uniq_id(settings.COS_RANDOM_PATH_LENGTH),
+        )
+
+    def build_url(self, key: str):
+        return f"{self.domain}/{key}"
+
+    def create_log(self, filename: str):
+        """创建上传日志，存储位置重复时重新生成"""
+        while True:
+            try:
+                return UploadLog.objects.create(
+                    name=filename, path=self.build_key(), operator=self.operator
+                )
+            except IntegrityError:
+                continue
+
+    def get_key(self, url: str):
+        """由访问地址获取存储位置，非本存储的地址返回 None"""
+        prefix = f"{self.domain}/"
+        if not url or not url.startswith(prefix):
+            return None
+        return unquote(url[len(prefix) :].split("?", 1)[0].split("#", 1)[0])
+
+    @abc.abstractmethod
+    def read_object(self, key: str, chunk_size: int):
+        """打开文件并返回分块迭代器，文件不存在时立即抛出异常"""
+
+    def iter_object(self, key: str, chunk_size: int = 64 * 1024):
+        """分块读取文件，读取完成后记录吞吐"""
+        start = time.perf_counter()
+        chunks = self.read_object(key, chunk_size)
+
+        def measure():
+            size = 0
+            for chunk in chunks:
+                size += len(chunk)
+                yield chunk
+            self.metrics.record("download", size, time.perf_counter() - start)
+
+        return measure()
+
+    @abc.abstractmethod
+    def delete_object(self, key: str):
+        """删除文件"""
+
+    @abc.abstractmethod
+    def copy_object(self, source_key: str, key: str):
+        """在存储内复制文件，不经过应用服务器"""
+
+    @abc.abstractmethod
+    def open_writer(self, filename: str, spool_size: int = None):
+        """以流的方式上传文件，写入器需提供 write、close、abort 与 filename、result、url、size、log、full_path"""
+
+    @abc.abstractmethod
+    def save(self, filename: str, file: BytesIO, size: int):
+        """保存文件，返回 上传日志 与 存储响应"""
+
+    @abc.abstractmethod
+    def stat_object(self, key: str):
+        """文件信息，返回 ETag 与 Content-Length，文件不存在时返回 None"""
+
+    @abc.abstractmethod
+    def presign_put(self, key: str, size: int):
+        """签发上传地址，返回 请求方法、地址 与 需要携带的请求头"""
+
+    def presign_upload(self, filename: str, size: int):
+        """签发直传地址，token 用于完成上传时校验"""
+        path = self.build_key()
+        upload = self.presign_put(f"{path}/{filename}", size)
+        upload["token"] = signing.dumps(
+            {"path": path, "name": filename, "size": size, "operator": self.operator},
+            salt=PRESIGN_SALT,
+        )
+        upload["expire"] = settings.COS_PRESIGN_EXPIRE
+        return upload
+
+    def complete_upload(self, token: str):
+        """
+        完成直传，校验文件已上传且大小一致后记录上传日志
+        返回 文件名 与 地址，token 无效、已过期或文件未上传时返回 None
+        """
+        try:
+            data = signing.loads(
+                token, salt=PRESIGN_SALT, max_age=settings.COS_PRESIGN_COMPLETE_TIMEOUT
+            )
+        except signing.BadSignature:
+            return None
+        if data["operator"] != self.operator:
+            return None
+        full_path = f"{data['path']}/{data['name']}"
+        stat = self.stat_object(full_path)
+        if stat is None or stat["Content-Length"] != data["size"]:
+            return None
+        # 重复提交时不重复记录
+        UploadLog.objects.get_or_create(
+            path=data["path"],
+            defaults={
+                "name": data["name"],
+                "operator": self.operator,
+                "response": stat,
+                "size": data["size"],
+            },
+        )
+        return data["name"], self.build_url(full_path)
+
+    def file_digest(self, file: BytesIO):
+        """分块计算文件的 sha256 与大小"""
+        sha256 = hashlib.sha256()
+        size = 0
+        file.seek(0)
+        for chunk in iter(lambda: file.read(settings.COS_HASH_CHUNK_SIZE), b""):
+            sha256.update(chunk)
+            size += len(chunk)
+        file.seek(0)
+        return sha256.hexdigest(), size
+
+    def find_duplicate(self, sha256: str, size: int, filename: str):
+        """
+        查找内容相同的已上传文件，返回以 filename 命名的地址
+        已有文件的文件名不同时在存储内复制为新文件并记录上传日志，无需重新上传
+        复制失败时返回 None
+        """
+        logs = UploadLog.objects.filter(sha256=sha256, size=size).order_by("id")
+        log = logs.filter(name=filename).first() or logs.first()
+        if log is None:
+            return None
+        UploadLog.objects.filter(id=log.id).update(dedup_hits=F("dedup_hits") + 1)
+        if log.name == filename:
+            return self.build_url(f"{log.path}/{log.name}")
+        new_log = self.create_log(filename)
+        try:
+            self.copy_object(f"{log.path}/{log.name}", f"{new_log.path}/{filename}")
+        except Exception as err:
+            logger.error("Copy Duplicate File Error %s", err)
+            new_log.delete()
+            return None
+        new_log.response = {"CopySource": f"{log.path}/{log.name}"}
+        new_log.sha256 = sha256
+        new_log.size = size
+        new_log.save()
+        return self.build_url(f"{new_log.path}/{filename}")
+
+    def deduplicate(self, writer, sha256: str, size: int):
+        """
+        流式上传完成后去重，已有同名且内容相同的文件时删除本次上传的文件并返回已有地址
+        文件名不同时保留本次上传的文件
+        """
+        log = (
+            UploadLog.objects.filter(sha256=sha256, size=size, name=writer.filename)
+            .order_by("id")
+            .first()
+        )
+        if log is None:
+            UploadLog.objects.filter(id=writer.log.id).update(sha256=sha256, size=size)
+            return writer.url
+        UploadLog.objects.filter(id=log.id).update(dedup_hits=F("dedup_hits") + 1)
+        url = self.build_url(f"{log.path}/{log.name}")
+        try:
+            self.delete_object(writer.full_path)
+            writer.log.delete()
+        except Exception as err:
+            logger.error("Delete Duplicate File Error %s", err)
+        logger.info("Upload File Deduplicated %s", url)
+        return url
+
+    def upload(self, filename: str, file: BytesIO):
+        """
+        上传文件
+        1. 内容与已上传文件相同时不再上传，返回以本次文件名命名的地址
+        2. 由后端保存文件，并记录吞吐
+        """
+        sha256, size = self.file_digest(file)
+        url = self.find_duplicate(sha256, size, filename)
+        if url is not None:
+            logger.info("Upload File Deduplicated %s", url)
+            return True, url
+        start = time.perf_counter()
+        try:
+            log, resp = self.save(filename, file, size)
+        except Exception as err:
+            logger.error("Upload File Error %s", err)
+            return False, None
+        self.metrics.record("upload", size, time.perf_counter() - start)
+        log.response = resp
+        log.sha256 = sha256
+        log.size = size
+        log.save()
+        url = self.build_url(f"{log.path}/{filename}")
+        logger.info("Upload File Success %s (%d bytes)", url, size)
+        return True, url
+
+
+class StorageWriter(object):
+    """流式写入器基类，只支持追加写入，可直接作为 zipfile 的输出"""
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
+    def writable(self):
+        return True
+
+    def seekable(self):
+        return False
+
+    def flush(self):
+        pass
+
+
+def get_storage_client(operator: str):
+    """按 STORAGE_BACKEND 创建存储客户端"""
+    return import_string(settings.STORAGE_BACKENDS[settings.STORAGE_BACKEND])(operator)
@@ -1,9 +1,12 @@
+from django.urls import path
 from rest_framework.routers import SimpleRouter
 
-from modules.cos.views import UploadFileView, UploadAvatarView
+from modules.cos.views import LocalFileView, UploadFileView, UploadAvatarView
 
 router = SimpleRouter()
 router.register("upload", UploadFileView)
 router.register("upload_avatar", UploadAvatarView)
 
-urlpatterns = router.urls
+urlpatterns = [
+    path("files/<path:key>", LocalFileView.as_view()),
+] + router.urls
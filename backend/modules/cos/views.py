@@ -1,16 +1,49 @@
+import mimetypes
 import os
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import quote
 
 from django.conf import settings
 from django.core.files import temp
 from django.core.files.uploadedfile import InMemoryUploadedFile
+from django.db import connection, transaction
+from django.http import FileResponse, HttpResponse
 from django.utils.translation import gettext as _
 from django.utils.translation import ngettext
+from django.views import View
+from rest_framework.decorators import action
 from rest_framework.response import Response
 from rest_framework.viewsets import GenericViewSet
 
+from modules.cel.tasks import generate_avatar_thumbs
+from modules.cos.handlers import (
+    COSStreamUploadHandler,
+    SizeLimitUploadHandler,
+    StreamedUploadedFile,
+)
+from modules.cos.local import LocalStorageClient
 from modules.cos.models import UploadLog
+from modules.cos.serializers import PresignUploadSerializer
 from utils.client import get_client_by_user, UnionClient
-from utils.exceptions import ServerError, OperationError
+from utils.exceptions import (
+    ServerError,
+    OperationError,
+    ParamsNotFound,
+    bad_request,
+    page_not_found,
+    permission_denied,
+)
+
+
+def size_exceeded_error(limit: int):
+    return OperationError(
+        ngettext(
+            "请上传 %(limit)dM 以内文件",
+            "请上传 %(limit)dM 以内文件",
+            limit // 1024 // 1024,
+        )
+        % {"limit": limit // 1024 // 1024}
+    )
 
 
 class UploadAvatarView(GenericViewSet):
@@ -18,19 +51,21 @@ class UploadAvatarView(GenericViewSet):
 
     queryset = UploadLog.objects.all()
 
+    def initialize_request(self, request, *args, **kwargs):
+        # 接收过程中校验大小
+        request.upload_handlers.insert(
+            0, SizeLimitUploadHandler(request, settings.COS_MAX_AVATAR_SIZE)
+        )
+        return super().initialize_request(request, *args, **kwargs)
+
     def create(self, request, *args, **kwargs):
         """上传头像"""
         # 校验文件
         file = request.FILES.get("file")
-        if file.size > settings.COS_MAX_AVATAR_SIZE:
-            raise OperationError(
-                ngettext(
-                    "请上传 %(limit)dM 以内文件",
-                    "请上传 %(limit)dM 以内文件",
-                    settings.COS_MAX_AVATAR_SIZE // 1024 // 1024,
-                )
-                % {"limit": settings.COS_MAX_AVATAR_SIZE // 1024 // 1024}
-            )
+        if getattr(request._request, "upload_exceeded", False) or (
+            file.size > settings.COS_MAX_AVATAR_SIZE
+        ):
+            raise size_exceeded_error(settings.COS_MAX_AVATAR_SIZE)
         # 上传文件
         client = get_client_by_user(request.user.uid)
         filename = client.cos.verify_filename(file.name)
@@ -38,6 +73,8 @@ class UploadAvatarView(GenericViewSet):
         if result:
             request.user.avatar = url
             request.user.save()
+            uid = request.user.uid
+            transaction.on_commit(lambda: generate_avatar_thumbs.delay(uid))
             return Response()
         else:
             raise ServerError(_("上传失败，请稍后再试"))
@@ -48,15 +85,31 @@ class UploadFileView(GenericViewSet):
 
     queryset = UploadLog.objects.all()
 
+    def initialize_request(self, request, *args, **kwargs):
+        # 接收过程中校验大小，较大的请求边接收边上传
+        request.upload_handlers.insert(
+            0, COSStreamUploadHandler(request, settings.COS_MAX_FILE_SIZE)
+        )
+        return super().initialize_request(request, *args, **kwargs)
+
     def upload(self, client: UnionClient, file: InMemoryUploadedFile):
         """上传文件"""
+        # 接收时已上传
+        if isinstance(file, StreamedUploadedFile):
+            if file.url is None:
+                raise ServerError(_("上传失败，请稍后再试"))
+            return {"filename": file.name, "url": file.url}
         # 优化用户名与文件数据流
         file_name = client.cos.verify_filename(file.name)
         file = file.file
         if os.name == "nt" and isinstance(file, temp.TemporaryFile):
             file = file.file
         # 上传文件
-        result, url = client.cos.upload(file_name, file)
+        try:
+            result, url = client.cos.upload(file_name, file)
+        finally:
+            # 在线程中执行，释放线程的数据库连接
+            connection.close()
         if result:
             return {"filename": file_name, "url": url}
         else:
@@ -66,19 +119,97 @@ class UploadFileView(GenericViewSet):
         """上传文件"""
         # 逐个校验文件
         files = request.FILES
+        if getattr(request._request, "upload_exceeded", False):
+            raise size_exceeded_error(settings.COS_MAX_FILE_SIZE)
         for file in files.values():
             if file.size > settings.COS_MAX_FILE_SIZE:
-                raise OperationError(
-                    ngettext(
-                        "请上传 %(limit)dM 以内文件",
-                        "请上传 %(limit)dM 以内文件",
-                        settings.COS_MAX_FILE_SIZE // 1024 // 1024,
-                    )
-                    % {"limit": settings.COS_MAX_FILE_SIZE // 1024 // 1024}
-                )
-        # 逐个上传
+                raise size_exceeded_error(settings.COS_MAX_FILE_SIZE)
+        # 并行上传
         client = get_client_by_user(request.user.uid)
-        file_list = []
-        for file in files.values():
-            file_list.append(self.upload(client, file))
+        with ThreadPoolExecutor(max_workers=settings.COS_UPLOAD_THREADS) as pool:
+            file_list = list(
+                pool.map(lambda file: self.upload(client, file), files.values())
+            )
         return Response(file_list)
+
+    @action(detail=False, methods=["POST"])
+    def presign(self, request, *args, **kwargs):
+        """签发直传地址，文件由浏览器直接上传至存储"""
+        serializer = PresignUploadSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        if serializer.validated_data["size"] > settings.COS_MAX_FILE_SIZE:
+            raise size_exceeded_error(settings.COS_MAX_FILE_SIZE)
+        client = get_client_by_user(request.user.uid)
+        filename = client.cos.verify_filename(serializer.validated_data["filename"])
+        return Response(
+            client.cos.presign_upload(filename, serializer.validated_data["size"])
+        )
+
+    @action(detail=False, methods=["POST"])
+    def complete(self, request, *args, **kwargs):
+        """直传完成，校验文件并记录上传日志"""
+        token = request.data.get("token")
+        if not token:
+            raise ParamsNotFound(_("token 不能为空"))
+        client = get_client_by_user(request.user.uid)
+        result = client.cos.complete_upload(token)
+        if result is None:
+            raise OperationError(_("文件未上传或上传已过期"))
+        filename, url = result
+        return Response({"filename": filename, "url": url})
+
+
+class LocalFileView(View):
+    """
+    本地存储文件下载与直传
+    1. 配置 LOCAL_STORAGE_ACCEL_PREFIX 时只返回 X-Accel-Redirect，由 Nginx 发送文件，
+       否则以 FileResponse 返回，由 uWSGI 通过 sendfile 发送
+    2. PUT 上传需携带直传地址中的 token，请求体大小须与申请时一致
+    3. 只返回有上传日志的上传文件，存储目录中的其他文件(如写入中的临时文件)不对外提供
+    """
+
+    @staticmethod
+    def is_uploaded(key: str):
+        path, _, name = key.rpartition("/")
+        return (
+            path.startswith("upload/")
+            and not name.startswith(".upload-")
+            and UploadLog.objects.filter(path=path, name=name).exists()
+        )
+
+    def get(self, request, key: str, *args, **kwargs):
+        if settings.STORAGE_BACKEND != LocalStorageClient.backend:
+            return page_not_found(request, None)
+        if not self.is_uploaded(key):
+            return page_not_found(request, None)
+        storage = LocalStorageClient(operator=None)
+        try:
+            path = storage.path(key)
+        except ValueError:
+            return page_not_found(request, None)
+        if not os.path.isfile(path):
+            return page_not_found(request, None)
+        content_type = mimetypes.guess_type(path)[0] or "application/octet-stream"
+        if settings.LOCAL_STORAGE_ACCEL_PREFIX:
+            response = HttpResponse(content_type=content_type)
+            response["X-Accel-Redirect"] = "{}/{}".format(
+                settings.LOCAL_STORAGE_ACCEL_PREFIX.rstrip("/"), quote(key)
+            )
+            return response
+        return FileResponse(open(path, "rb"), content_type=content_type)
+
+    def put(self, request, key: str, *args, **kwargs):
+        if settings.STORAGE_BACKEND != LocalStorageClient.backend:
+            return page_not_found(request, None)
+        storage = LocalStorageClient(operator=None)
+        size = storage.verify_upload(key, request.GET.get("token", ""))
+        if size is None:
+            return permission_denied(request, None)
+        if int(request.META.get("CONTENT_LENGTH") or 0) != size:
+            return bad_request(request, None)
+        md5 = storage.write_object(
+            key, iter(lambda: request.read(settings.COS_HASH_CHUNK_SIZE), b"")
+        )
+        response = HttpResponse()
+        response["ETag"] = f'"{md5}"'
+        return response
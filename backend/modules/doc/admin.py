@@ -4,6 +4,8 @@ from django.utils.translation import gettext_lazy as _
 
 from modules.doc.models import (
     Doc,
+    DocContent,
+    DocImport,
     DocVersion,
     Comment,
     CommentVersion,
@@ -41,9 +43,30 @@ class DocAdmin(admin.ModelAdmin):
         return get_user_model().objects.get(uid=obj.update_by).username
 
 
+@admin.register(DocContent)
+class DocContentAdmin(admin.ModelAdmin):
+    list_display = ["doc_id", "doc_title"]
+    search_fields = ["doc_id"]
+
+    @admin.display(description=_("标题"))
+    def doc_title(self, obj):
+        return Doc.objects.get(id=obj.doc_id).title
+
+
 @admin.register(DocVersion)
-class DocAdmin(DocAdmin):
-    pass
+class DocVersionAdmin(DocAdmin):
+    exclude = ["content"]
+    readonly_fields = [
+        "id",
+        "content_format",
+        "base_version_id",
+        "keyframe_id",
+        "full_content",
+    ]
+
+    @admin.display(description=_("内容"))
+    def full_content(self, obj):
+        return obj.get_content()
 
 
 @admin.register(DocCollaborator)
@@ -77,7 +100,8 @@ class CommentAdmin(admin.ModelAdmin):
 
 @admin.register(CommentVersion)
 class CommentVersionAdmin(CommentAdmin):
-    pass
+    # 版本内容压缩存储，无法按内容搜索
+    search_fields = ["id"]
 
 
 @admin.register(PinDoc)
@@ -100,3 +124,19 @@ class PinDocAdmin(admin.ModelAdmin):
     @admin.display(description=_("操作人"))
     def operator_name(self, obj):
         return get_user_model().objects.get(uid=obj.operator).username
+
+
+@admin.register(DocImport)
+class DocImportAdmin(admin.ModelAdmin):
+    list_display = [
+        "id",
+        "repo_id",
+        "filename",
+        "status",
+        "processed",
+        "total",
+        "imported",
+        "creator",
+        "create_at",
+    ]
+    list_filter = ["status"]
@@ -0,0 +1,65 @@
+"""
+文章版本增量编码
+
+增量为 JSON 数组，按顺序描述如何由基准内容得到目标内容
+1. 正整数 n：复制基准内容的 n 行
+2. 负整数 -n：跳过基准内容的 n 行
+3. 字符串：插入文本
+"""
+
+import json
+from difflib import SequenceMatcher, unified_diff
+
+
+def diff_lines(base: str, target: str):
+    """生成增量，同时返回行级编辑距离(变更涉及的字符数)"""
+    base_lines = base.splitlines(keepends=True)
+    target_lines = target.splitlines(keepends=True)
+    ops = []
+    distance = 0
+    matcher = SequenceMatcher(None, base_lines, target_lines)
+    for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+        if tag == "equal":
+            ops.append(i2 - i1)
+            continue
+        removed = sum(len(line) for line in base_lines[i1:i2])
+        inserted = "".join(target_lines[j1:j2])
+        distance += max(removed, len(inserted))
+        if i2 > i1:
+            ops.append(i1 - i2)
+        if inserted:
+            ops.append(inserted)
+    return json.dumps(ops, ensure_ascii=False, separators=(",", ":")), distance
+
+
+def make_delta(base: str, target: str):
+    """生成增量"""
+    return diff_lines(base, target)[0]
+
+
+def apply_delta(base: str, delta: str):
+    """应用增量"""
+    base_lines = base.splitlines(keepends=True)
+    pos = 0
+    result = []
+    for op in json.loads(delta):
+        if isinstance(op, str):
+            result.append(op)
+        elif op > 0:
+            result.extend(base_lines[pos : pos + op])
+            pos += op
+        else:
+            pos -= op
+    return "".join(result)
+
+
+def make_diff(base: str, target: str, from_name: str = "", to_name: str = ""):
+    """生成行级 unified diff"""
+    return "".join(
+        unified_diff(
+            (base or "").splitlines(keepends=True),
+            (target or "").splitlines(keepends=True),
+            fromfile=from_name,
+            tofile=to_name,
+        )
+    )
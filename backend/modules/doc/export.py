@@ -0,0 +1,106 @@
+"""
+文章导出
+内容与评论由生成器逐段输出，zip 格式写入只追加的内存缓冲区，每写入一段即输出，
+附件由 COS 分块读取后写入 zip，全程不落地文件
+"""
+
+import logging
+import os
+import re
+import zipfile
+
+from django.conf import settings
+
+from modules.doc.models import Doc, Comment
+from utils.client import UnionClient
+
+logger = logging.getLogger("app")
+
+COMMENT_SEPARATOR = "\n\n---\n\n"
+
+
+class StreamBuffer(object):
+    """只追加写入的缓冲区，作为 zipfile 的输出，由生成器取出已写入的数据"""
+
+    def __init__(self):
+        self.chunks = []
+
+    def writable(self):
+        return True
+
+    def seekable(self):
+        return False
+
+    def write(self, data: bytes):
+        self.chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def pop(self):
+        data = b"".join(self.chunks)
+        self.chunks = []
+        return data
+
+
+def doc_filename(doc: Doc):
+    return "{}.md".format(doc.title.replace(" ", "").replace("/", ""))
+
+
+def iter_comments(doc: Doc):
+    """逐条读取评论内容"""
+    return (
+        Comment.objects.filter(doc_id=doc.id, is_deleted=False)
+        .order_by("-id")
+        .values_list("content", flat=True)
+        .iterator(chunk_size=settings.EXPORT_CHUNK_SIZE)
+    )
+
+
+def iter_markdown(doc: Doc):
+    """文章内容与评论"""
+    yield (doc.content or "").encode("utf-8")
+    for content in iter_comments(doc):
+        yield (COMMENT_SEPARATOR + content).encode("utf-8")
+
+
+def find_attachments(doc: Doc, client: UnionClient):
+    """文章附件与正文中引用的本站文件，返回 文件名 与 存储位置"""
+    urls = list((doc.attachments or {}).values())
+    pattern = r"{}/[^\s)\"'<>\]]+".format(re.escape(client.cos.domain))
+    urls.extend(re.findall(pattern, doc.content or ""))
+    attachments = {}
+    for url in urls:
+        key = client.cos.get_key(url)
+        if key is None or key in attachments.values():
+            continue
+        name, ext = os.path.splitext(os.path.basename(key))
+        filename = f"{name}{ext}"
+        index = 1
+        while filename in attachments:
+            filename = f"{name}({index}){ext}"
+            index += 1
+        attachments[filename] = key
+    return attachments
+
+
+def iter_zip(doc: Doc, client: UnionClient):
+    """文章、评论与附件打包为 zip"""
+    buffer = StreamBuffer()
+    with zipfile.ZipFile(buffer, "w", zipfile.ZIP_DEFLATED) as zip_file:
+        with zip_file.open(doc_filename(doc), "w") as file:
+            for chunk in iter_markdown(doc):
+                file.write(chunk)
+                yield buffer.pop()
+        for filename, key in find_attachments(doc, client).items():
+            try:
+                chunks = client.cos.iter_object(key)
+            except Exception as err:
+                logger.error("[export doc] fetch attachment %s failed %s", key, err)
+                continue
+            with zip_file.open(f"attachments/{filename}", "w") as file:
+                for chunk in chunks:
+                    file.write(chunk)
+                    yield buffer.pop()
+    yield buffer.pop()
@@ -0,0 +1,143 @@
+"""
+文章导入
+1. 压缩包分块下载至临时文件，逐个读取 markdown 文件，不整体解压
+2. 每 IMPORT_BATCH_SIZE 篇文章批量写入 文章、内容、版本关键帧，
+   并在同一事务中更新已处理文件数，任务重试时从已处理位置继续，不会重复导入
+"""
+
+import os
+import re
+import tempfile
+import zipfile
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Max
+
+from constents import (
+    MEDIUM_CHAR_LENGTH,
+    DocImportStatusChoices,
+    DocVersionFormatChoices,
+)
+from modules.doc.models import Doc, DocBase, DocContent, DocImport, DocVersion
+from utils.client import get_client_by_user
+
+MARKDOWN_EXTENSIONS = (".md", ".markdown")
+# 仓库导出的文件名以 [文章id] 开头
+EXPORT_PREFIX = re.compile(r"^\[\d+\]")
+
+
+def is_markdown(info: zipfile.ZipInfo):
+    if info.is_dir() or info.file_size > settings.IMPORT_MAX_DOC_SIZE:
+        return False
+    if info.filename.startswith("__MACOSX/"):
+        return False
+    name = os.path.basename(info.filename)
+    return not name.startswith(".") and name.lower().endswith(MARKDOWN_EXTENSIONS)
+
+
+def parse_title(filename: str):
+    """由文件名获取标题"""
+    title = os.path.splitext(os.path.basename(filename))[0]
+    title = EXPORT_PREFIX.sub("", title).strip()
+    return title[:MEDIUM_CHAR_LENGTH] or "untitled"
+
+
+def read_entry(zip_file: zipfile.ZipFile, info: zipfile.ZipInfo):
+    """读取单个文件，返回 标题 与 内容"""
+    with zip_file.open(info) as file:
+        content = file.read().decode("utf-8-sig", errors="replace")
+    return parse_title(info.filename), content
+
+
+def bulk_create_docs(docs: list):
+    """
+    批量创建文章并获取 id
+    MySQL 不返回批量插入的主键，在同一事务中按 id 顺序读取本批插入的文章，
+    其他事务创建的文章已有内容，予以排除
+    """
+    if connection.features.can_return_rows_from_bulk_insert:
+        return Doc.objects.bulk_create(docs)
+    floor = Doc.objects.aggregate(max_id=Max("id"))["max_id"] or 0
+    Doc.objects.bulk_create(docs)
+    doc = docs[0]
+    doc_ids = list(
+        Doc.objects.filter(id__gt=floor, repo_id=doc.repo_id, creator=doc.creator)
+        .exclude(id__in=DocContent.objects.filter(doc_id__gt=floor).values("doc_id"))
+        .order_by("id")
+        .values_list("id", flat=True)
+    )
+    if len(doc_ids) != len(docs):
+        raise Exception("Bulk Create Docs Error")
+    for doc, doc_id in zip(docs, doc_ids):
+        doc.id = doc_id
+    return docs
+
+
+def save_batch(doc_import: DocImport, entries: list, processed: int):
+    """写入一批文章并更新进度"""
+    base_fields = [field.attname for field in DocBase._meta.fields]
+    with transaction.atomic():
+        docs = bulk_create_docs(
+            [
+                Doc(repo_id=doc_import.repo_id, title=title, creator=doc_import.creator)
+                for title, _ in entries
+            ]
+        )
+        DocContent.objects.bulk_create(
+            [
+                DocContent(doc_id=doc.id, content=content, attachments={})
+                for doc, (_, content) in zip(docs, entries)
+            ],
+            batch_size=settings.IMPORT_BATCH_SIZE,
+        )
+        for doc, (_, content) in zip(docs, entries):
+            DocContent.objects.save_legacy(doc.id, content=content, attachments={})
+        DocVersion.objects.bulk_create(
+            [
+                DocVersion(
+                    id=doc.id,
+                    content=content,
+                    attachments={},
+                    content_format=DocVersionFormatChoices.FULL,
+                    content_hash=DocVersion.objects.make_hash(doc.title, content),
+                    **{name: getattr(doc, name) for name in base_fields},
+                )
+                for doc, (_, content) in zip(docs, entries)
+            ],
+            batch_size=settings.IMPORT_BATCH_SIZE,
+        )
+        doc_import.processed = processed
+        doc_import.imported += len(docs)
+        doc_import.save(update_fields=["processed", "imported", "update_at"])
+
+
+def download(doc_import: DocImport, file):
+    """分块下载压缩包"""
+    cos = get_client_by_user(doc_import.creator).cos
+    for chunk in cos.iter_object(doc_import.path):
+        file.write(chunk)
+    file.seek(0)
+
+
+def run_import(doc_import: DocImport):
+    """执行导入，从已处理的文件继续"""
+    doc_import.status = DocImportStatusChoices.RUNNING
+    doc_import.error = None
+    doc_import.save(update_fields=["status", "error", "update_at"])
+    with tempfile.TemporaryFile() as file:
+        download(doc_import, file)
+        with zipfile.ZipFile(file) as zip_file:
+            infos = [info for info in zip_file.infolist() if is_markdown(info)]
+            doc_import.total = len(infos)
+            doc_import.save(update_fields=["total", "update_at"])
+            entries = []
+            for index in range(doc_import.processed, len(infos)):
+                entries.append(read_entry(zip_file, infos[index]))
+                if len(entries) >= settings.IMPORT_BATCH_SIZE:
+                    save_batch(doc_import, entries, index + 1)
+                    entries = []
+            if entries:
+                save_batch(doc_import, entries, len(infos))
+    doc_import.status = DocImportStatusChoices.SUCCESS
+    doc_import.save(update_fields=["status", "update_at"])
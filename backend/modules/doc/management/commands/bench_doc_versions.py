@@ -0,0 +1,57 @@
+import random
+import time
+
+from django.core.management.base import BaseCommand
+
+from modules.doc.models import DocVersion
+
+
+class Command(BaseCommand):
+    help = "统计文章版本增量存储节省的空间与版本还原耗时"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--docs", type=int, default=100, help="抽样文章数")
+        parser.add_argument("--samples", type=int, default=200, help="还原耗时抽样版本数")
+
+    def handle(self, *args, **options):
+        doc_ids = list(
+            DocVersion.objects.order_by("-id")
+            .values_list("id", flat=True)
+            .distinct()[: options["docs"]]
+        )
+        # 存储空间
+        stored_bytes = 0
+        full_bytes = 0
+        versions = []
+        for doc_id in doc_ids:
+            for version, content, _depth in DocVersion.objects.iter_history(doc_id):
+                stored_bytes += len((version.content or "").encode("utf-8"))
+                full_bytes += len((content or "").encode("utf-8"))
+                versions.append(version.version_id)
+        saved = 1 - stored_bytes / full_bytes if full_bytes else 0
+        self.stdout.write(
+            "docs: {}, versions: {}, full: {} bytes, stored: {} bytes, saved: {:.2%}".format(
+                len(doc_ids), len(versions), full_bytes, stored_bytes, saved
+            )
+        )
+        # 还原耗时
+        samples = random.sample(versions, min(len(versions), options["samples"]))
+        costs = []
+        for version_id in samples:
+            start = time.perf_counter()
+            version = DocVersion.objects.get(version_id=version_id)
+            version.get_content()
+            costs.append((time.perf_counter() - start) * 1000)
+        if not costs:
+            return
+        costs.sort()
+        self.stdout.write(
+            "reconstruct {} versions, avg: {:.2f}ms, p50: {:.2f}ms, "
+            "p95: {:.2f}ms, max: {:.2f}ms".format(
+                len(costs),
+                sum(costs) / len(costs),
+                costs[len(costs) // 2],
+                costs[int(len(costs) * 0.95)],
+                costs[-1],
+            )
+        )
@@ -0,0 +1,101 @@
+import random
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+
+from modules.doc.models import DocVersion, CommentVersion
+from utils.fields import CompressedValue
+
+
+class Command(BaseCommand):
+    help = "统计压缩文本字段的存储大小、读取耗时与 InnoDB 缓冲池命中率"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--samples", type=int, default=500, help="抽样记录数")
+
+    def handle(self, *args, **options):
+        for model in [DocVersion, CommentVersion]:
+            self.bench_model(model, options["samples"])
+
+    def bench_model(self, model, samples: int):
+        table = model._meta.db_table
+        pks = list(model.objects.values_list("pk", flat=True))
+        pks = random.sample(pks, min(len(pks), samples))
+        if not pks:
+            self.stdout.write(f"{table}: empty")
+            return
+        # 存储大小
+        stored_bytes = 0
+        text_bytes = 0
+        for value in model.objects.filter(pk__in=pks).values_list("content", flat=True):
+            if isinstance(value, CompressedValue):
+                stored_bytes += len(value)
+                value = value.decompress()
+            else:
+                stored_bytes += len((value or "").encode("utf-8"))
+            text_bytes += len((value or "").encode("utf-8"))
+        ratio = stored_bytes / text_bytes if text_bytes else 0
+        self.stdout.write(
+            f"{table}: rows: {len(pks)}, text: {text_bytes} bytes, "
+            f"stored: {stored_bytes} bytes, ratio: {ratio:.2%}"
+        )
+        # 读取耗时，区分是否访问内容
+        status_before = self.buffer_pool_status()
+        costs = {"metadata": [], "content": []}
+        for pk in pks:
+            start = time.perf_counter()
+            instance = model.objects.get(pk=pk)
+            costs["metadata"].append((time.perf_counter() - start) * 1000)
+            # 首次访问内容时解压
+            start = time.perf_counter()
+            getattr(instance, "content")
+            costs["content"].append(
+                costs["metadata"][-1] + (time.perf_counter() - start) * 1000
+            )
+        status_after = self.buffer_pool_status()
+        for name, items in costs.items():
+            items.sort()
+            self.stdout.write(
+                "{} read {}: avg: {:.3f}ms, p50: {:.3f}ms, p95: {:.3f}ms".format(
+                    table,
+                    name,
+                    sum(items) / len(items),
+                    items[len(items) // 2],
+                    items[int(len(items) * 0.95)],
+                )
+            )
+        # 缓冲池命中率
+        if status_before and status_after:
+            requests = (
+                status_after["Innodb_buffer_pool_read_requests"]
+                - status_before["Innodb_buffer_pool_read_requests"]
+            )
+            reads = (
+                status_after["Innodb_buffer_pool_reads"]
+                - status_before["Innodb_buffer_pool_reads"]
+            )
+            hit_rate = 1 - reads / requests if requests else 1
+            self.stdout.write(
+                f"{table} buffer pool: read requests: {requests}, "
+                f"disk reads: {reads}, hit rate: {hit_rate:.2%}, "
+                f"data length: {self.table_size(table)} bytes"
+            )
+
+    def buffer_pool_status(self):
+        """InnoDB 缓冲池读取统计，仅 MySQL 可用"""
+        if connection.vendor != "mysql":
+            return None
+        with connection.cursor() as cursor:
+            cursor.execute("SHOW GLOBAL STATUS LIKE 'Innodb_buffer_pool_read%'")
+            return {name: int(value) for name, value in cursor.fetchall()}
+
+    def table_size(self, table: str):
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT DATA_LENGTH FROM information_schema.TABLES "
+                "WHERE TABLE_SCHEMA=DATABASE() AND TABLE_NAME=%s",
+                [table],
+            )
+            row = cursor.fetchone()
+        return row[0] if row else 0
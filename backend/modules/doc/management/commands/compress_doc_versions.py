@@ -0,0 +1,82 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from constents import DocVersionFormatChoices
+from modules.doc.delta import make_delta
+from modules.doc.models import DocVersion
+
+
+class Command(BaseCommand):
+    help = "将已有的全量文章版本分批转换为 关键帧 + 增量 存储"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=100, help="每批处理的文章数")
+        parser.add_argument("--dry-run", action="store_true", help="仅统计，不写入")
+
+    def handle(self, *args, **options):
+        stat = {"docs": 0, "versions": 0, "bytes_before": 0, "bytes_after": 0}
+        last_doc_id = 0
+        while True:
+            doc_ids = list(
+                DocVersion.objects.filter(id__gt=last_doc_id)
+                .order_by("id")
+                .values_list("id", flat=True)
+                .distinct()[: options["batch_size"]]
+            )
+            if not doc_ids:
+                break
+            last_doc_id = doc_ids[-1]
+            with transaction.atomic():
+                for doc_id in doc_ids:
+                    self.compress_doc(doc_id, stat, options["dry_run"])
+            self.stdout.write(
+                "doc <= {} done, {} versions converted".format(
+                    last_doc_id, stat["versions"]
+                )
+            )
+        self.stdout.write(
+            self.style.SUCCESS(
+                "docs: {docs}, versions: {versions}, "
+                "bytes: {bytes_before} -> {bytes_after}".format(**stat)
+            )
+        )
+
+    def compress_doc(self, doc_id: int, stat: dict, dry_run: bool):
+        """转换单篇文章"""
+        changed = []
+        depths = {}
+        previous = None
+        for version, content, _depth in DocVersion.objects.iter_history(doc_id):
+            if version.content_format == DocVersionFormatChoices.DELTA:
+                depth = depths.get(version.base_version_id, 0) + 1
+            else:
+                depth = 0
+                if (
+                    content is not None
+                    and previous is not None
+                    and previous[1] is not None
+                    and previous[2] + 1 < settings.DOC_VERSION_KEYFRAME_INTERVAL
+                ):
+                    delta = make_delta(previous[1], content)
+                    if len(delta) < len(content):
+                        stat["bytes_before"] += len(content.encode("utf-8"))
+                        stat["bytes_after"] += len(delta.encode("utf-8"))
+                        version.content = delta
+                        version.content_format = DocVersionFormatChoices.DELTA
+                        version.base_version_id = previous[0].version_id
+                        version.keyframe_id = (
+                            previous[0].keyframe_id or previous[0].version_id
+                        )
+                        depth = previous[2] + 1
+                        changed.append(version)
+            depths[version.version_id] = depth
+            previous = (version, content, depth)
+        stat["docs"] += 1
+        stat["versions"] += len(changed)
+        if changed and not dry_run:
+            DocVersion.objects.bulk_update(
+                changed,
+                ["content", "content_format", "base_version_id", "keyframe_id"],
+                batch_size=100,
+            )
@@ -0,0 +1,32 @@
+import logging
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from modules.doc.pins import dispatch_due_pins
+
+logger = logging.getLogger("app")
+
+
+class Command(BaseCommand):
+    help = "常驻进程，每 PIN_DISPATCH_INTERVAL 秒取消已到期的置顶"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--once", action="store_true", help="处理一次后退出")
+
+    def handle(self, *args, **options):
+        while True:
+            try:
+                count = dispatch_due_pins()
+                if count:
+                    logger.info("[dispatch_pin_expiry] %d pins expired", count)
+            except Exception as err:
+                logger.error("[dispatch_pin_expiry] %s", err)
+            finally:
+                # 长时间运行，丢弃失效的数据库连接
+                close_old_connections()
+            if options["once"]:
+                return
+            time.sleep(settings.PIN_DISPATCH_INTERVAL)
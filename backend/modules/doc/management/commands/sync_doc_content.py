@@ -0,0 +1,69 @@
+import datetime
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+
+from modules.doc.models import Doc, DocContent
+
+
+class Command(BaseCommand):
+    help = (
+        "将文章表中的内容分批同步至 doc_content，用于不停机迁移："
+        "1. migrate doc 0017_doccontent；2. 部署新代码；"
+        "3. 以迁移开始时间执行本命令，同步部署期间旧代码创建或修改的文章；4. migrate doc。"
+        "新代码在文章表内容列删除前同时写入文章表与 doc_content，"
+        "文章表始终为最新内容，因此以文章表覆盖 doc_content；"
+        "同步时锁定本批文章，同步期间的写入在同步完成后执行"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--since", help="仅同步该时间之后更新的文章，格式 YYYY-MM-DD HH:MM:SS")
+        parser.add_argument("--batch-size", type=int, default=500, help="每批同步的文章数")
+
+    def handle(self, *args, **options):
+        table = Doc._meta.db_table
+        with connection.cursor() as cursor:
+            columns = {
+                column.name
+                for column in connection.introspection.get_table_description(
+                    cursor, table
+                )
+            }
+        if "content" not in columns:
+            raise CommandError(f"{table}.content 已删除，无需同步")
+        since = datetime.datetime.min
+        if options["since"]:
+            since = datetime.datetime.strptime(options["since"], "%Y-%m-%d %H:%M:%S")
+        sql = (
+            f"SELECT id, content, attachments FROM `{table}` "
+            "WHERE id > %s AND update_at >= %s "
+            "ORDER BY id LIMIT %s"
+        )
+        if connection.features.has_select_for_update:
+            sql += " FOR UPDATE"
+        last_id = 0
+        total = 0
+        while True:
+            with transaction.atomic():
+                with connection.cursor() as cursor:
+                    cursor.execute(sql, [last_id, since, options["batch_size"]])
+                    rows = cursor.fetchall()
+                if not rows:
+                    break
+                last_id = rows[-1][0]
+                existing = DocContent.objects.in_bulk([row[0] for row in rows])
+                created = []
+                updated = []
+                for doc_id, content, attachments in rows:
+                    if isinstance(attachments, str):
+                        attachments = json.loads(attachments)
+                    doc_content = existing.get(doc_id) or DocContent(doc_id=doc_id)
+                    doc_content.content = content
+                    doc_content.attachments = attachments or {}
+                    (updated if doc_id in existing else created).append(doc_content)
+                DocContent.objects.bulk_create(created)
+                DocContent.objects.bulk_update(updated, ["content", "attachments"])
+            total += len(rows)
+            self.stdout.write(f"doc <= {last_id} done, {total} synced")
+        self.stdout.write(self.style.SUCCESS(f"{total} docs synced"))
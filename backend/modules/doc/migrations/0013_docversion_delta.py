@@ -0,0 +1,34 @@
+# Generated by Django 4.0.1 on 2026-10-19 12:42
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("doc", "0012_doc_pv_docversion_pv"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="docversion",
+            name="base_version_id",
+            field=models.BigIntegerField(blank=True, null=True, verbose_name="增量基准版本"),
+        ),
+        migrations.AddField(
+            model_name="docversion",
+            name="content_format",
+            field=models.SmallIntegerField(
+                choices=[(1, "全量"), (2, "增量")], default=1, verbose_name="内容格式"
+            ),
+        ),
+        migrations.AddField(
+            model_name="docversion",
+            name="keyframe_id",
+            field=models.BigIntegerField(blank=True, null=True, verbose_name="关键帧版本"),
+        ),
+        migrations.AlterIndexTogether(
+            name="docversion",
+            index_together={("id", "version_id")},
+        ),
+    ]
@@ -0,0 +1,20 @@
+# Generated by Django 4.0.1 on 2026-10-19 12:46
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("doc", "0013_docversion_delta"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="docversion",
+            name="content_hash",
+            field=models.CharField(
+                blank=True, max_length=64, null=True, verbose_name="内容摘要"
+            ),
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 4.0.1 on 2026-10-19 12:47
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("doc", "0014_docversion_content_hash"),
+    ]
+
+    operations = [
+        migrations.AlterIndexTogether(
+            name="commentversion",
+            index_together={("id", "version_id")},
+        ),
+    ]
@@ -0,0 +1,40 @@
+# Generated by Django 4.0.1 on 2026-10-19 12:50
+
+from django.db import migrations
+import utils.fields
+
+
+def compress_content(apps, schema_editor):
+    for model_name in ["DocVersion", "CommentVersion"]:
+        utils.fields.compress_rows(apps.get_model("doc", model_name), "content")
+
+
+def restore_content(apps, schema_editor):
+    for model_name in ["DocVersion", "CommentVersion"]:
+        utils.fields.restore_rows(apps.get_model("doc", model_name), "content")
+
+
+class Migration(migrations.Migration):
+
+    # 数据分批压缩，不使用单个事务
+    atomic = False
+
+    dependencies = [
+        ("doc", "0015_commentversion_index"),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name="commentversion",
+            name="content",
+            field=utils.fields.CompressedTextField(verbose_name="内容"),
+        ),
+        migrations.AlterField(
+            model_name="docversion",
+            name="content",
+            field=utils.fields.CompressedTextField(
+                blank=True, null=True, verbose_name="内容"
+            ),
+        ),
+        migrations.RunPython(compress_content, restore_content),
+    ]
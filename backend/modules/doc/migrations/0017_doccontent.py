@@ -0,0 +1,99 @@
+# Generated by Django 4.0.1 on 2026-10-19 12:53
+
+from django.db import migrations, models
+import modules.doc.models
+
+
+def copy_content(apps, schema_editor):
+    """分批复制文章内容至 doc_content"""
+    doc_model = apps.get_model("doc", "Doc")
+    content_model = apps.get_model("doc", "DocContent")
+    last_id = 0
+    while True:
+        rows = list(
+            doc_model.objects.filter(id__gt=last_id)
+            .order_by("id")
+            .values_list("id", "content", "attachments")[:500]
+        )
+        if not rows:
+            return
+        last_id = rows[-1][0]
+        existing = content_model.objects.in_bulk([row[0] for row in rows])
+        created = []
+        updated = []
+        for doc_id, content, attachments in rows:
+            doc_content = existing.get(doc_id) or content_model(doc_id=doc_id)
+            doc_content.content = content
+            doc_content.attachments = attachments or {}
+            (updated if doc_id in existing else created).append(doc_content)
+        content_model.objects.bulk_create(created)
+        content_model.objects.bulk_update(updated, ["content", "attachments"])
+
+
+def restore_content(apps, schema_editor):
+    """分批将 doc_content 写回文章表"""
+    doc_model = apps.get_model("doc", "Doc")
+    content_model = apps.get_model("doc", "DocContent")
+    last_id = 0
+    while True:
+        contents = list(
+            content_model.objects.filter(doc_id__gt=last_id).order_by("doc_id")[:500]
+        )
+        if not contents:
+            return
+        last_id = contents[-1].doc_id
+        for doc_content in contents:
+            doc_model.objects.filter(id=doc_content.doc_id).update(
+                content=doc_content.content, attachments=doc_content.attachments
+            )
+
+
+class Migration(migrations.Migration):
+
+    # 数据分批复制，不使用单个事务
+    atomic = False
+
+    dependencies = [
+        ("doc", "0016_compress_version_content"),
+    ]
+
+    operations = [
+        # 新代码不再写入文章表的附件列
+        migrations.AlterField(
+            model_name="doc",
+            name="attachments",
+            field=models.JSONField(
+                default=modules.doc.models.attachments_default,
+                null=True,
+                verbose_name="附件",
+            ),
+        ),
+        migrations.CreateModel(
+            name="DocContent",
+            fields=[
+                (
+                    "doc_id",
+                    models.BigIntegerField(
+                        primary_key=True, serialize=False, verbose_name="文章ID"
+                    ),
+                ),
+                (
+                    "content",
+                    models.TextField(blank=True, null=True, verbose_name="内容"),
+                ),
+                (
+                    "attachments",
+                    models.JSONField(
+                        default=modules.doc.models.attachments_default,
+                        verbose_name="附件",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "文章内容",
+                "verbose_name_plural": "文章内容",
+                "db_table": "doc_content",
+            },
+        ),
+        migrations.RunPython(copy_content, restore_content),
+    ]
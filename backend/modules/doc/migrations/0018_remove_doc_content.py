@@ -0,0 +1,21 @@
+# Generated by Django 4.0.1 on 2026-10-19 12:53
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("doc", "0017_doccontent"),
+    ]
+
+    operations = [
+        migrations.RemoveField(
+            model_name="doc",
+            name="attachments",
+        ),
+        migrations.RemoveField(
+            model_name="doc",
+            name="content",
+        ),
+    ]
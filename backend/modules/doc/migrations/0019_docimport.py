@@ -0,0 +1,61 @@
+# Generated by Django 4.0.1 on 2026-10-19 13:03
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("doc", "0018_remove_doc_content"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="DocImport",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("repo_id", models.BigIntegerField(verbose_name="仓库id")),
+                ("key", models.CharField(max_length=64, verbose_name="幂等键")),
+                ("filename", models.CharField(max_length=255, verbose_name="文件名")),
+                ("path", models.CharField(max_length=255, verbose_name="文件Path")),
+                (
+                    "status",
+                    models.CharField(
+                        choices=[
+                            ("waiting", "等待中"),
+                            ("running", "导入中"),
+                            ("success", "已完成"),
+                            ("failed", "失败"),
+                        ],
+                        default="waiting",
+                        max_length=12,
+                        verbose_name="状态",
+                    ),
+                ),
+                ("total", models.IntegerField(default=0, verbose_name="文件数")),
+                ("processed", models.IntegerField(default=0, verbose_name="已处理文件数")),
+                ("imported", models.IntegerField(default=0, verbose_name="已导入文章数")),
+                ("error", models.TextField(blank=True, null=True, verbose_name="错误信息")),
+                ("creator", models.CharField(max_length=24, verbose_name="创建人")),
+                (
+                    "create_at",
+                    models.DateTimeField(auto_now_add=True, verbose_name="创建时间"),
+                ),
+                ("update_at", models.DateTimeField(auto_now=True, verbose_name="更新时间")),
+            ],
+            options={
+                "verbose_name": "文章导入",
+                "verbose_name_plural": "文章导入",
+                "db_table": "doc_import",
+                "unique_together": {("creator", "key")},
+            },
+        ),
+    ]
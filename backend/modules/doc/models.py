@@ -1,12 +1,23 @@
-from django.db import models, transaction
+import hashlib
+import json
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DatabaseError, connection, models, transaction
+from django.utils import timezone
 from django.utils.translation import gettext_lazy as _
 
 from constents import (
+    MAX_CHAR_LENGTH,
     MEDIUM_CHAR_LENGTH,
     SMALL_SHORT_CHAR_LENGTH,
     DocAvailableChoices,
+    DocImportStatusChoices,
+    DocVersionFormatChoices,
     SHORT_CHAR_LENGTH,
 )
+from modules.doc.delta import make_delta, apply_delta, diff_lines
+from utils.fields import CompressedTextField, decompress_text
 
 DB_PREFIX = "doc_"
 
@@ -26,8 +37,6 @@ class DocBase(models.Model):
         default=DocAvailableChoices.PUBLIC,
     )
     title = models.CharField(_("标题"), max_length=MEDIUM_CHAR_LENGTH)
-    content = models.TextField(_("内容"), null=True, blank=True)
-    attachments = models.JSONField(_("附件"), default=attachments_default)
     pv = models.IntegerField(_("访问量"), db_index=True, default=0)
     creator = models.CharField(_("创建人"), max_length=SHORT_CHAR_LENGTH)
     update_at = models.DateTimeField(_("更新时间"), auto_now=True)
@@ -64,17 +73,327 @@ class Doc(DocBase):
         self.is_deleted = True
         self.save()
 
+    def save(self, *args, **kwargs):
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+            updates = self.__dict__.pop("_content_updates", None)
+            if updates:
+                DocContent.objects.save_legacy(self.id, **updates)
+                DocContent.objects.save_content(self.id, **updates)
+
+    @property
+    def doc_content(self):
+        """文章内容，首次访问时加载"""
+        if "_doc_content" not in self.__dict__:
+            doc_content = None
+            if self.id is not None:
+                doc_content = DocContent.objects.filter(doc_id=self.id).first()
+            self._doc_content = doc_content or DocContent(doc_id=self.id)
+            self._doc_content.__dict__.update(self.__dict__.get("_content_updates", {}))
+        return self._doc_content
+
+    def set_content_field(self, name: str, value):
+        """修改内容字段，保存文章时写入"""
+        self.__dict__.setdefault("_content_updates", {})[name] = value
+        if "_doc_content" in self.__dict__:
+            setattr(self._doc_content, name, value)
+
+    @property
+    def content(self):
+        return self.doc_content.content
+
+    @content.setter
+    def content(self, value):
+        self.set_content_field("content", value)
+
+    @property
+    def attachments(self):
+        return self.doc_content.attachments
+
+    @attachments.setter
+    def attachments(self, value):
+        self.set_content_field("attachments", value)
+
+
+class DocContentManager(models.Manager):
+    """
+    文章内容管理器
+    doc 0018 删除文章表的内容列之前，内容同时写入文章表，
+    使部署期间新旧代码的修改都保留在文章表中，由 sync_doc_content 覆盖同步
+    """
+
+    # 文章表中仍存在的旧内容列，首次写入时读取，列删除后为空
+    legacy_columns = None
+
+    @classmethod
+    def get_legacy_columns(cls):
+        if cls.legacy_columns is None:
+            with connection.cursor() as cursor:
+                cls.legacy_columns = {
+                    column.name
+                    for column in connection.introspection.get_table_description(
+                        cursor, Doc._meta.db_table
+                    )
+                } & {"content", "attachments"}
+        return cls.legacy_columns
+
+    def save_legacy(self, doc_id: int, **kwargs):
+        """写入文章表的旧内容列，列已删除时跳过"""
+        fields = {
+            name: json.dumps(value) if name == "attachments" else value
+            for name, value in kwargs.items()
+            if name in self.get_legacy_columns()
+        }
+        if not fields:
+            return
+        quote = connection.ops.quote_name
+        sql = "UPDATE {} SET {} WHERE id = %s".format(
+            quote(Doc._meta.db_table),
+            ", ".join(f"{quote(name)} = %s" for name in fields),
+        )
+        try:
+            with transaction.atomic(), connection.cursor() as cursor:
+                cursor.execute(sql, [*fields.values(), doc_id])
+        except DatabaseError:
+            # 迁移已删除旧内容列时不再写入，其他错误抛出
+            DocContentManager.legacy_columns = None
+            if fields.keys() & self.get_legacy_columns():
+                raise
+
+    def save_content(self, doc_id: int, **kwargs):
+        """更新文章内容，不存在时创建"""
+        if not self.filter(doc_id=doc_id).update(**kwargs):
+            self.create(doc_id=doc_id, **kwargs)
+
+    def attach(self, docs):
+        """批量加载文章内容，避免逐篇查询"""
+        docs = list(docs)
+        contents = self.in_bulk([doc.id for doc in docs])
+        for doc in docs:
+            doc_content = contents.get(doc.id) or DocContent(doc_id=doc.id)
+            doc_content.__dict__.update(doc.__dict__.get("_content_updates", {}))
+            doc._doc_content = doc_content
+        return docs
+
+
+class DocContent(models.Model):
+    """文章内容，与文章元数据分表存储"""
+
+    doc_id = models.BigIntegerField(_("文章ID"), primary_key=True)
+    content = models.TextField(_("内容"), null=True, blank=True)
+    attachments = models.JSONField(_("附件"), default=attachments_default)
+
+    objects = DocContentManager()
+
+    class Meta:
+        db_table = f"{DB_PREFIX}content"
+        verbose_name = _("文章内容")
+        verbose_name_plural = verbose_name
+
+
+class DocVersionManager(models.Manager):
+    """
+    文章版本管理器
+    版本内容以 关键帧(全量) + 增量 存储，增量基于上一版本，
+    每 DOC_VERSION_KEYFRAME_INTERVAL 个版本存储一个关键帧
+    """
+
+    @staticmethod
+    def make_hash(title: str, content: str):
+        """版本内容摘要"""
+        return hashlib.sha256(f"{title}\n{content or ''}".encode("utf-8")).hexdigest()
+
+    @staticmethod
+    def session_key(doc_id: int, uid: str):
+        return f"DocVersionSession:{doc_id}:{uid}"
+
+    def create(self, **kwargs):
+        """创建版本，内容按增量编码"""
+        content = kwargs.get("content")
+        kwargs.setdefault("content_hash", self.make_hash(kwargs.get("title"), content))
+        base = self.filter(id=kwargs.get("id")).order_by("-version_id").first()
+        if content is None or base is None:
+            return super().create(**kwargs)
+        base_content, depth = self.load_chain(base)
+        if base_content is None or depth + 1 >= settings.DOC_VERSION_KEYFRAME_INTERVAL:
+            return super().create(**kwargs)
+        delta = make_delta(base_content, content)
+        if len(delta) >= len(content):
+            return super().create(**kwargs)
+        kwargs.update(
+            content=delta,
+            content_format=DocVersionFormatChoices.DELTA,
+            base_version_id=base.version_id,
+            keyframe_id=base.keyframe_id or base.version_id,
+        )
+        return super().create(**kwargs)
+
+    def record(self, uid: str, **kwargs):
+        """
+        记录编辑产生的版本，同一编辑者的连续保存合并为一个版本
+        1. 内容摘要未变化时不记录
+        2. 编辑会话在 DOC_VERSION_IDLE_WINDOW 秒无保存后结束，结束后的保存记录为新版本
+        3. 会话内的保存覆盖会话版本，相对会话起点的编辑距离达到 DOC_VERSION_EDIT_DISTANCE 时记录为新版本
+        """
+        doc_id = kwargs.get("id")
+        content = kwargs.get("content")
+        content_hash = self.make_hash(kwargs.get("title"), content)
+        tail = self.filter(id=doc_id).order_by("-version_id").first()
+        if tail is not None and tail.content_hash == content_hash:
+            return tail
+        session_key = self.session_key(doc_id, uid)
+        version = None
+        if tail is not None and cache.get(session_key) == tail.version_id:
+            version = self.fold(tail, content_hash=content_hash, **kwargs)
+        if version is None:
+            version = self.create(content_hash=content_hash, **kwargs)
+        cache.set(session_key, version.version_id, settings.DOC_VERSION_IDLE_WINDOW)
+        return version
+
+    def fold(self, tail, **kwargs):
+        """将编辑合并至会话版本，超出编辑距离时返回 None"""
+        content = kwargs.get("content")
+        if content is None or tail.content is None:
+            return None
+        # 会话起点为会话版本的上一版本
+        if tail.base_version_id:
+            base = self.filter(id=tail.id, version_id=tail.base_version_id).first()
+        else:
+            base = (
+                self.filter(id=tail.id, version_id__lt=tail.version_id)
+                .order_by("-version_id")
+                .first()
+            )
+        base_content = self.get_content(base) if base is not None else None
+        delta, distance = diff_lines(base_content or "", content)
+        if distance >= settings.DOC_VERSION_EDIT_DISTANCE:
+            return None
+        kwargs.pop("id", None)
+        kwargs.pop("version_id", None)
+        kwargs["update_at"] = timezone.now()
+        if tail.content_format == DocVersionFormatChoices.DELTA:
+            if len(delta) >= len(content):
+                kwargs["content_format"] = DocVersionFormatChoices.FULL
+                kwargs["base_version_id"] = None
+                kwargs["keyframe_id"] = None
+            else:
+                kwargs["content"] = delta
+        self.filter(version_id=tail.version_id).update(**kwargs)
+        for key, val in kwargs.items():
+            setattr(tail, key, val)
+        return tail
+
+    def load_chain(self, version):
+        """还原版本内容，返回 内容 与 距关键帧的增量数"""
+        if version.content_format == DocVersionFormatChoices.FULL:
+            return version.content, 0
+        rows = {
+            row[0]: row[1:]
+            for row in self.filter(
+                id=version.id,
+                version_id__gte=version.keyframe_id,
+                version_id__lt=version.version_id,
+            ).values_list("version_id", "content_format", "content", "base_version_id")
+        }
+        # 由当前版本回溯至关键帧
+        deltas = [version.content]
+        base_version_id = version.base_version_id
+        while True:
+            content_format, content, base_version_id_next = rows[base_version_id]
+            content = decompress_text(content)
+            if content_format == DocVersionFormatChoices.FULL:
+                break
+            deltas.append(content)
+            base_version_id = base_version_id_next
+        for delta in reversed(deltas):
+            content = apply_delta(content or "", delta)
+        return content, len(deltas)
+
+    def get_content(self, version):
+        """还原版本内容"""
+        return self.load_chain(version)[0]
+
+    def get_contents(self, versions):
+        """批量还原同一文章的版本内容，各版本链在一次查询中读取，返回 版本id: 内容"""
+        condition = models.Q()
+        for version in versions:
+            start = (
+                version.version_id
+                if version.content_format == DocVersionFormatChoices.FULL
+                else version.keyframe_id
+            )
+            condition |= models.Q(
+                version_id__gte=start, version_id__lte=version.version_id
+            )
+        rows = {
+            row[0]: row[1:]
+            for row in self.filter(condition, id=versions[0].id).values_list(
+                "version_id", "content_format", "content", "base_version_id"
+            )
+        }
+        contents = {}
+        for version in versions:
+            deltas = []
+            version_id = version.version_id
+            while True:
+                content_format, content, version_id = rows[version_id]
+                content = decompress_text(content)
+                if content_format == DocVersionFormatChoices.FULL:
+                    break
+                deltas.append(content)
+            for delta in reversed(deltas):
+                content = apply_delta(content or "", delta)
+            contents[version.version_id] = content
+        return contents
+
+    def iter_history(self, doc_id: int):
+        """按版本顺序遍历文章历史，返回 版本、完整内容、距关键帧的增量数"""
+        contents = {}
+        for version in self.filter(id=doc_id).order_by("version_id").iterator():
+            if version.content_format == DocVersionFormatChoices.FULL:
+                # 关键帧之后的增量不会引用更早的版本
+                contents.clear()
+                content, depth = version.content, 0
+            elif version.base_version_id in contents:
+                base_content, base_depth = contents[version.base_version_id]
+                content = apply_delta(base_content or "", version.content)
+                depth = base_depth + 1
+            else:
+                # 并发保存时增量可能基于更早的版本
+                content, depth = self.load_chain(version)
+            contents[version.version_id] = (content, depth)
+            yield version, content, depth
+
 
 class DocVersion(DocBase):
     """文章版本"""
 
     version_id = models.BigAutoField(_("版本id"), primary_key=True)
     id = models.BigIntegerField("id")
+    content = CompressedTextField(_("内容"), null=True, blank=True)
+    attachments = models.JSONField(_("附件"), default=attachments_default)
+    content_format = models.SmallIntegerField(
+        _("内容格式"),
+        choices=DocVersionFormatChoices.choices,
+        default=DocVersionFormatChoices.FULL,
+    )
+    base_version_id = models.BigIntegerField(_("增量基准版本"), null=True, blank=True)
+    keyframe_id = models.BigIntegerField(_("关键帧版本"), null=True, blank=True)
+    content_hash = models.CharField(
+        _("内容摘要"), max_length=MEDIUM_CHAR_LENGTH, null=True, blank=True
+    )
+
+    objects = DocVersionManager()
 
     class Meta:
         db_table = f"{DB_PREFIX}version"
         verbose_name = _("文档版本")
         verbose_name_plural = verbose_name
+        index_together = [["id", "version_id"]]
+
+    def get_content(self):
+        """完整内容"""
+        return DocVersion.objects.get_content(self)
 
 
 class DocCollaborator(models.Model):
@@ -120,11 +439,13 @@ class CommentVersion(CommentBase):
 
     version_id = models.BigAutoField(_("版本id"), primary_key=True)
     id = models.BigIntegerField("id")
+    content = CompressedTextField(_("内容"))
 
     class Meta:
         db_table = f"{DB_PREFIX}comment_version"
         verbose_name = _("评论版本")
         verbose_name_plural = verbose_name
+        index_together = [["id", "version_id"]]
 
 
 class PinDoc(models.Model):
@@ -142,3 +463,31 @@ class PinDoc(models.Model):
         verbose_name_plural = verbose_name
         ordering = ["-id"]
         index_together = [["doc_id", "in_use"]]
+
+
+class DocImport(models.Model):
+    """文章导入任务"""
+
+    repo_id = models.BigIntegerField(_("仓库id"))
+    key = models.CharField(_("幂等键"), max_length=MEDIUM_CHAR_LENGTH)
+    filename = models.CharField(_("文件名"), max_length=MAX_CHAR_LENGTH)
+    path = models.CharField(_("文件Path"), max_length=MAX_CHAR_LENGTH)
+    status = models.CharField(
+        _("状态"),
+        max_length=SMALL_SHORT_CHAR_LENGTH,
+        choices=DocImportStatusChoices.choices,
+        default=DocImportStatusChoices.WAITING,
+    )
+    total = models.IntegerField(_("文件数"), default=0)
+    processed = models.IntegerField(_("已处理文件数"), default=0)
+    imported = models.IntegerField(_("已导入文章数"), default=0)
+    error = models.TextField(_("错误信息"), null=True, blank=True)
+    creator = models.CharField(_("创建人"), max_length=SHORT_CHAR_LENGTH)
+    create_at = models.DateTimeField(_("创建时间"), auto_now_add=True)
+    update_at = models.DateTimeField(_("更新时间"), auto_now=True)
+
+    class Meta:
+        db_table = f"{DB_PREFIX}import"
+        verbose_name = _("文章导入")
+        verbose_name_plural = verbose_name
+        unique_together = [["creator", "key"]]
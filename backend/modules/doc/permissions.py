@@ -2,7 +2,7 @@ from django.db.models import Q
 from rest_framework.permissions import BasePermission
 
 from constents import UserTypeChoices, RepoTypeChoices, DocAvailableChoices
-from modules.doc.models import Doc, DocCollaborator, Comment
+from modules.doc.models import Doc, DocCollaborator, DocImport, Comment
 from modules.repo.models import RepoUser, Repo
 from utils.exceptions import PermissionDenied, Error404
 
@@ -80,6 +80,8 @@ class DocManagePermission(BasePermission):
             "retrieve",
             "edit_status",
             "export",
+            "versions",
+            "version_diff",
         ]:
             try:
                 DocCollaborator.objects.get(doc_id=obj.id, uid=request.user.uid)
@@ -137,3 +139,25 @@ class CommentPermission(BasePermission):
         if obj.creator == request.user.uid:
             return True
         raise PermissionDenied()
+
+
+class DocImportPermission(BasePermission):
+    """
+    文章导入权限
+    1. 创建导入：仓库成员或公开仓库
+    2. 导入实例：创建人
+    """
+
+    def has_permission(self, request, view):
+        if request.user.is_superuser:
+            return True
+        if view.action == "create":
+            return check_repo_user_or_public(
+                request.data.get("repo_id", None), request.user.uid
+            )
+        return True
+
+    def has_object_permission(self, request, view, obj: DocImport):
+        if obj.creator == request.user.uid or request.user.is_superuser:
+            return True
+        raise PermissionDenied()
@@ -0,0 +1,114 @@
+"""
+置顶到期调度
+
+置顶以 Redis 有序集合登记，成员为置顶 id，分数为到期时间戳
+1. 置顶、修改到期时间、取消置顶时同步登记
+2. 调度进程每 PIN_DISPATCH_INTERVAL 秒取出已到期的成员，逐个 ZREM，
+   删除成功的进程负责取消置顶，多个调度进程同时运行时不会重复处理；
+   取消失败时重新登记，下次调度重试
+3. 周期任务取消已过期但未处理的置顶，并以数据库为准修正登记，
+   覆盖调度进程停止、Redis 数据丢失等情况
+"""
+
+import datetime
+import time
+
+from django.conf import settings
+
+from modules.doc.models import PinDoc
+from utils.tools import get_redis_client
+
+SCHEDULE_KEY = "PinDoc:schedule"
+
+
+def schedule_pin(pin: PinDoc):
+    """登记置顶到期时间"""
+    get_redis_client().zadd(SCHEDULE_KEY, {pin.id: pin.pin_to.timestamp()})
+
+
+def cancel_pins(*pin_ids: int):
+    """取消登记"""
+    if pin_ids:
+        get_redis_client().zrem(SCHEDULE_KEY, *pin_ids)
+
+
+def pop_due_pins(now: float = None, limit: int = None):
+    """取出已到期的置顶 id"""
+    redis = get_redis_client()
+    now = time.time() if now is None else now
+    members = redis.zrangebyscore(
+        SCHEDULE_KEY,
+        "-inf",
+        now,
+        start=0,
+        num=limit or settings.PIN_DISPATCH_BATCH_SIZE,
+    )
+    return [int(member) for member in members if redis.zrem(SCHEDULE_KEY, member)]
+
+
+def expire_pins(pin_ids: list):
+    """
+    取消到期的置顶，返回取消数量
+    取出后到期时间被延长的置顶重新登记
+    """
+    if not pin_ids:
+        return 0
+    now = datetime.datetime.now()
+    count = PinDoc.objects.filter(id__in=pin_ids, in_use=True, pin_to__lte=now).update(
+        in_use=False, operator=settings.ADMIN_USERNAME
+    )
+    for pin in PinDoc.objects.filter(id__in=pin_ids, in_use=True, pin_to__gt=now):
+        schedule_pin(pin)
+    return count
+
+
+def dispatch_due_pins():
+    """处理全部已到期的置顶，返回取消数量"""
+    count = 0
+    while True:
+        pin_ids = pop_due_pins()
+        if not pin_ids:
+            return count
+        try:
+            count += expire_pins(pin_ids)
+        except Exception:
+            get_redis_client().zadd(
+                SCHEDULE_KEY, {pin_id: time.time() for pin_id in pin_ids}
+            )
+            raise
+
+
+def reconcile_pins():
+    """取消已过期的置顶，并以数据库为准修正登记，返回 取消数量 与 修正数量"""
+    now = datetime.datetime.now()
+    expired = PinDoc.objects.filter(in_use=True, pin_to__lte=now).update(
+        in_use=False, operator=settings.ADMIN_USERNAME
+    )
+    redis = get_redis_client()
+    scheduled = {
+        int(member): score
+        for member, score in redis.zrange(SCHEDULE_KEY, 0, -1, withscores=True)
+    }
+    pins = {
+        pin_id: pin_to.timestamp()
+        for pin_id, pin_to in PinDoc.objects.filter(in_use=True).values_list(
+            "id", "pin_to"
+        )
+    }
+    missing = {
+        pin_id: score
+        for pin_id, score in pins.items()
+        if scheduled.get(pin_id) != score
+    }
+    # 只移除登记前已失效的成员，不影响期间新增的置顶
+    stale = [
+        pin_id
+        for pin_id in scheduled
+        if pin_id not in pins
+        and not PinDoc.objects.filter(id=pin_id, in_use=True).exists()
+    ]
+    if missing:
+        redis.zadd(SCHEDULE_KEY, missing)
+    if stale:
+        redis.zrem(SCHEDULE_KEY, *stale)
+    return expired, len(missing) + len(stale)
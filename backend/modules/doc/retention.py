@@ -0,0 +1,194 @@
+"""
+文章与评论版本保留策略
+
+DOC_VERSION_RETENTION 为 (版本距今天数上限, 保留粒度) 列表，按顺序匹配
+1. 粒度为 None：全部保留
+2. 粒度为 day/month：每天/每月仅保留最后一个版本
+3. 未匹配任何规则：删除
+每篇文章、每条评论的最新版本始终保留，已删除的文章与评论仅保留最新版本
+"""
+
+import datetime
+from collections import defaultdict
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models.functions import Length
+
+from constents import DocVersionFormatChoices
+from modules.doc.delta import make_delta
+from modules.doc.models import Doc, DocVersion, Comment, CommentVersion
+from utils.fields import CompressedValue, compress_text
+
+BUCKET_FORMATS = {"day": "%Y-%m-%d", "month": "%Y-%m"}
+
+
+def content_size(content):
+    """内容的存储大小，未解压的值取原始字节数，文本按写入时压缩后的字节数计算"""
+    if content is None:
+        return 0
+    if isinstance(content, CompressedValue):
+        return len(content)
+    return len(compress_text(content))
+
+
+def select_expired(versions: list, now: datetime.datetime, latest_only: bool = False):
+    """
+    筛选过期版本
+    versions 为按版本顺序排列的 (version_id, update_at)
+    """
+    if not versions:
+        return set()
+    if latest_only:
+        return {version_id for version_id, _ in versions[:-1]}
+    expired = set()
+    buckets = set()
+    # 由新到旧遍历，每个时间段保留最后一个版本
+    for version_id, update_at in reversed(versions[:-1]):
+        age = (now - update_at).days
+        for days, granularity in settings.DOC_VERSION_RETENTION:
+            if days is None or age < days:
+                break
+        else:
+            expired.add(version_id)
+            continue
+        if granularity is None:
+            continue
+        bucket = (granularity, update_at.strftime(BUCKET_FORMATS[granularity]))
+        if bucket in buckets:
+            expired.add(version_id)
+        else:
+            buckets.add(bucket)
+    return expired
+
+
+def delete_in_batches(queryset, ids: list):
+    """分批删除，避免长时间持有锁"""
+    batch_size = settings.DOC_VERSION_RETENTION_BATCH_SIZE
+    for i in range(0, len(ids), batch_size):
+        queryset.filter(version_id__in=ids[i : i + batch_size]).delete()
+
+
+def clean_doc(doc_id: int, now: datetime.datetime, stat: dict):
+    """清理单篇文章的版本，并将基准被删除的增量重新编码"""
+    with transaction.atomic():
+        # 锁定文章，与文章保存产生的版本写入串行
+        doc = (
+            Doc.objects.select_for_update()
+            .filter(id=doc_id)
+            .values("is_deleted")
+            .first()
+        )
+        # 由数据库计算存储大小，无需读取内容
+        rows = list(
+            DocVersion.objects.filter(id=doc_id)
+            .order_by("version_id")
+            .values_list("version_id", "update_at", Length("content"))
+        )
+        versions = [(version_id, update_at) for version_id, update_at, _ in rows]
+        sizes = {version_id: size or 0 for version_id, _, size in rows}
+        expired = select_expired(versions, now, doc is None or doc["is_deleted"])
+        if not expired:
+            return
+        changed = []
+        previous = None
+        for version, content, _depth in DocVersion.objects.iter_history(doc_id):
+            if version.version_id in expired:
+                stat["bytes"] += sizes[version.version_id]
+                continue
+            depth = 0
+            if version.content_format == DocVersionFormatChoices.DELTA:
+                delta = None
+                if (
+                    previous is not None
+                    and previous[2] + 1 < settings.DOC_VERSION_KEYFRAME_INTERVAL
+                ):
+                    base, base_content, base_depth = previous
+                    if version.base_version_id == base.version_id:
+                        delta = version.content
+                    else:
+                        # 基准版本被删除，基于上一个保留版本重新编码
+                        delta = make_delta(base_content or "", content or "")
+                if delta is None or len(delta) >= len(content or ""):
+                    # 转为关键帧
+                    version.content = content
+                    version.content_format = DocVersionFormatChoices.FULL
+                    version.base_version_id = None
+                    version.keyframe_id = None
+                    changed.append(version)
+                else:
+                    keyframe_id = base.keyframe_id or base.version_id
+                    if (
+                        version.base_version_id != base.version_id
+                        or version.keyframe_id != keyframe_id
+                    ):
+                        version.content = delta
+                        version.base_version_id = base.version_id
+                        version.keyframe_id = keyframe_id
+                        changed.append(version)
+                    depth = base_depth + 1
+            previous = (version, content, depth)
+        stat["bytes"] += sum(
+            sizes[version.version_id] - content_size(version.content)
+            for version in changed
+        )
+        if changed:
+            DocVersion.objects.bulk_update(
+                changed,
+                ["content", "content_format", "base_version_id", "keyframe_id"],
+                batch_size=settings.DOC_VERSION_RETENTION_BATCH_SIZE,
+            )
+        delete_in_batches(DocVersion.objects.filter(id=doc_id), sorted(expired))
+        stat["doc_versions"] += len(expired)
+
+
+def clean_comments(comment_ids: list, now: datetime.datetime, stat: dict):
+    """清理一批评论的版本"""
+    alive = set(
+        Comment.objects.filter(id__in=comment_ids, is_deleted=False).values_list(
+            "id", flat=True
+        )
+    )
+    versions = defaultdict(list)
+    sizes = {}
+    for version_id, comment_id, update_at, size in (
+        CommentVersion.objects.filter(id__in=comment_ids)
+        .order_by("version_id")
+        .values_list("version_id", "id", "update_at", Length("content"))
+    ):
+        versions[comment_id].append((version_id, update_at))
+        sizes[version_id] = size or 0
+    expired = set()
+    for comment_id, items in versions.items():
+        expired |= select_expired(items, now, comment_id not in alive)
+    delete_in_batches(CommentVersion.objects.all(), sorted(expired))
+    stat["comment_versions"] += len(expired)
+    stat["bytes"] += sum(sizes[version_id] for version_id in expired)
+
+
+def iter_ids(model, batch_size: int):
+    """分批遍历版本表中的对象 id"""
+    last_id = 0
+    while True:
+        ids = list(
+            model.objects.filter(id__gt=last_id)
+            .order_by("id")
+            .values_list("id", flat=True)
+            .distinct()[:batch_size]
+        )
+        if not ids:
+            return
+        last_id = ids[-1]
+        yield ids
+
+
+def apply_retention():
+    """执行版本保留策略，返回删除的版本数与回收的字节数"""
+    now = datetime.datetime.now()
+    stat = {"doc_versions": 0, "comment_versions": 0, "bytes": 0}
+    for doc_ids in iter_ids(DocVersion, 100):
+        for doc_id in doc_ids:
+            clean_doc(doc_id, now, stat)
+    for comment_ids in iter_ids(CommentVersion, 500):
+        clean_comments(comment_ids, now, stat)
+    return stat
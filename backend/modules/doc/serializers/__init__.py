@@ -1,8 +1,10 @@
 from modules.doc.serializers.doc import (
     DocUpdateSerializer,
     DocVersionSerializer,
+    DocVersionListSerializer,
     DocListSerializer,
     DocCommonSerializer,
+    DocImportSerializer,
     DocPinSerializer,
     DocPublishChartSerializer,
 )
@@ -1,7 +1,7 @@
 from django.contrib.auth import get_user_model
 from rest_framework import serializers
 
-from modules.doc.models import Comment
+from modules.doc.models import Comment, CommentVersion
 
 USER_MODEL = get_user_model()
 
@@ -14,6 +14,14 @@ class CommentCommonSerializer(serializers.ModelSerializer):
         fields = "__all__"
 
 
+class CommentVersionSerializer(serializers.ModelSerializer):
+    """评论版本"""
+
+    class Meta:
+        model = CommentVersion
+        fields = ["version_id", "id", "content", "update_at"]
+
+
 class CommentListSerializer(serializers.ModelSerializer):
     """评论列表"""
 
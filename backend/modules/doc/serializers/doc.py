@@ -1,13 +1,20 @@
 from django.contrib.auth import get_user_model
 from rest_framework import serializers
 
-from modules.doc.models import Doc, PinDoc
+from modules.doc.models import Doc, DocImport, PinDoc, DocVersion
 from modules.repo.models import Repo
 
 USER_MODEL = get_user_model()
 
 
-class DocVersionSerializer(serializers.ModelSerializer):
+class DocContentFieldsMixin(serializers.Serializer):
+    """文章内容字段，内容存储于 DocContent"""
+
+    content = serializers.CharField(allow_null=True, allow_blank=True, required=False)
+    attachments = serializers.JSONField(required=False)
+
+
+class DocVersionSerializer(DocContentFieldsMixin, serializers.ModelSerializer):
     """文章版本"""
 
     class Meta:
@@ -15,7 +22,23 @@ class DocVersionSerializer(serializers.ModelSerializer):
         fields = "__all__"
 
 
-class DocCommonSerializer(serializers.ModelSerializer):
+class DocVersionListSerializer(serializers.ModelSerializer):
+    """文章版本列表"""
+
+    class Meta:
+        model = DocVersion
+        fields = [
+            "version_id",
+            "id",
+            "title",
+            "available",
+            "is_publish",
+            "update_by",
+            "update_at",
+        ]
+
+
+class DocCommonSerializer(DocContentFieldsMixin, serializers.ModelSerializer):
     """文章"""
 
     creator_name = serializers.SerializerMethodField()
@@ -41,10 +64,10 @@ class DocListSerializer(serializers.ModelSerializer):
 
     class Meta:
         model = Doc
-        exclude = ["content", "attachments"]
+        fields = "__all__"
 
 
-class DocUpdateSerializer(serializers.ModelSerializer):
+class DocUpdateSerializer(DocContentFieldsMixin, serializers.ModelSerializer):
     """文章更新"""
 
     class Meta:
@@ -52,6 +75,14 @@ class DocUpdateSerializer(serializers.ModelSerializer):
         exclude = ["creator", "update_at"]
 
 
+class DocImportSerializer(serializers.ModelSerializer):
+    """文章导入"""
+
+    class Meta:
+        model = DocImport
+        exclude = ["path"]
+
+
 class DocPinSerializer(serializers.ModelSerializer):
     """文章置顶"""
 
@@ -3,6 +3,7 @@ from rest_framework.routers import SimpleRouter
 
 from modules.doc.views import (
     DocManageView,
+    DocImportView,
     DocCommonView,
     CommentCommonView,
     SearchDocView,
@@ -13,6 +14,7 @@ from modules.doc.views import (
 router = SimpleRouter()
 router.register("manage", DocManageView)
 router.register("common", DocCommonView)
+router.register("import", DocImportView)
 router.register("comments", CommentListView)
 router.register("comment", CommentCommonView)
 router.register("public", DocPublicView)
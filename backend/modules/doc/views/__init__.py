@@ -1,6 +1,7 @@
 from modules.doc.views.doc import (
     DocCommonView,
     DocManageView,
+    DocImportView,
     SearchDocView,
     DocPublicView,
 )
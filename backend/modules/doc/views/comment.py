@@ -1,13 +1,18 @@
 from django.db import transaction
 from rest_framework import mixins
+from rest_framework.decorators import action
 from rest_framework.response import Response
 from rest_framework.viewsets import GenericViewSet
 
 from modules.doc.models import Comment, CommentVersion
 from modules.doc.permissions import CommentPermission
 from modules.doc.serializers import CommentCommonSerializer
-from modules.doc.serializers.comment import CommentListSerializer
+from modules.doc.serializers.comment import (
+    CommentListSerializer,
+    CommentVersionSerializer,
+)
 from utils.authenticators import SessionAuthenticate
+from utils.paginations import VersionCursorPagination
 
 
 class CommentListView(mixins.ListModelMixin, GenericViewSet):
@@ -73,3 +78,13 @@ class CommentCommonView(
         instance.save()
         Comment.objects.filter(reply_to=instance.id).update(is_deleted=True)
         return Response()
+
+    @action(detail=True, methods=["GET"])
+    def versions(self, request, *args, **kwargs):
+        """评论版本历史"""
+        instance = self.get_object()
+        queryset = CommentVersion.objects.filter(id=instance.id)
+        paginator = VersionCursorPagination()
+        page = paginator.paginate_queryset(queryset, request, self)
+        serializer = CommentVersionSerializer(page, many=True)
+        return paginator.get_paginated_response(serializer.data)
@@ -1,35 +1,60 @@
 import datetime
+import hashlib
 import os
-import shutil
+import zipfile
 
 from django.conf import settings
 from django.contrib.auth import get_user_model
 from django.core.cache import cache
 from django.db import transaction, IntegrityError
 from django.db.models import Q, F
-from django.http import FileResponse
+from django.http import StreamingHttpResponse
 from django.utils.encoding import escape_uri_path
 from django.utils.translation import gettext as _
+from django.utils.translation import ngettext
 from rest_framework.decorators import action
+from rest_framework.mixins import RetrieveModelMixin
 from rest_framework.response import Response
 from rest_framework.viewsets import ModelViewSet, GenericViewSet
 
-from constents import DocAvailableChoices, RepoTypeChoices, UserTypeChoices
+from constents import (
+    MEDIUM_CHAR_LENGTH,
+    DocAvailableChoices,
+    DocImportStatusChoices,
+    RepoTypeChoices,
+    UserTypeChoices,
+)
 from modules.account.serializers import UserInfoSerializer
-from modules.doc.models import Doc, DocVersion, DocCollaborator, Comment
-from modules.doc.permissions import DocManagePermission, DocCommonPermission
+from modules.cel.tasks import import_docs
+from modules.doc.delta import make_diff
+from modules.doc.export import doc_filename, iter_markdown, iter_zip
+from modules.doc.models import Doc, DocVersion, DocCollaborator, DocImport
+from modules.doc.permissions import (
+    DocManagePermission,
+    DocCommonPermission,
+    DocImportPermission,
+)
 from modules.doc.serializers import (
     DocCommonSerializer,
+    DocImportSerializer,
     DocListSerializer,
     DocUpdateSerializer,
     DocVersionSerializer,
+    DocVersionListSerializer,
     DocPublishChartSerializer,
 )
 from modules.repo.models import Repo, RepoUser
 from modules.repo.serializers import RepoSerializer
 from utils.authenticators import SessionAuthenticate
-from utils.exceptions import Error404, ParamsNotFound, UserNotExist, OperationError
-from utils.paginations import NumPagination
+from utils.client import get_client_by_user
+from utils.exceptions import (
+    Error404,
+    ParamsNotFound,
+    UserNotExist,
+    OperationError,
+    ServerError,
+)
+from utils.paginations import NumPagination, VersionCursorPagination
 from utils.throttlers import DocSearchThrottle
 from utils.viewsets import ThrottleAPIView
 
@@ -89,7 +114,9 @@ class DocManageView(ModelViewSet):
         serializer.is_valid(raise_exception=True)
         with transaction.atomic():
             serializer.save(update_by=request.user.uid)
-            DocVersion.objects.create(**DocVersionSerializer(instance).data)
+            DocVersion.objects.record(
+                request.user.uid, **DocVersionSerializer(instance).data
+            )
         return Response({"id": instance.id})
 
     def destroy(self, request, *args, **kwargs):
@@ -148,36 +175,139 @@ class DocManageView(ModelViewSet):
 
     @action(detail=True, methods=["GET"])
     def export(self, request, *args, **kwargs):
-        """导出文章"""
+        """导出文章，with_attachments=1 时打包附件"""
         instance = self.get_object()
-        sql = (
-            "SELECT dc.*, au.username FROM `doc_comment` dc "
-            "JOIN `auth_user` au ON au.uid=dc.creator "
-            "WHERE dc.doc_id=%s AND NOT dc.is_deleted "
-            "ORDER BY dc.id DESC;"
-        )
-        comments = Comment.objects.raw(sql, [instance.id])
-        file_dir = os.path.join(
-            settings.BASE_DIR, "tmp", "doc", request.user.uid, str(instance.id)
-        )
-        if os.path.exists(file_dir):
-            shutil.rmtree(file_dir)
-        os.makedirs(file_dir)
-        filename = "{}.md".format(instance.title.replace(" ", "").replace("/", ""))
-        file_path = os.path.join(file_dir, filename)
-        with open(file_path, "w", encoding="utf-8") as file:
-            file.write(instance.content)
-            for comment in comments:
-                file.write("\n\n---\n\n")
-                file.write(comment.content)
-        file = open(file_path, "rb")
-        response = FileResponse(file)
+        filename = doc_filename(instance)
+        if request.GET.get("with_attachments"):
+            client = get_client_by_user(request.user.uid)
+            response = StreamingHttpResponse(iter_zip(instance, client))
+            filename = "{}.zip".format(os.path.splitext(filename)[0])
+        else:
+            response = StreamingHttpResponse(iter_markdown(instance))
         response["Content-Type"] = "application/octet-stream"
         response[
             "Content-Disposition"
         ] = f"attachment; filename={escape_uri_path(filename)}"
         return response
 
+    @action(detail=True, methods=["GET"])
+    def versions(self, request, *args, **kwargs):
+        """文章版本历史"""
+        instance = self.get_object()
+        queryset = DocVersion.objects.filter(id=instance.id).only(
+            *DocVersionListSerializer.Meta.fields
+        )
+        paginator = VersionCursorPagination()
+        page = paginator.paginate_queryset(queryset, request, self)
+        serializer = DocVersionListSerializer(page, many=True)
+        return paginator.get_paginated_response(serializer.data)
+
+    @action(
+        detail=True,
+        methods=["GET"],
+        url_path=r"versions/(?P<version_a>\d+)/diff/(?P<version_b>\d+)",
+    )
+    def version_diff(self, request, version_a=None, version_b=None, *args, **kwargs):
+        """文章版本对比"""
+        instance = self.get_object()
+        versions = {
+            version.version_id: version
+            for version in DocVersion.objects.filter(
+                id=instance.id, version_id__in=[version_a, version_b]
+            ).defer("content")
+        }
+        version_a, version_b = int(version_a), int(version_b)
+        if version_a not in versions or version_b not in versions:
+            raise Error404()
+        # 版本内容不再变化，编辑会话合并时摘要随之变化，以摘要作为缓存键
+        cache_key = "{}:{}:{}:{}:{}:{}".format(
+            self.__class__.__name__,
+            self.action,
+            version_a,
+            version_b,
+            versions[version_a].content_hash,
+            versions[version_b].content_hash,
+        )
+        cache_data = cache.get(cache_key)
+        if cache_data is not None:
+            return Response({"data": cache_data})
+        # 内容仅在未命中缓存时读取，两个版本链在一次查询中还原
+        contents = DocVersion.objects.get_contents(list(versions.values()))
+        diff = make_diff(
+            contents[version_a],
+            contents[version_b],
+            str(version_a),
+            str(version_b),
+        )
+        cache.set(cache_key, diff, settings.DOC_VERSION_DIFF_CACHE_TIMEOUT)
+        return Response({"data": diff})
+
+
+class DocImportView(RetrieveModelMixin, GenericViewSet):
+    """文章导入入口"""
+
+    queryset = DocImport.objects.all()
+    serializer_class = DocImportSerializer
+    permission_classes = [
+        DocImportPermission,
+    ]
+
+    def get_key(self, request, file):
+        """幂等键，未指定时使用文件摘要"""
+        key = request.META.get("HTTP_IDEMPOTENCY_KEY")
+        if key:
+            return key[:MEDIUM_CHAR_LENGTH]
+        sha256 = hashlib.sha256()
+        for chunk in file.chunks():
+            sha256.update(chunk)
+        file.seek(0)
+        return sha256.hexdigest()
+
+    def create(self, request, *args, **kwargs):
+        """上传压缩包并创建导入任务，相同幂等键的请求返回已有任务"""
+        file = request.FILES.get("file")
+        if file is None:
+            raise ParamsNotFound()
+        repo_id = str(request.data.get("repo_id", ""))
+        if not repo_id.isdigit():
+            raise ParamsNotFound(_("仓库ID不能为空"))
+        if file.size > settings.COS_MAX_FILE_SIZE:
+            raise OperationError(
+                ngettext(
+                    "请上传 %(limit)dM 以内文件",
+                    "请上传 %(limit)dM 以内文件",
+                    settings.COS_MAX_FILE_SIZE // 1024 // 1024,
+                )
+                % {"limit": settings.COS_MAX_FILE_SIZE // 1024 // 1024}
+            )
+        if not zipfile.is_zipfile(file):
+            raise OperationError(_("请上传 zip 格式的压缩包"))
+        file.seek(0)
+        key = self.get_key(request, file)
+        instance = DocImport.objects.filter(creator=request.user.uid, key=key).first()
+        if instance is None:
+            client = get_client_by_user(request.user.uid)
+            filename = client.cos.verify_filename(file.name)
+            result, url = client.cos.upload(filename, file.file)
+            if not result:
+                raise ServerError(_("上传失败，请稍后再试"))
+            try:
+                instance = DocImport.objects.create(
+                    repo_id=int(repo_id),
+                    key=key,
+                    filename=filename,
+                    path=client.cos.get_key(url),
+                    creator=request.user.uid,
+                )
+            except IntegrityError:
+                instance = DocImport.objects.get(creator=request.user.uid, key=key)
+                return Response(self.get_serializer(instance).data)
+        elif instance.status != DocImportStatusChoices.FAILED:
+            return Response(self.get_serializer(instance).data)
+        # 失败的任务从已处理的文件继续
+        import_docs.delay(instance.id)
+        return Response(self.get_serializer(instance).data)
+
 
 class DocCommonView(GenericViewSet):
     """文章常规入口"""
@@ -406,6 +536,7 @@ class SearchDocView(ThrottleAPIView):
             "JOIN `repo_user` ru ON ru.repo_id=rr.id AND ru.u_type!=%s "
             "JOIN `doc_doc` dd ON rr.id = dd.repo_id "
             "JOIN `auth_user` au ON au.uid = dd.creator "
+            "LEFT JOIN `doc_content` dct ON dct.doc_id = dd.id "
             "WHERE NOT rr.is_deleted AND (ru.uid = %s OR rr.r_type = %s) "
             "AND NOT dd.is_deleted AND dd.is_publish AND (dd.available = %s OR dd.creator = %s) "
             "AND (({}) OR ({})) "
@@ -419,7 +550,7 @@ class SearchDocView(ThrottleAPIView):
         for key in search_key:
             if key:
                 extend_title_sqls.append(" dd.title like %s ")
-                extend_content_sqls.append(" dd.content like %s ")
+                extend_content_sqls.append(" dct.content like %s ")
                 params_keys.append(f"%{key}%")
         extend_title_sql = "AND".join(extend_title_sqls)
         extend_content_sql = "AND".join(extend_content_sqls)
@@ -14,8 +14,11 @@ from rest_framework.viewsets import GenericViewSet, ModelViewSet
 
 from constents import UserTypeChoices, DocAvailableChoices
 from modules.account.serializers import UserInfoSerializer
-from modules.cel.tasks import export_all_docs, send_apply_result
+from modules.cel.export import SITE_RUNNING_KEY
+from modules.cel.jobs import ExportJob
+from modules.cel.tasks import export_all_docs, export_all_repos, send_apply_result
 from modules.doc.models import Doc, PinDoc
+from modules.doc.pins import cancel_pins, schedule_pin
 from modules.doc.serializers import DocListSerializer, DocPinSerializer
 from modules.repo.models import Repo, RepoUser
 from modules.repo.permissions import RepoAdminPermission
@@ -32,6 +35,7 @@ from utils.exceptions import (
     Error404,
     ThrottledError,
     ParamsNotFound,
+    PermissionDenied,
 )
 from utils.paginations import NumPagination, RepoListNumPagination
 
@@ -114,13 +118,41 @@ class RepoView(ModelViewSet):
         """导出文章"""
         instance = self.get_object()
         # 检验是否有执行中任务
-        cache_key = "ExportAllDocs:{}:{}".format(instance.id, request.user.uid)
-        running = cache.get(cache_key)
-        if running:
+        job = ExportJob.create(instance.id, request.user.uid)
+        if job is None:
             raise ThrottledError()
-        cache.set(cache_key, request.user.uid, 3600)
         # 导出
-        export_all_docs.delay(instance.id, request.user.uid)
+        export_all_docs.delay(instance.id, request.user.uid, job.id)
+        return Response({"job_id": job.id})
+
+    @action(detail=True, methods=["GET"])
+    def export_status(self, request, *args, **kwargs):
+        """导出进度，未指定任务时返回最近一次导出"""
+        instance = self.get_object()
+        job_id = request.GET.get("job_id")
+        if job_id:
+            job = ExportJob.get(job_id)
+        else:
+            job = ExportJob.latest(instance.id, request.user.uid)
+        if (
+            job is None
+            or job.data["repo_id"] != instance.id
+            or job.data["uid"] != request.user.uid
+        ):
+            raise Error404()
+        return Response(job.to_dict())
+
+    @action(detail=False, methods=["POST"])
+    def export_all(self, request, *args, **kwargs):
+        """超级管理员导出全部仓库"""
+        if not request.user.is_superuser:
+            raise PermissionDenied()
+        # 检验是否有执行中任务，任务结束时释放
+        if not cache.add(
+            SITE_RUNNING_KEY, request.user.uid, settings.EXPORT_SITE_LOCK_TIMEOUT
+        ):
+            raise ThrottledError()
+        export_all_repos.delay(request.user.uid)
         return Response()
 
     @action(detail=False, methods=["GET"])
@@ -249,7 +281,8 @@ class RepoView(ModelViewSet):
             pin.operator = request.user.uid
             pin.save()
         except PinDoc.DoesNotExist:
-            serializer.save()
+            pin = serializer.save()
+        schedule_pin(pin)
         return Response()
 
     @action(detail=True, methods=["POST"])
@@ -269,9 +302,10 @@ class RepoView(ModelViewSet):
             )
         except Doc.DoesNotExist:
             raise OperationError()
-        PinDoc.objects.filter(doc_id=doc_id, in_use=True).update(
-            in_use=False, operator=request.user.uid
-        )
+        pins = PinDoc.objects.filter(doc_id=doc_id, in_use=True)
+        pin_ids = list(pins.values_list("id", flat=True))
+        pins.update(in_use=False, operator=request.user.uid)
+        cancel_pins(*pin_ids)
         return Response()
 
 
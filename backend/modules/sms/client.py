@@ -1,67 +1,185 @@
+"""
+短信发送
+1. 由 SMS_GATEWAY 选择短信网关，fake 网关不实际发送，用于开发与测试
+2. 相同模板与参数的号码合并发送，每 SMS_BATCH_SIZE 个号码一次请求，日志批量写入
+3. SDK 客户端在进程内共享
+"""
+
 import json
 import logging
+import os
+import threading
 
 from django.conf import settings
+from django.utils.module_loading import import_string
 from tencentcloud.common import credential
 from tencentcloud.sms.v20210111 import sms_client, models
 
 from modules.sms.models import SMSLog
-from utils.tools import model_to_dict
+from utils.tools import model_to_dict, uniq_id
 
 logger = logging.getLogger("sms")
 
+# 进程内共享的网关
+_gateway = None
+_gateway_lock = threading.Lock()
+
+
+def _reset_gateway():
+    global _gateway
+    _gateway = None
+
+
+# fork 后子进程不能复用父进程的连接
+os.register_at_fork(after_in_child=_reset_gateway)
+
+
+def get_sms_gateway():
+    """按 SMS_GATEWAY 获取共享的短信网关"""
+    global _gateway
+    if _gateway is None:
+        with _gateway_lock:
+            if _gateway is None:
+                _gateway = import_string(settings.SMS_GATEWAYS[settings.SMS_GATEWAY])()
+    return _gateway
+
+
+class TencentSMSGateway(object):
+    """腾讯云短信"""
+
+    def __init__(self):
+        self.client = sms_client.SmsClient(
+            credential.Credential(settings.SMS_SECRET_ID, settings.SMS_SECRET_KEY),
+            "ap-guangzhou",
+        )
+
+    def send(self, phone_numbers: list, template_id: str, template_params: list):
+        """发送短信，返回接口响应"""
+        req = models.SendSmsRequest()
+        req.SmsSdkAppId = settings.SMS_APP_ID
+        req.SignName = settings.SMS_SIGN_NAME
+        req.PhoneNumberSet = phone_numbers
+        req.TemplateId = template_id
+        req.TemplateParamSet = template_params
+        resp = self.client.SendSms(req)
+        return json.loads(resp.to_json_string())
+
+
+class FakeSMSGateway(object):
+    """不实际发送的短信网关，已发送的短信记录于 outbox"""
+
+    outbox = []
+
+    def send(self, phone_numbers: list, template_id: str, template_params: list):
+        self.outbox.append(
+            {
+                "phone_numbers": phone_numbers,
+                "template_id": template_id,
+                "template_params": template_params,
+            }
+        )
+        logger.info(
+            "[sms fake send] %s %s %s",
+            template_id,
+            json.dumps(phone_numbers),
+            json.dumps(template_params, ensure_ascii=False),
+        )
+        return {
+            "SendStatusSet": [
+                {
+                    "SerialNo": uniq_id(),
+                    "PhoneNumber": phone_number,
+                    "Fee": 1,
+                    "SessionContext": "",
+                    "Code": "Ok",
+                    "Message": "send success",
+                    "IsoCode": "CN",
+                }
+                for phone_number in phone_numbers
+            ],
+            "RequestId": uniq_id(),
+        }
+
 
 class SMSClient(object):
     def __init__(self, operator: str):
-        self.secretId = settings.SMS_SECRET_ID
-        self.secretKey = settings.SMS_SECRET_KEY
-        self.app_id = settings.SMS_APP_ID
-        self.sign_name = settings.SMS_SIGN_NAME
         self.operator = operator
 
+    @property
+    def gateway(self):
+        return get_sms_gateway()
+
     def send_sms(
         self, phone_number: str, template_id: str, template_params: list = None
     ):
-        # 记录日志
-        sms_log = SMSLog.objects.create(
-            phone=phone_number,
-            template_id=template_id,
-            template_params=template_params,
-            operator=self.operator,
-        )
-        try:
-            # 实例化要请求产品(sms)的client对象
-            cred = credential.Credential(self.secretId, self.secretKey)
-            client = sms_client.SmsClient(cred, "ap-guangzhou")
-
-            # 实例化一个请求对象
-            req = models.SendSmsRequest()
-            req.SmsSdkAppId = self.app_id
-            req.SignName = self.sign_name
-            req.PhoneNumberSet = [phone_number]
-            req.TemplateId = template_id
-            req.TemplateParamSet = (
-                template_params if template_params is not None else []
-            )
-
-            # 发送短信
-            resp = client.SendSms(req)
-            resp = json.loads(resp.to_json_string(indent=2))
-
-            # 补充日志
-            sms_log.send_status = resp
-
-            # 判断发送结果
-            if resp["SendStatusSet"][0]["Code"] == "Ok":
-                send_flag = True
-            else:
-                send_flag = False
+        """发送单条短信"""
+        return self.send_batch([phone_number], template_id, template_params)[
+            phone_number
+        ]
 
-        except Exception as err:
-            sms_log.send_status = err if isinstance(err, dict) else str(err)
-            send_flag = False
-
-        sms_log.save()
-        logger.info("[sms send] %s", json.dumps(model_to_dict(sms_log)))
+    def send_batch(
+        self, phone_numbers: list, template_id: str, template_params: list = None
+    ):
+        """
+        向多个号码发送相同的短信，返回 {号码: 是否成功}
+        每 SMS_BATCH_SIZE 个号码一次请求，每个号码记录一条日志
+        """
+        template_params = template_params if template_params is not None else []
+        phone_numbers = list(dict.fromkeys(phone_numbers))
+        results = {}
+        for i in range(0, len(phone_numbers), settings.SMS_BATCH_SIZE):
+            batch = phone_numbers[i : i + settings.SMS_BATCH_SIZE]
+            try:
+                resp = self.gateway.send(batch, template_id, template_params)
+                status_set = resp["SendStatusSet"]
+            except Exception as err:
+                resp = str(err)
+                status_set = []
+            logs = []
+            for phone_number in batch:
+                # 返回的号码带国家码
+                status = next(
+                    (
+                        item
+                        for item in status_set
+                        if item["PhoneNumber"].endswith(phone_number)
+                    ),
+                    None,
+                )
+                if status is None:
+                    send_status = resp
+                else:
+                    send_status = {
+                        "SendStatusSet": [status],
+                        "RequestId": resp.get("RequestId"),
+                    }
+                results[phone_number] = status is not None and status["Code"] == "Ok"
+                logs.append(
+                    SMSLog(
+                        phone=phone_number,
+                        template_id=template_id,
+                        template_params=template_params,
+                        send_status=send_status,
+                        operator=self.operator,
+                    )
+                )
+            SMSLog.objects.bulk_create(logs)
+            for sms_log in logs:
+                logger.info("[sms send] %s", json.dumps(model_to_dict(sms_log)))
+        return results
 
-        return send_flag
+    def send_many(self, messages: list):
+        """
+        发送多条短信，messages 为 (号码, 模板ID, 模板参数) 的列表，
+        模板与参数相同的短信合并发送，返回 {号码: 是否成功}
+        """
+        groups = {}
+        for phone_number, template_id, template_params in messages:
+            key = (template_id, json.dumps(template_params, ensure_ascii=False))
+            groups.setdefault(key, []).append(phone_number)
+        results = {}
+        for (template_id, template_params), phone_numbers in groups.items():
+            results.update(
+                self.send_batch(phone_numbers, template_id, json.loads(template_params))
+            )
+        return results
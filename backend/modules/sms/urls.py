@@ -1,8 +1,9 @@
 from django.urls import path
 
-from modules.sms.views import RegisterCodeView, RePasswordCodeView
+from modules.sms.views import CodeDeliveryView, RegisterCodeView, RePasswordCodeView
 
 urlpatterns = [
     path("send/register_code/", RegisterCodeView.as_view()),
     path("send/repass_code/", RePasswordCodeView.as_view()),
+    path("send/status/", CodeDeliveryView.as_view()),
 ]
@@ -6,7 +6,13 @@ from rest_framework.views import APIView
 from constents import SIGN_UP_KEY
 from modules.conf.models import Conf
 from utils.authenticators import SessionAuthenticate
-from utils.exceptions import ParamsNotFound, SMSSendFailed, UserNotExist, OperationError
+from utils.exceptions import (
+    Error404,
+    ParamsNotFound,
+    SMSSendFailed,
+    UserNotExist,
+    OperationError,
+)
 
 USER_MODEL = get_user_model()
 
@@ -22,10 +28,10 @@ class RegisterCodeView(APIView):
         phone = request.data.get("phone", None)
         if not phone or (isinstance(phone, str) and len(phone) != 11):
             raise ParamsNotFound(_("手机号为空或格式有误"))
-        result = USER_MODEL.send_code(phone)
-        if not result:
+        delivery_id = USER_MODEL.send_code(phone)
+        if not delivery_id:
             raise SMSSendFailed()
-        return Response()
+        return Response({"delivery_id": delivery_id})
 
 
 class RePasswordCodeView(APIView):
@@ -44,7 +50,22 @@ class RePasswordCodeView(APIView):
             user = USER_MODEL.objects.get(username=username)
         except USER_MODEL.DoesNotExist:
             raise UserNotExist()
-        result = user.send_re_pass_code(phone)
-        if not result:
+        delivery_id = user.send_re_pass_code(phone)
+        if not delivery_id:
             raise SMSSendFailed()
-        return Response()
+        return Response({"delivery_id": delivery_id})
+
+
+class CodeDeliveryView(APIView):
+    """验证码发送状态入口"""
+
+    authentication_classes = [SessionAuthenticate]
+
+    def get(self, request, *args, **kwargs):
+        delivery_id = request.query_params.get("delivery_id")
+        if not delivery_id:
+            raise ParamsNotFound()
+        status = USER_MODEL.get_delivery_status(delivery_id)
+        if status is None:
+            raise Error404()
+        return Response({"status": status})
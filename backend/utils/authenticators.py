@@ -1,26 +1,57 @@
 from django.conf import settings
+from django.contrib import auth
+from django.contrib.auth import get_user_model, SESSION_KEY, HASH_SESSION_KEY
+from django.contrib.auth.models import AnonymousUser
 from django.core.cache import cache
+from django.utils.crypto import constant_time_compare
 from rest_framework.authentication import BaseAuthentication, SessionAuthentication
 
 from utils.exceptions import LoginRequired
+from utils.tokens import get_auth_token_handler
 
 
 class SessionAuthenticate(SessionAuthentication):
     def authenticate(self, request):
-        # 获取 request 用户
-        user = getattr(request._request, "user", None)
-        if not user or not user.is_authenticated:
-            return None
         # 获取 AUTH TOKEN
         auth_token = request.COOKIES.get(settings.AUTH_TOKEN_NAME, None)
         if auth_token is None:
             return None
+        # 获取 session 用户
+        django_request = request._request
+        uid = django_request.session.get(SESSION_KEY)
+        if uid is None:
+            return None
+        # 一次读取 用户快照 与 AUTH TOKEN
+        user_model = get_user_model()
+        token_handler = get_auth_token_handler()
+        cache_data = cache.get_many(
+            [*user_model.snapshot_keys(uid), *token_handler.cache_keys(auth_token)]
+        )
+        if not hasattr(django_request, "_cached_user"):
+            django_request._cached_user = self.load_user(
+                django_request, user_model.load_snapshot(uid, cache_data)
+            )
+        # 获取 request 用户
+        user = getattr(django_request, "user", None)
+        if not user or not user.is_authenticated:
+            return None
         # 校验 AUTH TOKEN
-        uid = cache.get(auth_token)
-        if uid != user.uid:
+        if token_handler.verify(auth_token, cache_data) != user.uid:
             return None
         return user, None
 
+    def load_user(self, request, user):
+        """使用用户快照完成 session 登录校验，未命中时走默认流程"""
+        if user is None:
+            return auth.get_user(request)
+        session_hash = request.session.get(HASH_SESSION_KEY)
+        if session_hash and constant_time_compare(
+            session_hash, user.get_session_auth_hash()
+        ):
+            return user
+        request.session.flush()
+        return AnonymousUser()
+
 
 class AuthTokenAuthenticate(BaseAuthentication):
     def authenticate(self, request):
@@ -1,6 +1,8 @@
+from functools import cached_property
+
 from django.contrib.auth import get_user_model
 
-from modules.cos.client import COSClient
+from modules.cos.storage import get_storage_client
 from modules.sms.client import SMSClient
 from utils.exceptions import ParamsNotFound, UserNotExist
 
@@ -13,9 +15,9 @@ class UnionClient(object):
     def sms(self):
         return SMSClient(operator=self.operator)
 
-    @property
+    @cached_property
     def cos(self):
-        return COSClient(operator=self.operator)
+        return get_storage_client(operator=self.operator)
 
 
 def get_client_by_user(uid: str = None, username: str = None):
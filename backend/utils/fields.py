@@ -0,0 +1,168 @@
+"""
+压缩文本字段
+
+数据库中以二进制存储，首字节标记存储格式
+1. 0x00：未压缩的 utf-8 文本
+2. 0x01：zlib
+3. 0x02：zstd，需要安装 zstandard
+不以上述字节开头的数据视为迁移前的 utf-8 文本
+读取时不解压，首次访问字段时才解压
+"""
+
+import zlib
+
+from django.conf import settings
+from django.db import models
+from django.db.models.query_utils import DeferredAttribute
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+FORMAT_RAW = b"\x00"
+FORMAT_ZLIB = b"\x01"
+FORMAT_ZSTD = b"\x02"
+
+
+def compress_text(value: str):
+    """压缩文本，压缩无收益时存储原文"""
+    raw = value.encode("utf-8")
+    if len(raw) < settings.TEXT_COMPRESSION_MIN_LENGTH:
+        return FORMAT_RAW + raw
+    if settings.TEXT_COMPRESSION_ALGORITHM == "zstd" and zstandard is not None:
+        header = FORMAT_ZSTD
+        compressed = zstandard.ZstdCompressor(
+            level=settings.TEXT_COMPRESSION_LEVEL
+        ).compress(raw)
+    else:
+        header = FORMAT_ZLIB
+        compressed = zlib.compress(raw, settings.TEXT_COMPRESSION_LEVEL)
+    if len(compressed) >= len(raw):
+        return FORMAT_RAW + raw
+    return header + compressed
+
+
+def decompress_text(value):
+    """解压数据库中的值，兼容 CompressedValue 与 str"""
+    if isinstance(value, CompressedValue):
+        return value.decompress()
+    return value
+
+
+class CompressedValue(object):
+    """数据库中读取的未解压数据"""
+
+    __slots__ = ("raw",)
+
+    def __init__(self, raw: bytes):
+        self.raw = raw
+
+    def __len__(self):
+        """存储大小"""
+        return len(self.raw)
+
+    @property
+    def is_legacy(self):
+        return self.raw[:1] not in (FORMAT_RAW, FORMAT_ZLIB, FORMAT_ZSTD)
+
+    def decompress(self):
+        header, body = self.raw[:1], self.raw[1:]
+        if header == FORMAT_RAW:
+            return body.decode("utf-8")
+        if header == FORMAT_ZLIB:
+            return zlib.decompress(body).decode("utf-8")
+        if header == FORMAT_ZSTD:
+            if zstandard is None:
+                raise RuntimeError("zstandard is required to read zstd content")
+            return zstandard.ZstdDecompressor().decompress(body).decode("utf-8")
+        return self.raw.decode("utf-8")
+
+
+class CompressedTextDescriptor(DeferredAttribute):
+    """访问字段时解压并缓存结果"""
+
+    def __get__(self, instance, cls=None):
+        if instance is None:
+            return self
+        value = super().__get__(instance, cls)
+        if isinstance(value, CompressedValue):
+            value = value.decompress()
+            instance.__dict__[self.field.attname] = value
+        return value
+
+    def __set__(self, instance, value):
+        instance.__dict__[self.field.attname] = value
+
+
+class CompressedTextField(models.TextField):
+    """压缩文本字段"""
+
+    descriptor_class = CompressedTextDescriptor
+
+    def get_internal_type(self):
+        return "BinaryField"
+
+    def from_db_value(self, value, expression, connection):
+        if value is None or isinstance(value, str):
+            return value
+        return CompressedValue(bytes(value))
+
+    def to_python(self, value):
+        if isinstance(value, CompressedValue):
+            return value.decompress()
+        return super().to_python(value)
+
+    def pre_save(self, model_instance, add):
+        # 未访问过的字段直接写回原始数据，无需解压再压缩
+        return model_instance.__dict__.get(self.attname)
+
+    def get_prep_value(self, value):
+        if value is None:
+            return None
+        if isinstance(value, CompressedValue):
+            return value.raw
+        return compress_text(str(value))
+
+    def get_db_prep_value(self, value, connection, prepared=False):
+        if not prepared:
+            value = self.get_prep_value(value)
+        if value is not None:
+            return connection.Database.Binary(value)
+        return value
+
+
+def iter_rows(model, field_name: str, batch_size: int = 500):
+    """按主键分批遍历字段值"""
+    pk_name = model._meta.pk.attname
+    last_pk = None
+    while True:
+        queryset = model._default_manager.order_by(pk_name)
+        if last_pk is not None:
+            queryset = queryset.filter(**{f"{pk_name}__gt": last_pk})
+        rows = list(queryset.values_list(pk_name, field_name)[:batch_size])
+        if not rows:
+            return
+        last_pk = rows[-1][0]
+        yield from rows
+
+
+def compress_rows(model, field_name: str, batch_size: int = 500):
+    """分批压缩迁移前的数据"""
+    manager = model._default_manager
+    for pk, value in iter_rows(model, field_name, batch_size):
+        if isinstance(value, CompressedValue) and value.is_legacy:
+            value = value.decompress()
+        if isinstance(value, str):
+            manager.filter(pk=pk).update(**{field_name: value})
+
+
+def restore_rows(model, field_name: str, batch_size: int = 500):
+    """分批还原为 utf-8 文本，用于回滚迁移"""
+    manager = model._default_manager
+    for pk, value in iter_rows(model, field_name, batch_size):
+        if isinstance(value, CompressedValue) and not value.is_legacy:
+            raw = value.decompress().encode("utf-8")
+            manager.filter(pk=pk).update(
+                **{field_name: models.Value(raw, output_field=models.BinaryField())}
+            )
@@ -1,6 +1,6 @@
 from collections import OrderedDict
 
-from rest_framework.pagination import PageNumberPagination
+from rest_framework.pagination import PageNumberPagination, CursorPagination
 from rest_framework.response import Response
 
 
@@ -25,3 +25,23 @@ class NumPagination(PageNumberPagination):
 
 class RepoListNumPagination(NumPagination):
     page_size = 16
+
+
+class VersionCursorPagination(CursorPagination):
+    """版本历史游标分页，基于 (id, version_id) 索引"""
+
+    page_size = 20
+    page_size_query_param = "size"
+    max_page_size = 100
+    ordering = "-version_id"
+
+    def get_paginated_response(self, data):
+        return Response(
+            OrderedDict(
+                [
+                    ("next", self.get_next_link()),
+                    ("previous", self.get_previous_link()),
+                    ("results", data),
+                ]
+            )
+        )
@@ -0,0 +1,122 @@
+import threading
+import time
+
+from django.conf import settings
+from django.core import signing
+from django.core.cache import cache
+
+from utils.tools import uniq_id, get_redis_client
+
+
+class CacheAuthToken(object):
+    """随机 AUTH TOKEN，存储于 Redis"""
+
+    def issue(self, uid: str):
+        """签发"""
+        while True:
+            auth_token = f"{uniq_id()}{uid}"
+            if cache.add(auth_token, uid, settings.SESSION_COOKIE_AGE):
+                return auth_token
+
+    def cache_keys(self, auth_token: str):
+        """校验时需要从缓存读取的键"""
+        return [auth_token]
+
+    def verify(self, auth_token: str, cache_data: dict):
+        """校验，返回 uid"""
+        return cache_data.get(auth_token)
+
+    def revoke(self, auth_token: str, uid: str):
+        """注销单个 AUTH TOKEN"""
+        cache.delete(auth_token)
+
+    def revoke_user(self, uid: str):
+        """注销用户全部 AUTH TOKEN，随机 TOKEN 无法枚举，随 session 过期"""
+        pass
+
+
+class SignedAuthToken(object):
+    """
+    签名 AUTH TOKEN
+    1. TOKEN 内容为 uid 与会话代数，由 TimestampSigner 附加签发时间并进行 HMAC 签名
+    2. 校验在本地完成，不依赖 Redis
+    3. 注销时递增用户会话代数，校验时代数在进程内缓存 AUTH_TOKEN_GENERATION_CACHE_TIMEOUT 秒，
+       签发时直接读取 Redis，避免以注销前的代数签发；过期的缓存定期清理
+    """
+
+    salt = "utils.tokens.SignedAuthToken"
+
+    def __init__(self):
+        self.signer = signing.TimestampSigner(salt=self.salt)
+        self._generations = {}
+        self._pruned_at = time.time()
+        self._lock = threading.Lock()
+
+    def generation_key(self, uid: str):
+        return f"AuthTokenGeneration:{uid}"
+
+    def get_generation(self, uid: str):
+        """获取会话代数，优先使用进程内缓存"""
+        cached = self._generations.get(uid)
+        if cached is not None and cached[1] > time.time():
+            return cached[0]
+        return self.load_generation(uid)
+
+    def load_generation(self, uid: str):
+        """从 Redis 读取会话代数并更新进程内缓存"""
+        generation = int(get_redis_client().get(self.generation_key(uid)) or 0)
+        self.set_generation(uid, generation)
+        return generation
+
+    def set_generation(self, uid: str, generation: int):
+        now = time.time()
+        with self._lock:
+            # 每个缓存周期清理一次已过期的代数，缓存大小不超过周期内活跃的用户数
+            if now - self._pruned_at > settings.AUTH_TOKEN_GENERATION_CACHE_TIMEOUT:
+                self._generations = {
+                    key: cached
+                    for key, cached in self._generations.items()
+                    if cached[1] > now
+                }
+                self._pruned_at = now
+            self._generations[uid] = (
+                generation,
+                now + settings.AUTH_TOKEN_GENERATION_CACHE_TIMEOUT,
+            )
+
+    def issue(self, uid: str):
+        return self.signer.sign(f"{uid}.{self.load_generation(uid)}")
+
+    def cache_keys(self, auth_token: str):
+        return []
+
+    def verify(self, auth_token: str, cache_data: dict):
+        try:
+            value = self.signer.unsign(auth_token, max_age=settings.SESSION_COOKIE_AGE)
+        except signing.BadSignature:
+            return None
+        uid, _, generation = value.rpartition(".")
+        if generation != str(self.get_generation(uid)):
+            return None
+        return uid
+
+    def revoke(self, auth_token: str, uid: str):
+        self.revoke_user(uid)
+
+    def revoke_user(self, uid: str):
+        generation = get_redis_client().incr(self.generation_key(uid))
+        self.set_generation(uid, generation)
+
+
+AUTH_TOKEN_HANDLERS = {
+    "cache": CacheAuthToken(),
+    "signed": SignedAuthToken(),
+}
+
+
+def get_auth_token_handler():
+    return AUTH_TOKEN_HANDLERS[settings.AUTH_TOKEN_MODE]
+
+
+def get_auth_token(uid: str):
+    return get_auth_token_handler().issue(uid)
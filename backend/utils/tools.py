@@ -5,8 +5,10 @@ import time
 import uuid
 from itertools import chain
 
+import redis
 from django.conf import settings
-from django.core.cache import cache
+
+_redis_pool = None
 
 
 def uniq_id():
@@ -14,15 +16,6 @@ def uniq_id():
     return "%s%s" % (str(int(time.time() * 1000)), str(uniq))
 
 
-def get_auth_token(uid: str):
-    uniq = f"{uniq_id()}{uid}"
-    in_use = cache.get(uniq)
-    if in_use is None:
-        cache.set(uniq, uid, settings.SESSION_COOKIE_AGE)
-        return uniq
-    return get_auth_token(uid)
-
-
 def simple_uniq_id(length: int):
     base = "ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz1234567890"
     random.seed(uniq_id())
@@ -76,3 +69,16 @@ def getenv_or_raise(key: str):
     if val is None:
         raise Exception(f"Env Not Set, Key [{key}]")
     return val
+
+
+def get_redis_client():
+    """获取原生 Redis 客户端，用于发布订阅、有序集合等缓存接口未覆盖的场景"""
+    global _redis_pool
+    if _redis_pool is None:
+        _redis_pool = redis.ConnectionPool(
+            host=settings.REDIS_HOST,
+            port=settings.REDIS_PORT,
+            password=settings.REDIS_PASSWORD or None,
+            db=settings.REDIS_DB,
+        )
+    return redis.Redis(connection_pool=_redis_pool)